@@ -5,3 +5,23 @@ from .diff_viewer import *
 from .html_builder import *
 from .testccase_executor import *
 from .testcase_logger import *
+from .command_handler import *
+from .scheduler import *
+from .benchmark import *
+from .worker_context import *
+from .testcase_worker import *
+from .output_stream import *
+from .file_hasher import *
+from .blob_store import *
+from .compression import *
+from .discovery import *
+from .shard_merge import *
+from .distributed import *
+from .daemon import *
+from .session import *
+from .sweep import *
+from .async_executor import *
+from .auto_executor import *
+from .pool_config import *
+from .ab_compare import *
+from .pipeline import *
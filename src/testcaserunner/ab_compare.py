@@ -0,0 +1,185 @@
+import os
+import shutil
+import dataclasses
+from pathlib import Path
+from typing import Any, Callable, Optional
+
+from .runner_defines import TestCase, TestCaseResult, NoTestcaseFileException, InvalidPathException
+from .logger import RunnerLogger
+from .testcase_logger import RunnerLog, RunnerLogManager
+from .html_builder import make_html
+from .diff_viewer import DiffHtmlBuilder, DiffDirector
+from .discovery import TestcaseDiscovery, link_inputs
+from .shard_merge import load_shard, merge_contents
+from .result_cache import handler_identity
+from .runner import run, get_log_file_path
+
+logger = RunnerLogger("AbCompare")
+# 結合したログのうち、バリアントごとに分けるフォルダ
+_split_entries = (RunnerLogManager.infile_col, RunnerLogManager.stdout_col, RunnerLogManager.stderr_col)
+# 結合したログのうち、分けたログから作り直すもの
+_generated_entries = ("result.json", "result.html", "fig")
+
+class VariantHandler:
+    """テストケースの相対パスの先頭のフォルダ名で、実行するハンドラを選ぶ
+
+    ハンドラには先頭のフォルダ名を取り除いたtestcase_nameを渡す
+    """
+    def __init__(self, testcase_handlers: dict[str, Callable[..., Any]]) -> None:
+        self.testcase_handlers = testcase_handlers
+
+    def __call__(self, testcase: TestCase, *args: Any) -> Any:
+        variant, _, name = testcase.testcase_name.partition("/")
+        return self.testcase_handlers[variant](dataclasses.replace(testcase, testcase_name=name), *args)
+
+    def __repr__(self) -> str:
+        # キャッシュのキーに使われるので、ハンドラが同じなら同じ文字列にする
+        names = [f"{variant}={self.describe_handler(handler)}" for variant, handler in self.testcase_handlers.items()]
+        return f"VariantHandler({', '.join(names)})"
+
+    @staticmethod
+    def describe_handler(handler: Callable[..., Any]) -> str:
+        """ハンドラを識別する文字列. 識別できないハンドラでも例外にはしない
+
+        型の名前にはアドレスも付けるので、キャッシュは別の実行と共有されない
+        """
+        try:
+            return handler_identity(handler)
+        except Exception: # 引数のreprが例外を出す場合もある
+            return f"{type(handler).__qualname__}@{id(handler):x}"
+
+def strip_variant(path: str) -> str:
+    """"stdout/A/01.txt"のようなログフォルダからの相対パスから、バリアントのフォルダを取り除く"""
+    parts = Path(path).parts
+    return str(Path(parts[0], *parts[2:]))
+
+def select_variant(contents: dict, metadata: dict, variant: str) -> dict:
+    """結合したログからバリアントのテストケースだけを取り出し、merge_contentsに渡せる形にする"""
+    rows = [row for row, path in contents[RunnerLogManager.infile_col].items() if Path(path).parts[1] == variant]
+    selected: dict[str, dict[str, Any]] = {}
+    for column, values in contents.items():
+        selected[column] = {row: values.get(row) for row in rows}
+        if column in _split_entries:
+            selected[column] = {row: strip_variant(value) for row, value in selected[column].items()}
+        elif column == RunnerLogManager.infilename_col:
+            selected[column] = {row: value.partition("/")[2] for row, value in selected[column].items()}
+    # 他のバリアントだけが返した値の列は含めない
+    attributes = [attribute for attribute in metadata["attributes"]
+                  if any(value is not None for value in selected.get(attribute, {}).values())]
+    for attribute in metadata["attributes"]:
+        if attribute not in attributes:
+            selected.pop(attribute, None)
+    return {"contents": selected, "metadata": {"attributes": attributes}}
+
+def split_contents(contents: dict, metadata: dict, variant: str) -> tuple[dict, list[str]]:
+    """結合したログからバリアントのテストケースだけを取り出し、1回の実行と同じ形に直す"""
+    return merge_contents([select_variant(contents, metadata, variant)])
+
+def move_tree(src: str, dst: str) -> None:
+    """フォルダを移動する. 移動先が既にあれば、中身のファイルを1つずつ移動する"""
+    if not os.path.exists(dst):
+        os.rename(src, dst)
+    else:
+        shutil.copytree(src, dst, copy_function=os.rename, dirs_exist_ok=True)
+
+def split_log(combined_dirs: list[str], variant: str, output_dir: str, debug: bool) -> RunnerLog:
+    """結合したログフォルダから、バリアントのテストケースだけを集めたログフォルダを作る
+
+    複数の結合したログフォルダを渡すと、それぞれのバリアントのテストケースを1つのログフォルダにまとめる
+    """
+    shards = [load_shard(combined_dir) for combined_dir in combined_dirs]
+    os.makedirs(output_dir)
+    for combined_dir in combined_dirs:
+        for entry in os.scandir(combined_dir):
+            if entry.name in _generated_entries:
+                continue
+            dst = os.path.join(output_dir, entry.name)
+            if entry.name in _split_entries:
+                src = os.path.join(entry.path, variant)
+                if os.path.isdir(src):
+                    move_tree(src, dst)
+            elif entry.is_file() and not os.path.exists(dst):
+                shutil.copy2(entry.path, dst) # copy_target_files
+    contents, attributes = merge_contents([select_variant(shard["contents"], shard["metadata"], variant) for shard in shards])
+    metadata: dict[str, Any] = {**shards[0]["metadata"], "attributes": attributes, "variant": variant}
+    log_manager = RunnerLogManager([], output_dir, debug, metadata["hash_algorithm"], None, metadata.get("log_compression"))
+    log_manager.save_json_file(contents, metadata)
+    log_manager.make_figure()
+    make_html(os.path.join(output_dir, "result.html"), log_manager.get_log(), debug)
+    return log_manager.get_log()
+
+def make_compare_log(log: RunnerLog, ab_dir: str, variant: str) -> RunnerLog:
+    """比較結果のHTMLから入出力ファイルとバリアントのログを開けるように、パスを直す"""
+    contents = log.df.to_dict()
+    for column in _split_entries:
+        contents[column] = {row: f"{variant}/{path}" for row, path in contents[column].items()}
+    # DiffHtmlBuilderはlogフォルダの下にあるログへのリンクを作る
+    return RunnerLog(contents, log.metadata, os.path.join(os.path.basename(ab_dir), variant))
+
+def run_ab(
+        testcase_handlers: dict[str, Callable[..., TestCaseResult]],
+        input_file_path: str,
+        include_patterns: Optional[list[str]] = None,
+        exclude_patterns: Optional[list[str]] = None,
+        recursive: bool = False,
+        _debug: bool = False,
+        **options: Any,
+        ) -> str:
+    """複数のハンドラで同じ入力ファイルを1つのプールで交互に実行し、ハンドラごとのログと比較結果を作る
+
+    入力ファイルごとに、ハンドラを実行する順番をランダムにして続けて投入するので、
+    マシンの負荷の変化が特定のハンドラに偏らない
+
+    Args:
+        testcase_handlers (dict[str, Callable[..., TestCaseResult]]): バリアントの名前と並列実行する関数の辞書
+        input_file_path (str): 入力ファイル群が置いてあるディレクトリへのパス
+        include_patterns (Optional[list[str]], optional): 対象にする入力ファイルのパターンのリスト. Defaults to None.
+        exclude_patterns (Optional[list[str]], optional): 対象から外す入力ファイルのパターンのリスト. Defaults to None.
+        recursive (bool, optional): 入力ファイルをサブディレクトリからも探すかどうか. Defaults to False.
+        **options: runに渡すその他の引数
+
+    Returns:
+        str: バリアントごとのログフォルダと比較結果を置いたフォルダのパス
+    """
+    if _debug:
+        logger.enable_debug_mode()
+    if len(testcase_handlers) < 2:
+        raise ValueError("testcase_handlersには2つ以上のハンドラを指定してください。")
+    for variant in testcase_handlers:
+        if not variant or variant.startswith(".") or variant != os.path.basename(variant) or variant in _generated_entries:
+            raise ValueError(f"バリアントの名前{variant!r}はフォルダ名に使えません。")
+    for name in ("scheduling_method", "shard_index", "shard_count", "sharding_method"):
+        if name in options:
+            raise ValueError(f"run_abでは引数{name}は指定できません。")
+    if not os.path.isdir(input_file_path):
+        raise InvalidPathException(f"テストケースファイルへのパス{input_file_path}は無効なパスです。")
+    discovery = TestcaseDiscovery(input_file_path, list(include_patterns or []), list(exclude_patterns or []), recursive)
+    relative_paths = list(discovery.iter_relative_paths())
+    if not relative_paths:
+        raise NoTestcaseFileException(f"{input_file_path}ディレクトリにファイルが1つもありません。")
+
+    ab_dir = get_log_file_path("AB")
+    inputs_dir = os.path.join(ab_dir, ".inputs")
+    os.makedirs(ab_dir)
+    # バリアントごとのフォルダに同じ入力ファイルを置き、1回の実行にまとめる
+    for variant in testcase_handlers:
+        link_inputs(input_file_path, relative_paths, os.path.join(inputs_dir, variant))
+    try:
+        combined_dir = run(VariantHandler(testcase_handlers), inputs_dir, recursive=True, scheduling_method="interleaved",
+                           _debug=_debug, **options)
+    finally:
+        shutil.rmtree(inputs_dir)
+
+    logs: list[RunnerLog] = []
+    for variant in testcase_handlers:
+        log = split_log([combined_dir], variant, os.path.join(ab_dir, variant), _debug)
+        logs.append(make_compare_log(log, ab_dir, variant))
+    shutil.rmtree(combined_dir)
+
+    builder = DiffHtmlBuilder(os.path.join(ab_dir, "result.html"), logs, _debug)
+    DiffDirector(builder).construct()
+    return ab_dir
+
+__all__ = [
+    "run_ab",
+]
@@ -0,0 +1,144 @@
+import os
+import shlex
+import signal
+import asyncio
+from typing import Any, Callable, Iterable, Iterator, Optional, Self, Union
+
+from tqdm import tqdm
+
+from .runner_defines import TestCase, TestCaseResult, ResultStatus
+from .worker_context import WorkerLifecycle
+from .testccase_executor import TestcaseExecutor, PoolTestcaseExecutor
+from .process_control import new_process_group_options, kill_process_group, limit_memory_command, is_memory_error_output
+
+class AsyncTestcaseExecutor(TestcaseExecutor):
+    """1つのイベントループでasync defのハンドラを同時に実行するExecutor
+
+    スレッドやプロセスのプールは使わず、同時に実行するテストケースの数だけをセマフォで制限する
+    外部のソルバーの終了を待つだけのハンドラ向け
+    """
+    def __init__(self, total: int, lifecycle: Optional[WorkerLifecycle] = None, concurrency: Optional[int] = None):
+        super().__init__(total, lifecycle)
+        self._total = total
+        self._status = self.NOT_START
+        if concurrency is None:
+            concurrency = max((os.cpu_count() or 1) * PoolTestcaseExecutor.WINDOW_FACTOR, PoolTestcaseExecutor.MIN_WINDOW)
+        self._concurrency = concurrency
+
+    def submit(self, testcase_handler: Callable[[TestCase], Any], test_cases: Iterable[TestCase]) -> None:
+        if self._status != self.STARTED:
+            raise ValueError("使い方間違ってるよ")
+        self._handler = testcase_handler
+        self._pending: Iterator[TestCase] = iter(test_cases)
+        self._status = self.SUBMITTED
+
+    def wait_and_get_results(self) -> list[Optional[TestCaseResult]]:
+        if self._status != self.SUBMITTED:
+            raise ValueError("使い方間違ってるよ")
+        results: list[Optional[TestCaseResult]] = []
+        asyncio.run(self.run_all(results))
+        # キャンセルされた場合、まだ投入していないテストケースの結果はNoneにする
+        results.extend(None for _ in self._pending)
+        self._status = self.STARTED # 続けて投入できるようにする
+        return results
+
+    async def run_all(self, results: list[Optional[TestCaseResult]]) -> None:
+        loop = asyncio.get_running_loop()
+        semaphore = asyncio.Semaphore(self._concurrency)
+        tasks: set[asyncio.Task] = set()
+
+        def interrupt() -> None:
+            self._interrupted = True
+            self.notify_catch_keyboard_interrupt()
+            # 実行中のハンドラもキャンセルする. 結果はNoneのままになる
+            for task in list(tasks):
+                task.cancel()
+
+        try:
+            loop.add_signal_handler(signal.SIGINT, interrupt)
+            has_signal_handler = True
+        except (NotImplementedError, RuntimeError, ValueError):
+            has_signal_handler = False # Windowsやメインスレッド以外では登録できない
+        try:
+            while True:
+                # 空きができてから次のテストケースを取り出すので、テストケースが多くてもメモリを使わない
+                await semaphore.acquire()
+                testcase = None if self._interrupted else next(self._pending, None)
+                if testcase is None:
+                    semaphore.release()
+                    break
+                self.count_submitted(1)
+                results.append(None)
+                task = loop.create_task(self.run_one(semaphore, testcase, len(results) - 1, results))
+                tasks.add(task)
+                task.add_done_callback(tasks.discard)
+            if tasks:
+                await asyncio.gather(*tasks, return_exceptions=True)
+        finally:
+            if has_signal_handler:
+                loop.remove_signal_handler(signal.SIGINT)
+
+    async def run_one(self, semaphore: asyncio.Semaphore, testcase: TestCase, index: int,
+                      results: list[Optional[TestCaseResult]]) -> None:
+        try:
+            result = await self._handler(testcase)
+        finally:
+            semaphore.release()
+        results[index] = result
+        self._progress.update()
+        self.notify_result(testcase, result)
+
+    def __enter__(self) -> Self:
+        self._status = self.STARTED
+        self._progress = tqdm(total=self._total)
+        self._lifecycle.initialize()
+        return self
+
+    def __exit__(self, exc_type: Optional[type[BaseException]], exc_val: Optional[BaseException],
+                 exc_tb: Optional[BaseException]) -> None:
+        self._progress.close()
+        self._lifecycle.finalize()
+
+async def run_subprocess_async(cmd: Union[str, list[str]], testcase: TestCase,
+                               memory_limit: Optional[int] = None, **kwargs: Any) -> TestCaseResult:
+    """入力ファイルを標準入力につないでコマンドを実行し、終了を待つ
+
+    async defのハンドラから呼ぶ. 出力は文字列としてTestCaseResultに入れる
+    終了コードが0以外ならREにする. memory_limitを指定していて、メモリ確保に失敗して終了した場合はMLEにする
+    キャンセルされた場合はプロセスグループごと終了させる
+
+    Args:
+        cmd (Union[str, list[str]]): 実行するコマンド. 文字列の場合はshlexで分割する
+        testcase (TestCase): 実行するテストケース
+        memory_limit (Optional[int], optional): プロセスのアドレス空間の上限(MiB). Defaults to None.
+        **kwargs: asyncio.create_subprocess_execに渡すその他の引数
+
+    Returns:
+        TestCaseResult: 実行結果
+    """
+    if isinstance(cmd, str):
+        cmd = shlex.split(cmd, posix=(os.name == "posix"))
+    options: dict[str, Any] = {**new_process_group_options(), **kwargs}
+    with open(testcase.input_file_path, mode="rb") as stdin:
+        # 出力の書き込みなどのスレッドと同時に動くので、preexec_fnは使わずに起動するコマンドで制限をかける
+        proc = await asyncio.create_subprocess_exec(
+            *limit_memory_command(cmd, memory_limit), stdin=stdin, stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.PIPE, **options)
+    try:
+        stdout, stderr = await proc.communicate()
+    except asyncio.CancelledError:
+        kill_process_group(proc)
+        await proc.wait()
+        raise
+    if proc.returncode == 0:
+        status = ResultStatus.AC
+    elif memory_limit is not None and is_memory_error_output(stderr):
+        status = ResultStatus.MLE
+    else:
+        status = ResultStatus.RE
+    return TestCaseResult(status, stdout.decode(errors="replace"), stderr.decode(errors="replace"))
+
+__all__ = [
+    "AsyncTestcaseExecutor",
+    "run_subprocess_async",
+]
@@ -0,0 +1,217 @@
+import os
+import time
+from concurrent.futures import Executor, ProcessPoolExecutor
+from dataclasses import dataclass
+from typing import Any, Callable, Iterable, Iterator, Optional, Self
+
+from tqdm import tqdm
+
+from .runner_defines import TestCase, TestCaseResult
+from .logger import RunnerLogger
+from .worker_context import WorkerLifecycle
+from .testcase_worker import TestcaseWorker, run_installed_testcase
+from .testccase_executor import TestcaseExecutor, PoolTestcaseExecutor, ProcessTestcaseExecutor, ThreadTestcaseExecutor, \
+    SingleTestcaseExecutor
+from .process_control import get_cpu_times
+
+@dataclass
+class ExecutorDecision:
+    """parallel_processing_methodが'auto'のときに選んだ実行方法と、その根拠になった計測値"""
+    method: str                        # 'process', 'thread', 'single'のいずれか
+    max_workers: int
+    calibration_cases: int             # 計測に使ったテストケースの数
+    handler_time: float                # 1ケースあたりの平均実行時間(秒)
+    cpu_ratio: float                   # 実行時間のうち、ワーカープロセスがCPUを使っていた割合
+    child_cpu_ratio: float             # 実行時間のうち、子プロセスがCPUを使っていた割合
+    dispatch_overhead: Optional[float] # プロセスプールに1ケース送って結果を受け取るまでの時間(秒). 計測していなければNone
+
+    def metadata(self) -> dict[str, Any]:
+        """result.jsonのメタデータに記録する内容"""
+        return {
+            "method": self.method,
+            "max_workers": self.max_workers,
+            "calibration": {
+                "cases": self.calibration_cases,
+                "handler_time": self.handler_time,
+                "cpu_ratio": self.cpu_ratio,
+                "child_cpu_ratio": self.child_cpu_ratio,
+                "dispatch_overhead": self.dispatch_overhead,
+            },
+        }
+
+def echo_testcase(testcase: TestCase) -> TestCase:
+    return testcase
+
+def measure_dispatch_overhead(pool: Executor, testcase: TestCase, repeat: int = 8) -> float:
+    """起動済みのプロセスプールでテストケースを往復させ、1回あたりの時間を計る"""
+    start = time.perf_counter()
+    for _ in range(repeat):
+        pool.submit(echo_testcase, testcase).result()
+    return (time.perf_counter() - start) / repeat
+
+def run_calibration_testcase(testcase: TestCase) -> tuple[TestCaseResult, float, float, float]:
+    """計測用のワーカープロセスでテストケースを実行し、結果と実行時間、ワーカーと子プロセスのCPU時間を返す"""
+    cpu_start, child_cpu_start = get_cpu_times()
+    wall_start = time.perf_counter()
+    result = run_installed_testcase(testcase)
+    wall_time = time.perf_counter() - wall_start
+    cpu_end, child_cpu_end = get_cpu_times()
+    return result, wall_time, cpu_end - cpu_start, child_cpu_end - child_cpu_start
+
+class AutoTestcaseExecutor(TestcaseExecutor):
+    """最初の数ケースを1つのワーカープロセスで1つずつ実行して計測し、残りのテストケースを実行する方法を選ぶExecutor
+
+    計測に使ったケースの結果もそのまま使う. 選んだ方法はdecisionに入る
+    呼び出し元のプロセスで計測すると、time_limitのSIGALRMが呼び出し元で使われ、
+    進捗バーやログの処理もCPU時間に含まれるので、計測はワーカープロセスで行う
+    """
+    logger = RunnerLogger("AutoTestcaseExecutor")
+    MAX_CALIBRATION_CASES = 4
+    CALIBRATION_SECONDS = 1.0 # 1ケース目の後は、この時間を過ぎたら計測をやめる
+    CPU_BOUND_RATIO = 0.5     # ワーカーのCPU使用率がこれ以上なら、GILがあるのでスレッドでは並列化できないとみなす
+    MIN_OVERHEAD_RATIO = 10.0 # 実行時間が投入のオーバーヘッドのこの倍数より短ければ、プロセス並列にしない
+
+    def __init__(self, total: int, lifecycle: Optional[WorkerLifecycle], worker: TestcaseWorker):
+        super().__init__(total, lifecycle)
+        self._total = total
+        self._status = self.NOT_START
+        self._worker = worker
+        self._calibration_pool: Optional[ProcessPoolExecutor] = None
+        self._inner: Optional[TestcaseExecutor] = None
+        self._cases = 0
+        self._wall_time = 0.0
+        self._cpu_time = 0.0
+        self._child_cpu_time = 0.0
+        self.decision: Optional[ExecutorDecision] = None
+
+    def submit(self, testcase_handler: Callable[[TestCase], TestCaseResult], test_cases: Iterable[TestCase]) -> None:
+        if self._status != self.STARTED:
+            raise ValueError("使い方間違ってるよ")
+        self._handler = testcase_handler
+        self._pending: Iterator[TestCase] = iter(test_cases)
+        self._status = self.SUBMITTED
+
+    def is_calibrating(self, start: float) -> bool:
+        if self._cases >= self.MAX_CALIBRATION_CASES:
+            return False
+        return self._cases == 0 or time.perf_counter() - start < self.CALIBRATION_SECONDS
+
+    def calibrate(self, results: list[Optional[TestCaseResult]]) -> Optional[TestCase]:
+        """計測用のワーカープロセスで1つずつ実行する. 計測が終わったら止め、最後に実行したテストケースを返す"""
+        # ワーカープロセスには起動時にTestcaseWorkerが登録される
+        self._calibration_pool = ProcessPoolExecutor(max_workers=1, initializer=self._lifecycle.initialize_process)
+        start = time.perf_counter()
+        last: Optional[TestCase] = None
+        try:
+            while self.is_calibrating(start):
+                testcase = next(self._pending, None)
+                if testcase is None:
+                    break
+                self.count_submitted(1)
+                results.append(None)
+                result, wall_time, cpu_time, child_cpu_time = \
+                    self._calibration_pool.submit(run_calibration_testcase, testcase).result()
+                self._wall_time += wall_time
+                self._cpu_time += cpu_time
+                self._child_cpu_time += child_cpu_time
+                self._cases += 1
+                results[-1] = result
+                self._progress.update()
+                self.notify_result(testcase, result)
+                last = testcase
+        except KeyboardInterrupt:
+            self._interrupted = True
+            self.notify_catch_keyboard_interrupt()
+        return last
+
+    def shutdown_calibration_pool(self) -> None:
+        if self._calibration_pool is not None:
+            self._calibration_pool.shutdown(cancel_futures=True)
+            self._calibration_pool = None
+
+    def decide(self, testcase: Optional[TestCase]) -> ExecutorDecision:
+        cpu_count = os.cpu_count() or 1
+        handler_time = self._wall_time / self._cases if self._cases > 0 else 0.0
+        cpu_ratio = self._cpu_time / self._wall_time if self._wall_time > 0 else 0.0
+        child_cpu_ratio = self._child_cpu_time / self._wall_time if self._wall_time > 0 else 0.0
+        dispatch_overhead: Optional[float] = None
+        if testcase is None or self._submitted >= self._total:
+            method, max_workers = "single", 1 # 残りのテストケースがない
+        elif cpu_ratio >= self.CPU_BOUND_RATIO:
+            if cpu_count > 1 and self._calibration_pool is not None:
+                dispatch_overhead = measure_dispatch_overhead(self._calibration_pool, testcase)
+            if dispatch_overhead is None or handler_time < dispatch_overhead * self.MIN_OVERHEAD_RATIO:
+                method, max_workers = "single", 1
+            else:
+                method, max_workers = "process", cpu_count
+        else:
+            # 待ち時間が長いほどスレッドを増やす. 子プロセスがCPUを使い切る場合はCPU数にする
+            busy_ratio = max(cpu_ratio + child_cpu_ratio, 1 / PoolTestcaseExecutor.WINDOW_FACTOR)
+            # スレッドではtime_limitを守らせられず、MLEも判定できないので、同じワーカー数のプロセス並列にする
+            method = "thread" if self._worker.time_limit is None and self._worker.memory_limit is None else "process"
+            max_workers = max(cpu_count, round(cpu_count / busy_ratio))
+        return ExecutorDecision(method, max_workers, self._cases, handler_time, cpu_ratio, child_cpu_ratio, dispatch_overhead)
+
+    def delegate(self) -> list[Optional[TestCaseResult]]:
+        """残りのテストケースを選んだExecutorで実行する"""
+        assert self.decision is not None
+        if self._inner is None:
+            self._progress.close()
+            total = max(self._total - self._submitted, 0)
+            if self.decision.method == "process":
+                self._inner = ProcessTestcaseExecutor(total, self._lifecycle, self.decision.max_workers)
+            elif self.decision.method == "thread":
+                self._inner = ThreadTestcaseExecutor(total, self._lifecycle, self.decision.max_workers)
+            else:
+                self._inner = SingleTestcaseExecutor(total, self._lifecycle)
+            for listener in self._result_listeners:
+                self._inner.add_result_listener(listener)
+            for interrupt_listener in self._interrupt_listeners:
+                self._inner.add_interrupt_listener(interrupt_listener)
+            self._inner.__enter__()
+        # ワーカープロセスには起動時にTestcaseWorkerが登録される
+        task = run_installed_testcase if self.decision.method == "process" else self._handler
+        self._inner.submit(task, self._pending)
+        results = self._inner.wait_and_get_results()
+        self._interrupted = self._inner.interrupted
+        return results
+
+    def wait_and_get_results(self) -> list[Optional[TestCaseResult]]:
+        if self._status != self.SUBMITTED:
+            raise ValueError("使い方間違ってるよ")
+        results: list[Optional[TestCaseResult]] = []
+        if self.decision is None:
+            try:
+                last = self.calibrate(results)
+                if not self._interrupted:
+                    self.decision = self.decide(last)
+            finally:
+                self.shutdown_calibration_pool()
+            if self.decision is not None:
+                # 資源使用量を計測できるのは1つのプロセスで1ケースずつ実行する場合だけ
+                self._worker.exclusive_process = self.decision.method in ("process", "single")
+                self.logger.info(f"parallel_processing_methodに'{self.decision.method}'(ワーカー数{self.decision.max_workers})を選びました。")
+        if not self._interrupted and self.decision is not None:
+            results.extend(self.delegate())
+        # キャンセルされた場合、まだ投入していないテストケースの結果はNoneにする
+        results.extend(None for _ in self._pending)
+        self._status = self.STARTED # 続けて投入できるようにする
+        return results
+
+    def __enter__(self) -> Self:
+        self._status = self.STARTED
+        self._progress = tqdm(total=self._total)
+        return self
+
+    def __exit__(self, exc_type: Optional[type[BaseException]], exc_val: Optional[BaseException],
+                 exc_tb: Optional[BaseException]) -> None:
+        self.shutdown_calibration_pool()
+        if self._inner is not None:
+            self._inner.__exit__(exc_type, exc_val, exc_tb)
+        else:
+            self._progress.close()
+
+__all__ = [
+    "AutoTestcaseExecutor",
+    "ExecutorDecision",
+]
@@ -0,0 +1,115 @@
+import math
+import statistics
+from collections import defaultdict
+from dataclasses import dataclass, field
+from typing import Optional
+
+from .runner_defines import TestCase, TestCaseResult, ResultStatus
+
+# 95%信頼区間のt分布の値(自由度1から30まで). それより大きい自由度では正規分布の値を使う
+T_VALUES_95 = [
+    12.706, 4.303, 3.182, 2.776, 2.571, 2.447, 2.365, 2.306, 2.262, 2.228,
+    2.201, 2.179, 2.160, 2.145, 2.131, 2.120, 2.110, 2.101, 2.093, 2.086,
+    2.080, 2.074, 2.069, 2.064, 2.060, 2.056, 2.052, 2.048, 2.045, 2.042,
+]
+Z_VALUE_95 = 1.96
+
+@dataclass
+class BenchmarkConfig:
+    """計測値が収束するまでテストケースを繰り返し実行する設定"""
+    target_ci: float = 0.02                # 95%信頼区間の半幅の平均に対する比の目標
+    min_runs: int = 3                      # 1ケースあたりの最小計測回数
+    max_runs: int = 30                     # 1ケースあたりの最大計測回数
+    time_budget: Optional[float] = None    # 1ケースあたりの実行時間の合計の上限(秒)
+    warmup_count: int = 0                  # 計測前に実行して捨てる回数
+    attributes: list[str] \
+        = field(default_factory=lambda: ["time"]) # 収束を判定する値
+
+    def validate(self) -> None:
+        if self.target_ci <= 0:
+            raise ValueError("target_ciの値は正の数である必要があります。")
+        if self.min_runs < 2 or self.max_runs < self.min_runs:
+            raise ValueError("min_runsは2以上、max_runsはmin_runs以上である必要があります。")
+        if self.warmup_count < 0:
+            raise ValueError("warmup_countの値は0以上である必要があります。")
+        if self.time_budget is not None and self.time_budget <= 0:
+            raise ValueError("time_budgetの値は正の数である必要があります。")
+
+def confidence_interval(values: list[float]) -> float:
+    """平均の95%信頼区間の半幅を返す"""
+    if len(values) < 2:
+        return math.inf
+    df = len(values) - 1
+    t_value = T_VALUES_95[df - 1] if df <= len(T_VALUES_95) else Z_VALUE_95
+    return t_value * statistics.stdev(values) / math.sqrt(len(values))
+
+class BenchmarkController:
+    """テストケースごとの計測結果を集め、次に実行するテストケースを決める"""
+    def __init__(self, config: BenchmarkConfig, test_cases: list[TestCase]) -> None:
+        self.config = config
+        self.test_cases = test_cases
+        self.runs: defaultdict[int, int] = defaultdict(int)
+        self.spent: defaultdict[int, float] = defaultdict(float)
+        self.results: defaultdict[int, list[TestCaseResult]] = defaultdict(list)
+        self.finished: set[int] = set()
+
+    def add_result(self, testcase: TestCase, result: TestCaseResult) -> None:
+        index = testcase.testcase_index
+        self.runs[index] += 1
+        self.spent[index] += result.attribute.get("time", 0.0)
+        if self.runs[index] <= self.config.warmup_count:
+            return # ウォームアップの結果は捨てる
+        self.results[index].append(result)
+        if result.error_status != ResultStatus.AC:
+            self.finished.add(index) # 失敗したケースは繰り返しても意味がない
+        elif self.is_converged(index):
+            self.finished.add(index)
+
+    def is_converged(self, index: int) -> bool:
+        results = self.results[index]
+        if len(results) >= self.config.max_runs:
+            return True
+        if self.config.time_budget is not None and self.spent[index] >= self.config.time_budget:
+            return True
+        if len(results) < self.config.min_runs:
+            return False
+        for attribute in self.config.attributes:
+            values = [result.attribute[attribute] for result in results if attribute in result.attribute]
+            if len(values) < 2:
+                continue
+            if confidence_interval(values) > self.config.target_ci * abs(statistics.mean(values)):
+                return False
+        return True
+
+    def next_round(self) -> list[TestCase]:
+        """まだ収束していないテストケースを返す"""
+        return [testcase for testcase in self.test_cases if testcase.testcase_index not in self.finished]
+
+    def summarize(self, testcase: TestCase) -> TestCaseResult:
+        """テストケースの計測結果を1つのTestCaseResultにまとめる"""
+        results = self.results[testcase.testcase_index]
+        if not results:
+            return TestCaseResult(ResultStatus.CAN)
+        status = ResultStatus.AC
+        for result in results:
+            if result.error_status != ResultStatus.AC:
+                status = result.error_status
+                break
+
+        values: defaultdict[str, list[float]] = defaultdict(list)
+        for result in results:
+            for key, value in result.attribute.items():
+                values[key].append(value)
+
+        attribute: dict[str, int | float] = {"runs": len(results)}
+        for key, samples in values.items():
+            if key not in self.config.attributes:
+                attribute[key] = statistics.mean(samples)
+                continue
+            attribute[f"{key}_mean"] = statistics.mean(samples)
+            attribute[f"{key}_median"] = statistics.median(samples)
+            attribute[f"{key}_stddev"] = statistics.stdev(samples) if len(samples) >= 2 else 0.0
+            attribute[f"{key}_ci"] = confidence_interval(samples) if len(samples) >= 2 else 0.0
+        # ログフォルダに残っている出力は最後に実行したときのもの
+        return TestCaseResult(status, attribute=attribute,
+                              stdout_info=results[-1].stdout_info, stderr_info=results[-1].stderr_info)
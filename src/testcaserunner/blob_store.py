@@ -0,0 +1,207 @@
+import os
+import json
+import shutil
+import tempfile
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Iterator, Optional
+
+from .logger import RunnerLogger
+from .file_hasher import DEFAULT_HASH_ALGORITHM, calculate_file_hash
+
+try:
+    import fcntl
+except ImportError: # Windowsにはfcntlモジュールがない
+    fcntl = None # type: ignore[assignment]
+
+LOCK_FILE = ".lock"
+
+@contextmanager
+def lock_blob_root(root: str, exclusive: bool = False) -> Iterator[None]:
+    """blobを置く場所のロックを取る
+
+    blobを作ってからハードリンクを張るまでの間はリンク数が1なので、gcに消されないように
+    書き込む側は共有ロックを、gcは排他ロックを取る. fcntlが使えない環境では何もしない
+    """
+    if fcntl is None:
+        yield
+        return
+    os.makedirs(root, exist_ok=True)
+    with open(os.path.join(root, LOCK_FILE), mode="a") as f:
+        fcntl.flock(f.fileno(), fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH)
+        try:
+            yield
+        finally:
+            fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+
+class BlobStore:
+    """ハッシュ値をキーにしてファイルの中身を1つだけ保存する場所
+
+    ログフォルダのファイルは保存したファイル(blob)へのハードリンクにするので、
+    result.jsonやHTMLからのリンクはそのまま使える
+    どのログフォルダからも参照されていないblobはハードリンクの数が1になるので、gcで消す
+    """
+    logger = RunnerLogger("BlobStore")
+    index_file = "index.json"
+
+    def __init__(self, root: str, algorithm: str = DEFAULT_HASH_ALGORITHM, debug: bool = False) -> None:
+        if debug:
+            self.logger.enable_debug_mode()
+        self.root = root
+        self.algorithm = algorithm
+        self.digests: dict[str, str] = {} # このインスタンスで保存したファイルのパスとハッシュ値
+        self._link_supported = True
+        self._lock_depth = 0 # lockの入れ子の深さ. 一番外側だけでロックを取る
+        os.makedirs(self.blob_dir, exist_ok=True)
+        self._index = self.load_index()
+
+    @contextmanager
+    def lock(self) -> Iterator[None]:
+        """blobを作ってハードリンクを張る間、gcに消されないように共有ロックを取る. 入れ子にできる"""
+        if self._lock_depth > 0:
+            self._lock_depth += 1
+            try:
+                yield
+            finally:
+                self._lock_depth -= 1
+            return
+        with lock_blob_root(self.root):
+            self._lock_depth = 1
+            try:
+                yield
+            finally:
+                self._lock_depth = 0
+
+    @property
+    def blob_dir(self) -> str:
+        return os.path.join(self.root, self.algorithm)
+
+    def blob_path(self, digest: str) -> str:
+        return os.path.join(self.blob_dir, digest[:2], digest)
+
+    def load_index(self) -> dict[str, list]:
+        """入力ファイルのパスから[サイズ, 更新時刻, ハッシュ値]を引く辞書を読む"""
+        try:
+            with open(os.path.join(self.blob_dir, self.index_file), mode="r") as f:
+                index = json.load(f)
+            return index if isinstance(index, dict) else {}
+        except (OSError, ValueError):
+            return {}
+
+    def save_index(self) -> None:
+        # 同時に実行された他のランナーに壊れたファイルを読まれないように、書いてから名前を変える
+        fd, tmp_path = tempfile.mkstemp(dir=self.blob_dir, prefix=".tmp")
+        try:
+            with os.fdopen(fd, mode="w") as f:
+                json.dump(self._index, f)
+            os.replace(tmp_path, os.path.join(self.blob_dir, self.index_file))
+        except OSError as e:
+            self.logger.warning(f"blobの索引の保存に失敗しました。\n{str(e)}")
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+    def get_source_digest(self, path: str) -> str:
+        """サイズと更新時刻が変わっていなければ、前回計算したハッシュ値を使う"""
+        stat = os.stat(path)
+        key = os.path.abspath(path)
+        entry = self._index.get(key)
+        if entry is not None and entry[:2] == [stat.st_size, stat.st_mtime_ns] \
+                and os.path.exists(self.blob_path(entry[2])):
+            return entry[2]
+        digest = calculate_file_hash(path, self.algorithm)
+        self._index[key] = [stat.st_size, stat.st_mtime_ns, digest]
+        return digest
+
+    def link(self, src: str, dst: str) -> bool:
+        if not self._link_supported:
+            return False
+        tmp_path = f"{dst}.{os.getpid()}.tmp"
+        try:
+            os.link(src, tmp_path)
+            os.replace(tmp_path, dst)
+            return True
+        except OSError as e:
+            # ハードリンクが使えないファイルシステムでは重複排除をあきらめる
+            self.logger.warning(f"ハードリンクを作成できないため、重複排除を行いません。\n{str(e)}")
+            self._link_supported = False
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            return False
+
+    def add(self, path: str, digest: str, suffix: str = "") -> None:
+        """ファイルをblobとして保存し、元のファイルをblobへのハードリンクにする
+
+        圧縮されたファイルは展開した内容のハッシュ値に圧縮形式の拡張子をつけた名前で保存する
+        """
+        if not digest or not os.path.isfile(path):
+            return
+        blob = self.blob_path(digest) + suffix
+        self.digests[path] = digest
+        with self.lock():
+            if os.path.exists(blob):
+                if not os.path.samefile(blob, path):
+                    self.link(blob, path)
+                return
+            os.makedirs(os.path.dirname(blob), exist_ok=True)
+            try:
+                os.link(path, blob)
+            except FileExistsError:
+                self.link(blob, path) # 他のランナーが先に保存した
+            except OSError:
+                pass # blobにできなくても元のファイルは残る
+
+    def copy_file(self, src: str, dst: str) -> None:
+        """ファイルをコピーする. blobへのハードリンクにするので、変更されたファイルだけ読み書きする
+
+        索引はsave_indexで保存する
+        """
+        with self.lock():
+            digest = self.get_source_digest(src)
+            blob = self.blob_path(digest)
+            if not os.path.exists(blob):
+                os.makedirs(os.path.dirname(blob), exist_ok=True)
+                tmp_path = f"{blob}.{os.getpid()}.tmp"
+                shutil.copy2(src, tmp_path)
+                os.replace(tmp_path, blob)
+            if not self.link(blob, dst):
+                shutil.copy2(src, dst)
+        self.digests[dst] = digest
+
+def get_blob_root(log_dir: str) -> str:
+    return os.path.join(log_dir, ".blobs")
+
+def collect_garbage(log_dir: str = "log", keep_runs: Optional[int] = None) -> tuple[int, int]:
+    """どのログフォルダからも参照されていないblobを消す
+
+    ログフォルダの名前によらず、blobへのハードリンクがあれば参照されているとみなす
+    実行中のランナーがblobを作っている間は、そのランナーのロックが外れるまで待つ
+
+    Args:
+        log_dir (str, optional): ログフォルダがあるディレクトリ. Defaults to "log".
+        keep_runs (Optional[int], optional): 指定した場合は、新しい順にこの数だけ残してログフォルダを消す. Defaults to None.
+
+    Returns:
+        tuple[int, int]: 消したblobの数と、空いた容量(バイト)
+    """
+    if keep_runs is not None:
+        if keep_runs < 0:
+            raise ValueError("keep_runsの値は0以上である必要があります。")
+        runs = sorted(path for path in Path(log_dir).glob("*_LOG") if path.is_dir())
+        for run in runs[:max(len(runs) - keep_runs, 0)]:
+            shutil.rmtree(run, ignore_errors=True)
+
+    removed = 0
+    freed = 0
+    root = Path(get_blob_root(log_dir))
+    if not root.is_dir():
+        return removed, freed
+    # 実行中のランナーがblobを作ってからハードリンクを張り終えるまで待つ
+    with lock_blob_root(str(root), exclusive=True):
+        for blob in root.glob("*/*/*"):
+            stat = blob.stat()
+            # ログフォルダからのハードリンクがなければ、リンク数はblob自身の1になる
+            if blob.is_file() and stat.st_nlink <= 1:
+                blob.unlink()
+                removed += 1
+                freed += stat.st_size
+    return removed, freed
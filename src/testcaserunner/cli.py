@@ -0,0 +1,101 @@
+import os
+import sys
+import json
+import argparse
+from typing import Optional
+
+from .blob_store import collect_garbage
+from .compression import read_log_file
+from .log_server import serve_logs
+from .shard_merge import merge_shards
+from .distributed import run_agent
+from .daemon import DEFAULT_SOCKET_PATH, serve_daemon, submit_job, shutdown_daemon
+
+def gc_command(args: argparse.Namespace) -> None:
+    removed, freed = collect_garbage(args.log_dir, args.keep_runs)
+    print(f"{removed}個のblobを削除しました。({freed / (1024 * 1024):.1f} MiB)")
+
+def cat_command(args: argparse.Namespace) -> None:
+    for file in args.files:
+        sys.stdout.buffer.write(read_log_file(file))
+    sys.stdout.flush()
+
+def view_command(args: argparse.Namespace) -> None:
+    serve_logs(args.log_dir, args.host, args.port)
+
+def merge_command(args: argparse.Namespace) -> None:
+    output_dir = merge_shards(args.shard_dirs, args.output)
+    print(f"{len(args.shard_dirs)}個のシャードを{output_dir}に結合しました。")
+
+def agent_command(args: argparse.Namespace) -> None:
+    authkey = args.authkey if args.authkey is not None else os.environ.get("TESTCASERUNNER_AUTHKEY")
+    if authkey is None:
+        raise SystemExit("--authkeyか環境変数TESTCASERUNNER_AUTHKEYで鍵を指定してください。")
+    # testcase_handlerのモジュールをカレントディレクトリからimportできるようにする
+    sys.path.insert(0, os.getcwd())
+    run_agent(args.address, authkey, args.jobs)
+
+def serve_command(args: argparse.Namespace) -> None:
+    serve_daemon(args.socket, args.max_workers, args.debug)
+
+def submit_command(args: argparse.Namespace) -> None:
+    options = json.loads(args.options) if args.options is not None else {}
+    print(submit_job(args.input_file_path, args.handler, args.command, args.socket, args.client, **options))
+
+def shutdown_command(args: argparse.Namespace) -> None:
+    shutdown_daemon(args.socket)
+
+def make_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(prog="testcaserunner")
+    subparsers = parser.add_subparsers(dest="subcommand", required=True)
+
+    gc_parser = subparsers.add_parser("gc", help="どのログフォルダからも参照されていないblobを消す")
+    gc_parser.add_argument("--log-dir", default="log", help="ログフォルダがあるディレクトリ")
+    gc_parser.add_argument("--keep-runs", type=int, default=None, help="新しい順にこの数だけログフォルダを残し、それより古いものを消す")
+    gc_parser.set_defaults(func=gc_command)
+
+    cat_parser = subparsers.add_parser("cat", help="ログのファイルを表示する. 圧縮されたファイルは展開する")
+    cat_parser.add_argument("files", nargs="+", help="表示するファイル")
+    cat_parser.set_defaults(func=cat_command)
+
+    view_parser = subparsers.add_parser("view", help="ログフォルダをHTTPで公開する. 圧縮されたファイルは展開して返す")
+    view_parser.add_argument("--log-dir", default="log", help="公開するディレクトリ")
+    view_parser.add_argument("--host", default="127.0.0.1", help="待ち受けるアドレス")
+    view_parser.add_argument("--port", type=int, default=8000, help="待ち受けるポート番号")
+    view_parser.set_defaults(func=view_command)
+
+    merge_parser = subparsers.add_parser("merge", help="シャードごとのログフォルダを1つのログフォルダに結合する")
+    merge_parser.add_argument("shard_dirs", nargs="+", help="結合するシャードのログフォルダ")
+    merge_parser.add_argument("--output", default=None, help="結合したログフォルダのパス. 省略するとlogフォルダに新しく作る")
+    merge_parser.set_defaults(func=merge_command)
+
+    agent_parser = subparsers.add_parser("agent", help="コーディネーターに接続してテストケースを実行する")
+    agent_parser.add_argument("address", help="コーディネーターのアドレス. \"host:port\"か\"unix:/path/to/socket\"")
+    agent_parser.add_argument("--authkey", default=None, help="認証に使う鍵. 省略すると環境変数TESTCASERUNNER_AUTHKEYを使う")
+    agent_parser.add_argument("--jobs", type=int, default=1, help="同時に実行するテストケースの数")
+    agent_parser.set_defaults(func=agent_command)
+
+    serve_parser = subparsers.add_parser("serve", help="ジョブを受け付ける常駐プロセスを起動する")
+    serve_parser.add_argument("--socket", default=DEFAULT_SOCKET_PATH, help="待ち受けるUnixドメインソケットのパス")
+    serve_parser.add_argument("--max-workers", type=int, default=None, help="使い回すプロセスプールのワーカー数")
+    serve_parser.add_argument("--debug", action="store_true", help="デバッグ用のメッセージを出す")
+    serve_parser.set_defaults(func=serve_command)
+
+    submit_parser = subparsers.add_parser("submit", help="常駐プロセスにジョブを投入し、作成されたログフォルダのパスを表示する")
+    submit_parser.add_argument("input_file_path", help="入力ファイル群が置いてあるディレクトリへのパス")
+    target = submit_parser.add_mutually_exclusive_group(required=True)
+    target.add_argument("--handler", help="\"module:function\"の形式で指定するtestcase_handler")
+    target.add_argument("--command", help="run_commandで実行するコマンド")
+    submit_parser.add_argument("--options", default=None, help="runやrun_commandに渡す引数(JSON)")
+    submit_parser.add_argument("--client", default=None, help="公平に順番を回す単位. 省略するとカレントディレクトリ")
+    submit_parser.add_argument("--socket", default=DEFAULT_SOCKET_PATH, help="常駐プロセスのUnixドメインソケットのパス")
+    submit_parser.set_defaults(func=submit_command)
+
+    shutdown_parser = subparsers.add_parser("shutdown", help="常駐プロセスを終了させる")
+    shutdown_parser.add_argument("--socket", default=DEFAULT_SOCKET_PATH, help="常駐プロセスのUnixドメインソケットのパス")
+    shutdown_parser.set_defaults(func=shutdown_command)
+    return parser
+
+def main(argv: Optional[list[str]] = None) -> None:
+    args = make_parser().parse_args(argv)
+    args.func(args)
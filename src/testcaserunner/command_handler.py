@@ -0,0 +1,95 @@
+import os
+import shlex
+import subprocess
+import threading
+from contextlib import ExitStack
+from dataclasses import dataclass, field
+from typing import IO, Any, Optional
+
+from .runner_defines import TestCase, TestCaseResult, ResultStatus
+from .process_control import Watchdog, new_process_group_options, kill_process_group, wait_process, \
+    apply_memory_limit, is_memory_error_output, MEMORY_ERROR_TAIL_SIZE
+
+@dataclass
+class CommandTestcaseHandler:
+    """コマンドを直接起動してテストケースを実行するハンドラ
+
+    シェルやPythonのワーカーを経由せず、入力ファイルを標準入力に、
+    ログファイルを標準出力/標準エラー出力につないでプロセスを起動する
+    time_limitを過ぎたプロセスはプロセスグループごと終了させてTLEにする
+    memory_limit(MiB)はプロセスのアドレス空間の上限として設定し、超えたものはMLEにする
+    """
+    cmd_template: str
+    stdout_file_output: bool = True
+    stderr_file_output: bool = True
+    time_limit: Optional[float] = None
+    memory_limit: Optional[int] = None
+    _running: set[subprocess.Popen] = field(default_factory=set, init=False, repr=False)
+    _lock: threading.Lock = field(default_factory=threading.Lock, init=False, repr=False)
+
+    def make_command(self, testcase: TestCase) -> list[str]:
+        cmd = self.cmd_template.format(
+            input_file_path=testcase.input_file_path,
+            testcase_name=testcase.testcase_name,
+            testcase_index=testcase.testcase_index,
+        )
+        return shlex.split(cmd, posix=(os.name == "posix"))
+
+    def is_memory_error(self, testcase: TestCase) -> bool:
+        """標準エラー出力の末尾にメモリ確保の失敗が出ているかどうか"""
+        if not self.stderr_file_output:
+            return False
+        with open(testcase.stderr_file_path, mode="rb") as f:
+            f.seek(max(0, os.path.getsize(testcase.stderr_file_path) - MEMORY_ERROR_TAIL_SIZE))
+            return is_memory_error_output(f.read())
+
+    def is_memory_limit_exceeded(self, testcase: TestCase, returncode: int, max_rss: Optional[int]) -> bool:
+        if self.memory_limit is None:
+            return False
+        if max_rss is not None and max_rss >= self.memory_limit * 1024:
+            return True
+        return returncode != 0 and self.is_memory_error(testcase)
+
+    def open_output(self, stack: ExitStack, path: str, enabled: bool) -> IO[Any] | int:
+        if not enabled:
+            return subprocess.DEVNULL
+        return stack.enter_context(open(path, mode="wb"))
+
+    def __call__(self, testcase: TestCase) -> TestCaseResult:
+        cmd = self.make_command(testcase)
+        with ExitStack() as stack:
+            stdin = stack.enter_context(open(testcase.input_file_path, mode="rb"))
+            stdout = self.open_output(stack, testcase.stdout_file_path, self.stdout_file_output)
+            stderr = self.open_output(stack, testcase.stderr_file_path, self.stderr_file_output)
+            # スレッドプールから呼ばれるので、preexec_fnは使わずに起動してから制限をかける
+            proc = subprocess.Popen(cmd, stdin=stdin, stdout=stdout, stderr=stderr, **new_process_group_options())
+            apply_memory_limit(proc.pid, self.memory_limit)
+            with self._lock:
+                self._running.add(proc)
+            try:
+                with Watchdog(self.time_limit, lambda: kill_process_group(proc)) as watchdog:
+                    returncode, usage = wait_process(proc)
+            finally:
+                with self._lock:
+                    self._running.discard(proc)
+        max_rss = usage.max_rss if usage is not None else None
+        if watchdog.expired:
+            status = ResultStatus.TLE
+        elif self.is_memory_limit_exceeded(testcase, returncode, max_rss):
+            status = ResultStatus.MLE
+        elif returncode != 0:
+            status = ResultStatus.RE
+        else:
+            status = ResultStatus.AC
+        attribute = usage.to_attribute() if usage is not None else {}
+        return TestCaseResult(error_status=status, attribute=attribute)
+
+    def kill_all(self) -> None:
+        """実行中のプロセスをすべて終了させる
+
+        子プロセスは別のプロセスグループで動いていてCtrl-Cが届かないので、キャンセル時に呼ぶ
+        """
+        with self._lock:
+            running = list(self._running)
+        for proc in running:
+            kill_process_group(proc)
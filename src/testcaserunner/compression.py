@@ -0,0 +1,60 @@
+import gzip
+import lzma
+from typing import IO, Optional
+
+try:
+    import zstandard # type: ignore[import-not-found]
+except ImportError: # zstandardはインストールされている場合のみ使う
+    zstandard = None
+
+COMPRESSION_SUFFIXES = {
+    "gzip": ".gz",
+    "lzma": ".xz",
+    "zstd": ".zst",
+}
+COPY_CHUNK_SIZE = 1 << 20
+
+def validate_compression(compression: Optional[str]) -> None:
+    if compression is None:
+        return
+    if compression not in COMPRESSION_SUFFIXES:
+        raise ValueError(f"log_compressionの値が不正です。{tuple(COMPRESSION_SUFFIXES)}のいずれかを指定してください。")
+    if compression == "zstd" and zstandard is None:
+        raise ValueError("log_compressionに'zstd'を指定するにはzstandardをインストールしてください。")
+
+def get_compressed_path(path: str, compression: Optional[str]) -> str:
+    """圧縮して保存するときのファイルパスを返す"""
+    if compression is None:
+        return path
+    return path + COMPRESSION_SUFFIXES[compression]
+
+def get_compression(path: str) -> Optional[str]:
+    """ファイルの拡張子から圧縮形式を返す. 圧縮されていなければNone"""
+    for compression, suffix in COMPRESSION_SUFFIXES.items():
+        if path.endswith(suffix):
+            return compression
+    return None
+
+def open_compressed(path: str, mode: str, compression: Optional[str]) -> IO[bytes]:
+    """圧縮形式に合わせてファイルをバイナリモードで開く. compressionがNoneなら普通に開く"""
+    match compression:
+        case None:
+            return open(path, mode=mode)
+        case "gzip":
+            # 圧縮率より書き込み速度を優先する
+            return gzip.open(path, mode=mode, compresslevel=6) # type: ignore[return-value]
+        case "lzma":
+            return lzma.open(path, mode=mode) # type: ignore[return-value]
+        case "zstd":
+            validate_compression(compression)
+            return zstandard.open(path, mode=mode)
+        case _:
+            raise ValueError(f"不明な圧縮形式です。{compression}")
+
+def open_log_file(path: str) -> IO[bytes]:
+    """ログのファイルを開く. 圧縮されている場合は展開しながら読む"""
+    return open_compressed(path, "rb", get_compression(path))
+
+def read_log_file(path: str) -> bytes:
+    with open_log_file(path) as f:
+        return f.read()
@@ -0,0 +1,274 @@
+import os
+import sys
+import signal
+import getpass
+import tempfile
+import importlib
+import threading
+from collections import OrderedDict, deque
+from concurrent.futures import ProcessPoolExecutor, BrokenExecutor
+from dataclasses import dataclass, field
+from multiprocessing.connection import Listener, Client, Connection
+from typing import Any, Callable, Optional
+
+from .runner_defines import CustomException, InvalidPathException
+from .logger import RunnerLogger
+from .runner import run, run_command
+from .testccase_executor import SharedPool
+
+DEFAULT_SOCKET_PATH = os.path.join(tempfile.gettempdir(), f"testcaserunner-{getpass.getuser()}.sock")
+
+@dataclass
+class JobRequest:
+    """常駐プロセスに投入するジョブ. handlerかcommandのどちらかを指定する"""
+    input_file_path: str
+    handler: Optional[str] = None                 # "module:function"の形式で指定するtestcase_handler
+    command: Optional[str] = None                 # run_commandで実行するコマンド
+    options: dict[str, Any] = field(default_factory=dict) # runやrun_commandに渡す引数
+    cwd: str = field(default_factory=os.getcwd)  # ジョブを実行するディレクトリ
+    client: Optional[str] = None                  # 公平に順番を回す単位. Noneならcwd
+
+    def validate(self) -> None:
+        if (self.handler is None) == (self.command is None):
+            raise ValueError("handlerとcommandのどちらか1つを指定してください。")
+        if self.handler is not None and ":" not in self.handler:
+            raise ValueError("handlerは\"module:function\"の形式で指定してください。")
+
+class JobQueue:
+    """クライアントごとの待ち行列から順番に1つずつ取り出す
+
+    1つのクライアントが大量にジョブを投入しても、他のクライアントのジョブが待たされ続けないようにする
+    """
+    def __init__(self) -> None:
+        self._queues: OrderedDict[str, deque] = OrderedDict()
+        self._condition = threading.Condition()
+        self._closed = False
+
+    def put(self, client: str, item: Any) -> None:
+        with self._condition:
+            self._queues.setdefault(client, deque()).append(item)
+            self._condition.notify()
+
+    def get(self) -> Optional[Any]:
+        """次のジョブを返す. 閉じられたらNoneを返す"""
+        with self._condition:
+            while not self._queues and not self._closed:
+                self._condition.wait()
+            if self._closed:
+                return None
+            client, queue = next(iter(self._queues.items()))
+            item = queue.popleft()
+            if queue:
+                self._queues.move_to_end(client)
+            else:
+                del self._queues[client]
+            return item
+
+    def close(self) -> None:
+        with self._condition:
+            self._closed = True
+            self._condition.notify_all()
+
+    def drain(self) -> list[Any]:
+        """取り出されなかったものを全て返す"""
+        with self._condition:
+            items = [item for queue in self._queues.values() for item in queue]
+            self._queues.clear()
+            return items
+
+class RunnerDaemon:
+    """ジョブを受け付けて順番に実行する常駐プロセス
+
+    ライブラリのimportとプロセスプールの起動はジョブをまたいで1回だけ行う
+    ジョブは作業ディレクトリを切り替えて実行するので、同時には1つだけ実行する
+    ジョブのディレクトリにあるモジュールが変更されたら、読み込み直してプロセスプールも作り直す
+    """
+    logger = RunnerLogger("RunnerDaemon")
+
+    def __init__(self, socket_path: str = DEFAULT_SOCKET_PATH, max_workers: Optional[int] = None,
+                 debug: bool = False) -> None:
+        if debug:
+            self.logger.enable_debug_mode()
+        self.socket_path = socket_path
+        self.max_workers = max_workers
+        self.debug = debug
+        self.queue = JobQueue()
+        self.pool: Optional[ProcessPoolExecutor] = None
+        self.module_mtimes: dict[str, float] = {}
+
+    def start_pool(self) -> ProcessPoolExecutor:
+        if self.pool is None:
+            self.pool = ProcessPoolExecutor(max_workers=self.max_workers)
+            self.pool.submit(os.getpid).result() # ワーカーを先に起動しておく
+        return self.pool
+
+    def stop_pool(self) -> None:
+        if self.pool is not None:
+            self.pool.shutdown(cancel_futures=True)
+            self.pool = None
+
+    def get_project_modules(self, cwd: str) -> dict[str, float]:
+        """ジョブのディレクトリから読み込まれたモジュールと更新時刻"""
+        modules: dict[str, float] = {}
+        root = os.path.join(os.path.abspath(cwd), "")
+        for name, module in list(sys.modules.items()):
+            file = getattr(module, "__file__", None)
+            if name.split(".")[0] == "testcaserunner" or file is None:
+                continue
+            path = os.path.abspath(file)
+            if path.startswith(root) and "site-packages" not in path:
+                try:
+                    modules[name] = os.path.getmtime(path)
+                except OSError:
+                    modules[name] = -1.0
+        return modules
+
+    def reload_modules(self, cwd: str) -> None:
+        """変更されたモジュールがあれば、ジョブのディレクトリのモジュールを全て読み込み直す"""
+        modules = self.get_project_modules(cwd)
+        if all(self.module_mtimes.get(name) == mtime for name, mtime in modules.items()):
+            return
+        self.logger.info("モジュールが変更されたため、読み込み直します。")
+        for name in modules:
+            sys.modules.pop(name, None)
+            self.module_mtimes.pop(name, None)
+        # ワーカーも古いモジュールを読み込んでいるので作り直す
+        self.stop_pool()
+
+    def load_handler(self, spec: str) -> Callable:
+        module_name, _, function_name = spec.partition(":")
+        module = importlib.import_module(module_name)
+        return getattr(module, function_name)
+
+    def run_job(self, job: JobRequest) -> str:
+        job.validate()
+        os.chdir(job.cwd)
+        if job.cwd not in sys.path:
+            sys.path.insert(0, job.cwd)
+        self.reload_modules(job.cwd)
+        if job.command is not None:
+            log_folder_name = run_command(job.command, job.input_file_path, **job.options)
+        else:
+            assert job.handler is not None
+            handler = self.load_handler(job.handler)
+            self.module_mtimes.update(self.get_project_modules(job.cwd))
+            try:
+                log_folder_name = run(handler, job.input_file_path, **job.options, _shared_pool=SharedPool(self.start_pool()))
+            except BrokenExecutor:
+                self.stop_pool() # 次のジョブでは作り直す
+                raise
+        return os.path.abspath(log_folder_name)
+
+    def serve_connection(self, conn: Connection) -> None:
+        done = threading.Event()
+        try:
+            message = conn.recv()
+            if message[0] == "shutdown":
+                self.queue.close()
+                conn.send(("done", None))
+                return
+            job: JobRequest = message[1]
+            reply: list[tuple] = []
+            self.queue.put(job.client or job.cwd, (job, reply, done))
+            done.wait()
+            try:
+                conn.send(reply[0])
+            except Exception:
+                # 例外をpickleできない場合は、メッセージだけを送る
+                conn.send(("error", CustomException(f"{type(reply[0][1]).__name__}: {str(reply[0][1])}")))
+        except (EOFError, OSError):
+            pass # クライアントが待つのをやめた
+        finally:
+            conn.close()
+
+    def accept_connections(self, listener: Listener) -> None:
+        while True:
+            try:
+                conn = listener.accept()
+            except OSError:
+                return
+            threading.Thread(target=self.serve_connection, args=(conn,), daemon=True).start()
+
+    def serve_forever(self) -> None:
+        """shutdownが送られるまでジョブを実行する. シグナルハンドラを使うのでメインスレッドで呼ぶ"""
+        if os.path.exists(self.socket_path):
+            try:
+                Client(self.socket_path, family="AF_UNIX").close()
+            except OSError:
+                os.remove(self.socket_path) # 前回の常駐プロセスが残したソケット
+            else:
+                raise InvalidPathException(f"{self.socket_path}で既に常駐プロセスが起動しています。")
+        old_umask = os.umask(0o077) # 他のユーザーからは接続できないようにする
+        try:
+            listener = Listener(self.socket_path, family="AF_UNIX")
+        finally:
+            os.umask(old_umask)
+        threading.Thread(target=self.accept_connections, args=(listener,), daemon=True).start()
+        signal.signal(signal.SIGTERM, lambda signum, frame: self.queue.close())
+        self.logger.info(f"{self.socket_path}でジョブを待ち受けます。")
+        cwd = os.getcwd()
+        try:
+            while (item := self.queue.get()) is not None:
+                job, reply, done = item
+                try:
+                    reply.append(("done", self.run_job(job)))
+                except Exception as e:
+                    self.logger.warning(f"ジョブの実行中に例外が発生しました。\n{str(e)}")
+                    reply.append(("error", e))
+                finally:
+                    os.chdir(cwd)
+                    done.set()
+                    # ジョブの中で元に戻されたシグナルハンドラを戻す
+                    signal.signal(signal.SIGINT, signal.default_int_handler)
+        finally:
+            listener.close()
+            self.stop_pool()
+            for job, reply, done in self.queue.drain():
+                reply.append(("error", CustomException("常駐プロセスが終了したため、ジョブは実行されませんでした。")))
+                done.set()
+
+def serve_daemon(socket_path: str = DEFAULT_SOCKET_PATH, max_workers: Optional[int] = None, debug: bool = False) -> None:
+    """ジョブを受け付ける常駐プロセスを起動する
+
+    Args:
+        socket_path (str, optional): 待ち受けるUnixドメインソケットのパス. Defaults to DEFAULT_SOCKET_PATH.
+        max_workers (Optional[int], optional): 使い回すプロセスプールのワーカー数. Defaults to None.
+        debug (bool, optional): デバッグ用のメッセージを出すかどうか. Defaults to False.
+    """
+    RunnerDaemon(socket_path, max_workers, debug).serve_forever()
+
+def submit_job(input_file_path: str, handler: Optional[str] = None, command: Optional[str] = None,
+               socket_path: str = DEFAULT_SOCKET_PATH, client: Optional[str] = None, **options: Any) -> str:
+    """常駐プロセスにジョブを投入し、終わるまで待つ
+
+    Args:
+        input_file_path (str): 入力ファイル群が置いてあるディレクトリへのパス
+        handler (Optional[str], optional): "module:function"の形式で指定するtestcase_handler. Defaults to None.
+        command (Optional[str], optional): run_commandで実行するコマンド. Defaults to None.
+        socket_path (str, optional): 常駐プロセスのUnixドメインソケットのパス. Defaults to DEFAULT_SOCKET_PATH.
+        client (Optional[str], optional): 公平に順番を回す単位. Defaults to None(カレントディレクトリ).
+        **options: runやrun_commandに渡す引数
+
+    Returns:
+        str: 作成したログフォルダのパス
+    """
+    job = JobRequest(os.path.abspath(input_file_path), handler, command, options, os.getcwd(), client)
+    job.validate()
+    with Client(socket_path, family="AF_UNIX") as conn:
+        conn.send(("run", job))
+        status, value = conn.recv()
+    if status == "error":
+        raise value
+    return value
+
+def shutdown_daemon(socket_path: str = DEFAULT_SOCKET_PATH) -> None:
+    """常駐プロセスを終了させる. 実行中のジョブは最後まで実行し、待ち行列のジョブは実行しない"""
+    with Client(socket_path, family="AF_UNIX") as conn:
+        conn.send(("shutdown",))
+        conn.recv()
+
+__all__ = [
+    "serve_daemon",
+    "submit_job",
+    "shutdown_daemon",
+]
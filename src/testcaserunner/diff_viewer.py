@@ -14,6 +14,7 @@ from jsonschema import ValidationError, validate
 from .runner_defines import RunnerMetadata, ResultStatus
 from .logger import RunnerLogger
 from .testcase_logger import RunnerLog, RunnerLogManager
+from .file_hasher import DEFAULT_HASH_ALGORITHM
 from .html_builder import HtmlBuilder, Column, HtmlColumnType
 
 @dataclass
@@ -36,6 +37,9 @@ class DiffHtmlBuilder(HtmlBuilder):
         self.renamed_logs = deepcopy(self.logs)
         if debug:
             self.logger.enable_debug_mode()
+        algorithms = {log.metadata.get("hash_algorithm", DEFAULT_HASH_ALGORITHM) for log in self.logs}
+        if len(algorithms) > 1:
+            self.logger.warning("ハッシュ関数が異なるログが含まれているため、入力ファイルを対応付けられません。")
         self.columns = self.construct_table_columns()
         self.merged_df = self.merge_data_frames()
         self.contents: list[str] = []
@@ -146,6 +150,7 @@ class DiffHtmlBuilder(HtmlBuilder):
         ResultStatus.RE: ("RE", "gold"),
         ResultStatus.TLE: ("TLE", "gold"),
         ResultStatus.IE: ("IE", "red"),
+        ResultStatus.MLE: ("MLE", "orange"),
     }
     @logger.function_tracer
     def get_status_cell(self, column: DiffColumn, row: int, sub_category_index: int) -> str:
@@ -305,12 +310,10 @@ class DiffDirector:
     def construct(self):
         self.__builder.set_title("Compare Result")
         self.__builder.add_datetime()
-        self.__builder.add_heading("Summary 1")
-        self.__builder.add_link(0)
-        self.__builder.add_other_file_summary(0)
-        self.__builder.add_heading("Summary 2")
-        self.__builder.add_link(1)
-        self.__builder.add_other_file_summary(1)
+        for index in range(len(self.__builder.logs)):
+            self.__builder.add_heading(f"Summary {index+1}")
+            self.__builder.add_link(index)
+            self.__builder.add_other_file_summary(index)
         self.__builder.add_heading("Compare Table")
         self.__builder.add_table()
         self.__builder.add_script("js/Table.js")
@@ -0,0 +1,69 @@
+import os
+import shutil
+import fnmatch
+from dataclasses import dataclass, field
+from typing import Iterator
+
+@dataclass
+class TestcaseDiscovery:
+    """入力ファイルをos.scandirで順番に見つける
+
+    ファイルの一覧をまとめて作らないので、大量の入力ファイルがあってもメモリを使わない
+    パターンはrootからの相対パス('/'区切り)に対して照合する. '/'を含まないパターンはファイル名に照合する
+    """
+    root: str
+    include_patterns: list[str] = field(default_factory=list) # 空なら全てのファイルを対象にする
+    exclude_patterns: list[str] = field(default_factory=list)
+    recursive: bool = False
+
+    def matches(self, relative_path: str, patterns: list[str]) -> bool:
+        name = relative_path.rsplit("/", 1)[-1]
+        for pattern in patterns:
+            target = relative_path if "/" in pattern else name
+            if fnmatch.fnmatchcase(target, pattern):
+                return True
+        return False
+
+    def is_target(self, relative_path: str) -> bool:
+        if self.include_patterns and not self.matches(relative_path, self.include_patterns):
+            return False
+        return not self.matches(relative_path, self.exclude_patterns)
+
+    def walk(self, directory: str, prefix: str) -> Iterator[str]:
+        # ファイル名順に返すため、ディレクトリごとに名前だけ並べ替える
+        with os.scandir(directory) as it:
+            entries = sorted((entry.name, entry.is_dir()) for entry in it if not entry.name.startswith("."))
+        for name, is_dir in entries:
+            relative_path = f"{prefix}{name}"
+            if is_dir:
+                if self.recursive and not self.matches(relative_path, self.exclude_patterns):
+                    yield from self.walk(os.path.join(directory, name), f"{relative_path}/")
+            elif self.is_target(relative_path):
+                yield relative_path
+
+    def iter_relative_paths(self) -> Iterator[str]:
+        """rootからの相対パス('/'区切り)をファイル名順に返す"""
+        return self.walk(self.root, "")
+
+    def iter_files(self) -> Iterator[str]:
+        """入力ファイルのパスをファイル名順に返す"""
+        for relative_path in self.iter_relative_paths():
+            yield os.path.join(self.root, *relative_path.split("/"))
+
+    def has_files(self) -> bool:
+        return next(self.iter_relative_paths(), None) is not None
+
+    def count(self) -> int:
+        """入力ファイルの数を数える. 進捗バーの総数の見積もりに使う"""
+        return sum(1 for _ in self.iter_relative_paths())
+
+def link_inputs(input_file_path: str, relative_paths: list[str], output_dir: str) -> None:
+    """入力ファイルのうちrelative_pathsだけを置いたフォルダを作る. できればハードリンクにする"""
+    for relative_path in relative_paths:
+        src = os.path.join(input_file_path, *relative_path.split("/"))
+        dst = os.path.join(output_dir, *relative_path.split("/"))
+        os.makedirs(os.path.dirname(dst), exist_ok=True)
+        try:
+            os.link(src, dst)
+        except OSError:
+            shutil.copy2(src, dst)
@@ -0,0 +1,325 @@
+import os
+import shutil
+import signal
+import tempfile
+import threading
+import types
+import pickle
+import multiprocessing
+from collections import deque, defaultdict
+from dataclasses import dataclass, replace
+from multiprocessing.connection import Listener, Client, Connection
+from typing import Any, Callable, Iterable, Iterator, Optional, Self
+
+from tqdm import tqdm
+
+from .runner_defines import TestCase, TestCaseResult, OutputInfo, ResultStatus
+from .logger import RunnerLogger
+from .worker_context import WorkerLifecycle
+from .testccase_executor import TestcaseExecutor
+from .compression import get_compressed_path, get_compression
+
+Address = tuple[str, int] | str
+
+@dataclass
+class DistributedConfig:
+    """エージェントにテストケースを配る設定"""
+    address: str = "127.0.0.1:0"          # 待ち受けるアドレス. "host:port"か"unix:/path/to/socket". ポート0なら空いているポートを使う
+    authkey: Optional[str] = None          # エージェントの認証に使う鍵. Noneなら乱数にし、local_workersだけが接続できる
+    local_workers: int = 0                 # このマシンで起動するエージェントの数
+
+    def validate(self) -> None:
+        parse_address(self.address)
+        if self.local_workers < 0:
+            raise ValueError("local_workersの値は0以上である必要があります。")
+        if self.authkey is None and self.local_workers == 0:
+            raise ValueError("authkeyを指定しない場合は、local_workersを1以上にしてください。")
+
+def parse_address(address: str) -> Address:
+    """"host:port"はTCP、"unix:/path"はUnixドメインソケットのアドレスにする"""
+    if address.startswith("unix:"):
+        return address[len("unix:"):]
+    host, sep, port = address.rpartition(":")
+    if not sep or not port.isdigit():
+        raise ValueError(f"アドレス{address}は\"host:port\"か\"unix:/path\"の形式で指定してください。")
+    return (host, int(port))
+
+def format_address(address: Address) -> str:
+    if isinstance(address, str):
+        return f"unix:{address}"
+    return f"{address[0]}:{address[1]}"
+
+class DistributedTestcaseExecutor(TestcaseExecutor):
+    """ソケットで接続してきたエージェントにテストケースを配るExecutor
+
+    エージェントは1つ終わるたびに次のテストケースを取りに来るので、速いマシンほど多くのテストケースを実行する
+    入力ファイルの中身を送り、結果と出力ファイルの中身を受け取ってログフォルダに書き込む
+    接続が切れたエージェントが実行中だったテストケースは、他のエージェントに配り直す
+    メッセージはmultiprocessing.connectionでpickleして送るので、信頼できるマシンのエージェントだけを接続させること
+    """
+    logger = RunnerLogger("DistributedTestcaseExecutor")
+    # エージェントごと落とすテストケースを配り続けないように、配り直す回数を制限する
+    MAX_RETRIES = 2
+
+    def __init__(self, total: int, lifecycle: Optional[WorkerLifecycle] = None,
+                 config: Optional[DistributedConfig] = None):
+        super().__init__(total, lifecycle)
+        self._total = total
+        self._status = self.NOT_START
+        self._config = config if config is not None else DistributedConfig()
+        self._config.validate()
+        self._condition = threading.Condition()
+        self._queue: deque[tuple[int, int, TestCase]] = deque() # (投入した回, 結果の位置, TestCase)
+        self._results: list[Optional[TestCaseResult]] = []
+        self._round = 0
+        self._running = 0
+        self._retries: defaultdict[int, int] = defaultdict(int)
+        self._exhausted = True
+        self._closing = False
+        self._agents: list[multiprocessing.Process] = []
+
+    @property
+    def address(self) -> str:
+        """エージェントが接続するアドレス"""
+        return format_address(self._listener.address)
+
+    def submit(self, testcase_handler: Callable[[TestCase], TestCaseResult], test_cases: Iterable[TestCase]) -> None:
+        if self._status != self.STARTED:
+            raise ValueError("使い方間違ってるよ")
+        with self._condition:
+            self._handler = testcase_handler
+            self._pending: Iterator[TestCase] = iter(test_cases)
+            self._results = []
+            self._round += 1
+            self._running = 0
+            self._retries.clear()
+            self._exhausted = False
+            self._status = self.SUBMITTED
+            self._condition.notify_all()
+
+    def fetch(self) -> None:
+        """まだ投入していないテストケースを1つ取り出して待ち行列に入れる. ロックを取ってから呼ぶ"""
+        testcase = next(self._pending, None)
+        if testcase is None:
+            self._exhausted = True
+            return
+        self.count_submitted(1)
+        self._queue.append((self._round, len(self._results), testcase))
+        self._results.append(None)
+
+    def next_task(self) -> Optional[tuple[int, int, TestCase]]:
+        """エージェントに渡すテストケースを返す. 配るものがなくなるまで待ち、終了するならNoneを返す"""
+        with self._condition:
+            while True:
+                if self._closing or self._interrupted:
+                    return None
+                if self._status == self.SUBMITTED:
+                    if not self._queue and not self._exhausted:
+                        self.fetch()
+                    if self._queue:
+                        self._running += 1
+                        return self._queue.popleft()
+                self._condition.wait()
+
+    def complete(self, task: tuple[int, int, TestCase], result: Optional[TestCaseResult]) -> None:
+        """エージェントから受け取った結果を記録する. resultがNoneなら配り直す"""
+        round_, index, testcase = task
+        with self._condition:
+            if round_ == self._round and self._status == self.SUBMITTED:
+                self._running -= 1
+                if result is None and self._retries[index] < self.MAX_RETRIES:
+                    self._retries[index] += 1
+                    self._queue.appendleft(task)
+                else:
+                    if result is None:
+                        result = TestCaseResult(ResultStatus.IE, stderr="テストケースの実行中にエージェントとの接続が切れました。")
+                    self._results[index] = result
+                    self._progress.update()
+                    self.notify_result(testcase, result)
+            self._condition.notify_all()
+
+    def store_outputs(self, testcase: TestCase, result: TestCaseResult,
+                      stdout: Optional[bytes], stderr: Optional[bytes]) -> None:
+        """エージェントから受け取った出力ファイルの中身を書き込み、パスをこのマシンのものにする"""
+        def store(path: str, info: Optional[OutputInfo], data: Optional[bytes]) -> Optional[OutputInfo]:
+            if info is None or data is None:
+                return None
+            path = get_compressed_path(path, get_compression(info.path))
+            with open(path, mode="wb") as f:
+                f.write(data)
+            return replace(info, path=path)
+        result.stdout_info = store(testcase.stdout_file_path, result.stdout_info, stdout)
+        result.stderr_info = store(testcase.stderr_file_path, result.stderr_info, stderr)
+
+    def serve_connection(self, conn: Connection) -> None:
+        task: Optional[tuple[int, int, TestCase]] = None
+        try:
+            conn.send(("init", self._lifecycle))
+            while True:
+                message = conn.recv()
+                if message[0] == "result" and task is not None:
+                    _, result, stdout, stderr = message
+                    self.store_outputs(task[2], result, stdout, stderr)
+                    self.complete(task, result)
+                    task = None
+                task = self.next_task()
+                if task is None:
+                    conn.send(("stop",))
+                    return
+                with open(task[2].input_file_path, mode="rb") as f:
+                    input_data = f.read()
+                conn.send(("task", self._handler, task[2], input_data))
+        except (EOFError, OSError) as e:
+            if not self._closing:
+                self.logger.warning(f"エージェントとの接続が切れました。\n{str(e)}")
+        finally:
+            if task is not None:
+                self.complete(task, None)
+            conn.close()
+
+    def accept_connections(self) -> None:
+        while True:
+            try:
+                conn = self._listener.accept()
+            except (OSError, multiprocessing.AuthenticationError) as e:
+                if self._closing:
+                    return
+                self.logger.warning(f"エージェントの接続を受け付けられませんでした。\n{str(e)}")
+                continue
+            if self._closing:
+                conn.close()
+                return
+            threading.Thread(target=self.serve_connection, args=(conn,), daemon=True).start()
+
+    def wait_and_get_results(self) -> list[Optional[TestCaseResult]]:
+        if self._status != self.SUBMITTED:
+            raise ValueError("使い方間違ってるよ")
+        with self._condition:
+            while not self._interrupted:
+                if not self._queue and not self._exhausted:
+                    self.fetch() # テストケースが残っているかを確かめる
+                if self._exhausted and not self._queue and self._running == 0:
+                    break
+                self._condition.wait()
+            # キャンセルされた場合、まだ投入していないテストケースの結果はNoneにする
+            self._results.extend(None for _ in self._pending)
+            self._queue.clear()
+            self._status = self.STARTED # 続けて投入できるようにする
+            self._condition.notify_all()
+            return self._results
+
+    def __enter__(self) -> Self:
+        self._status = self.STARTED
+        self._progress = tqdm(total=self._total)
+        self._authkey = self._config.authkey.encode() if self._config.authkey is not None else os.urandom(32)
+        self._listener = Listener(parse_address(self._config.address), authkey=self._authkey)
+        self.logger.info(f"エージェントの接続を{self.address}で待ち受けます。")
+        for _ in range(self._config.local_workers):
+            agent = multiprocessing.Process(target=run_local_agent, args=(self._listener.address, self._authkey), daemon=True)
+            agent.start()
+            self._agents.append(agent)
+        threading.Thread(target=self.accept_connections, daemon=True).start()
+        signal.signal(signal.SIGINT, self.signal_handler)
+        return self
+
+    def __exit__(self, exc_type: Optional[type[BaseException]], exc_val: Optional[BaseException],
+                 exc_tb: Optional[BaseException]) -> None:
+        with self._condition:
+            self._closing = True
+            self._condition.notify_all()
+        try:
+            # acceptで止まっているスレッドを起こす
+            Client(self._listener.address, authkey=self._authkey).close()
+        except OSError:
+            pass
+        self._listener.close()
+        for agent in self._agents:
+            agent.join(timeout=5)
+            if agent.is_alive():
+                agent.terminate()
+        self._progress.close()
+        self._lifecycle.finalize()
+        signal.signal(signal.SIGINT, signal.SIG_DFL)
+
+    def signal_handler(self, signum: int, frame: None | types.FrameType) -> Any:
+        self._interrupted = True
+        # シグナルハンドラの中ではロックを取れないので、待っているスレッドは別のスレッドから起こす
+        threading.Thread(target=self.wake_up).start()
+        self.notify_catch_keyboard_interrupt()
+
+    def wake_up(self) -> None:
+        with self._condition:
+            self._condition.notify_all()
+
+def run_agent_connection(address: Address, authkey: bytes) -> None:
+    """コーディネーターに接続し、テストケースがなくなるまで1つずつ受け取って実行する"""
+    with Client(address, authkey=authkey) as conn, tempfile.TemporaryDirectory(prefix="testcaserunner_") as work_dir:
+        message = conn.recv()
+        lifecycle: WorkerLifecycle = message[1]
+        lifecycle.initialize_process()
+        conn.send(("ready",))
+        while True:
+            message = conn.recv()
+            if message[0] == "stop":
+                return
+            _, handler, testcase, input_data = message
+            result, stdout, stderr = run_remote_testcase(work_dir, handler, testcase, input_data)
+            try:
+                conn.send(("result", result, stdout, stderr))
+            except (pickle.PicklingError, TypeError, AttributeError) as e:
+                # 送れない値が結果に入っていた. pickleに失敗した場合は何も送られていない
+                conn.send(("result", TestCaseResult(ResultStatus.IE, stderr=str(e)), None, None))
+
+def run_remote_testcase(work_dir: str, handler: Callable[[TestCase], TestCaseResult], testcase: TestCase,
+                        input_data: bytes) -> tuple[TestCaseResult, Optional[bytes], Optional[bytes]]:
+    """作業用のフォルダに入力ファイルを置いて実行し、結果と出力ファイルの中身を返す"""
+    case_dir = os.path.join(work_dir, str(testcase.testcase_index))
+    paths = []
+    for name, path in (("in", testcase.input_file_path), ("stdout", testcase.stdout_file_path),
+                       ("stderr", testcase.stderr_file_path)):
+        os.makedirs(os.path.join(case_dir, name), exist_ok=True)
+        paths.append(os.path.join(case_dir, name, os.path.basename(path)))
+    with open(paths[0], mode="wb") as f:
+        f.write(input_data)
+    try:
+        result = handler(TestCase(testcase.testcase_name, paths[0], paths[1], paths[2], testcase.testcase_index))
+        outputs: list[Optional[bytes]] = []
+        for info in (result.stdout_info, result.stderr_info):
+            if info is None:
+                outputs.append(None)
+                continue
+            with open(info.path, mode="rb") as f:
+                outputs.append(f.read())
+        return result, outputs[0], outputs[1]
+    finally:
+        shutil.rmtree(case_dir, ignore_errors=True)
+
+def run_local_agent(address: Address, authkey: bytes) -> None:
+    # Ctrl+Cはコーディネーターが受け取り、エージェントには接続を閉じて伝える
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    run_agent_connection(address, authkey)
+
+def run_agent(address: str, authkey: str, jobs: int = 1) -> None:
+    """コーディネーターに接続してテストケースを実行するエージェントを起動する
+
+    Args:
+        address (str): コーディネーターのアドレス. "host:port"か"unix:/path/to/socket"
+        authkey (str): コーディネーターのDistributedConfigに指定した鍵
+        jobs (int, optional): 同時に実行するテストケースの数. Defaults to 1.
+    """
+    if jobs <= 0:
+        raise ValueError("jobsの値は1以上である必要があります。")
+    parsed = parse_address(address)
+    if jobs == 1:
+        run_agent_connection(parsed, authkey.encode())
+        return
+    agents = [multiprocessing.Process(target=run_agent_connection, args=(parsed, authkey.encode())) for _ in range(jobs)]
+    for agent in agents:
+        agent.start()
+    for agent in agents:
+        agent.join()
+
+__all__ = [
+    "DistributedConfig",
+    "run_agent",
+]
@@ -0,0 +1,96 @@
+import os
+import mmap
+import lzma
+import hashlib
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Optional
+
+from .compression import open_compressed
+
+try:
+    import xxhash # type: ignore[import-not-found]
+except ImportError: # xxhashはインストールされている場合のみ使う
+    xxhash = None
+
+DEFAULT_HASH_ALGORITHM = "sha256"
+HASH_ALGORITHMS = ("sha256", "blake2b", "xxh3")
+# これより大きいファイルはmmapで読む
+MMAP_THRESHOLD = 1 << 20
+READ_CHUNK_SIZE = 1 << 20
+
+def new_hash(algorithm: str) -> Any:
+    """ハッシュ関数のオブジェクトを作る
+
+    blake2bは出力をsha256と同じ32バイトにする. xxh3はxxhashがインストールされている場合のみ使える
+    """
+    match algorithm:
+        case "sha256":
+            return hashlib.sha256()
+        case "blake2b":
+            return hashlib.blake2b(digest_size=32)
+        case "xxh3":
+            if xxhash is None:
+                raise ValueError("hash_algorithmに'xxh3'を指定するにはxxhashをインストールしてください。")
+            return xxhash.xxh3_128()
+        case _:
+            raise ValueError(f"hash_algorithmの値が不正です。{HASH_ALGORITHMS}のいずれかを指定してください。")
+
+def calculate_file_hash(file_path: str, algorithm: str = DEFAULT_HASH_ALGORITHM, compression: Optional[str] = None) -> str:
+    """ファイルのハッシュ値を計算する. compressionを指定した場合は展開した内容から計算する"""
+    hash_obj = new_hash(algorithm)
+    if compression is not None:
+        with open_compressed(file_path, "rb", compression) as compressed:
+            while chunk := compressed.read(READ_CHUNK_SIZE):
+                hash_obj.update(chunk)
+        return hash_obj.hexdigest()
+    with open(file_path, 'rb') as file:
+        size = os.fstat(file.fileno()).st_size
+        if size >= MMAP_THRESHOLD:
+            # ページキャッシュをそのまま渡すので、コピーせずにハッシュ関数に読ませられる
+            with mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+                hash_obj.update(mapped)
+        else:
+            while chunk := file.read(READ_CHUNK_SIZE):
+                hash_obj.update(chunk)
+    return hash_obj.hexdigest()
+
+class FileHasher:
+    """複数のファイルのハッシュ値をスレッドプールで計算する
+
+    hashlibはハッシュ値の計算中にGILを解放するので、スレッドで並列化できる
+    同じファイルを何度も計算しないように、パスとサイズと更新時刻をキーにして結果を覚えておく
+    """
+    def __init__(self, algorithm: str = DEFAULT_HASH_ALGORITHM, max_workers: Optional[int] = None) -> None:
+        new_hash(algorithm) # 使えないハッシュ関数ならここで例外を出す
+        self.algorithm = algorithm
+        self.max_workers = max_workers
+        self._memo: dict[tuple[str, int, int, Optional[str]], str] = {}
+        self._lock = threading.Lock()
+
+    def hash_file(self, path: str, compression: Optional[str] = None) -> str:
+        """ファイルのハッシュ値を返す. ファイルが開けないときは空文字を返す"""
+        try:
+            stat = os.stat(path)
+        except OSError:
+            return ""
+        key = (os.path.abspath(path), stat.st_size, stat.st_mtime_ns, compression)
+        with self._lock:
+            if key in self._memo:
+                return self._memo[key]
+        try:
+            digest = calculate_file_hash(path, self.algorithm, compression)
+        except (OSError, EOFError, lzma.LZMAError):
+            return "" # 壊れた圧縮ファイルも開けないものとして扱う
+        with self._lock:
+            self._memo[key] = digest
+        return digest
+
+    def hash_files(self, paths: list[str], compression: Optional[str] = None) -> dict[str, str]:
+        """ファイルのパスからハッシュ値を引く辞書を返す"""
+        unique_paths = list(dict.fromkeys(paths))
+        if len(unique_paths) <= 1:
+            return {path: self.hash_file(path, compression) for path in unique_paths}
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            digests = executor.map(lambda path: self.hash_file(path, compression), unique_paths)
+            return dict(zip(unique_paths, digests))
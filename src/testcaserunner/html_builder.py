@@ -212,6 +212,7 @@ class ResultHtmlBuilder(HtmlBuilder):
         ResultStatus.TLE: ("TLE", "gold"),
         ResultStatus.IE: ("IE", "red"),
         ResultStatus.CAN: ("---", "gray"),
+        ResultStatus.MLE: ("MLE", "orange"),
     }
     @logger.function_tracer
     def get_status_cell(self, column: str, row: int) -> str:
@@ -0,0 +1,37 @@
+import os
+import io
+import functools
+from http.server import SimpleHTTPRequestHandler, ThreadingHTTPServer
+from typing import Optional
+
+from .compression import get_compression, read_log_file
+
+class DecompressingRequestHandler(SimpleHTTPRequestHandler):
+    """圧縮されたログファイルを展開して返すHTTPハンドラ
+
+    result.htmlのstdout/stderrのリンクから、圧縮されたファイルをそのまま閲覧できるようにする
+    """
+    def send_head(self) -> Optional[io.BufferedIOBase]: # type: ignore[override]
+        path = self.translate_path(self.path)
+        if get_compression(path) is None or not os.path.isfile(path):
+            return super().send_head() # type: ignore[return-value]
+        try:
+            data = read_log_file(path)
+        except (OSError, EOFError) as e:
+            self.send_error(500, f"ファイルを展開できませんでした。{str(e)}")
+            return None
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; charset=utf-8")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        return io.BytesIO(data)
+
+def serve_logs(log_dir: str = "log", host: str = "127.0.0.1", port: int = 8000) -> None:
+    """ログフォルダをHTTPで公開する. 圧縮されたファイルは展開して返す"""
+    handler = functools.partial(DecompressingRequestHandler, directory=log_dir)
+    with ThreadingHTTPServer((host, port), handler) as server:
+        print(f"http://{host}:{server.server_address[1]}/ でログを公開しています。Ctrl+Cで終了します。")
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
@@ -0,0 +1,114 @@
+import io
+import os
+import shutil
+import threading
+from typing import Optional
+
+from .runner_defines import OutputInfo
+from .file_hasher import DEFAULT_HASH_ALGORITHM, new_hash, calculate_file_hash
+from .compression import get_compressed_path, open_compressed, COPY_CHUNK_SIZE
+
+# open_output_streamで書き込まれたファイルの情報. ワーカー内でテストケースの終了時に取り出す
+_stream_infos: dict[str, OutputInfo] = {}
+_stream_infos_lock = threading.Lock()
+# 実行中のテストケースで使うハッシュ関数と圧縮形式. ワーカーのスレッドごとに設定する
+_local = threading.local()
+
+def configure_output(algorithm: str, compression: Optional[str] = None) -> None:
+    _local.algorithm = algorithm
+    _local.compression = compression
+
+def get_hash_algorithm() -> str:
+    return getattr(_local, "algorithm", DEFAULT_HASH_ALGORITHM)
+
+def get_log_compression() -> Optional[str]:
+    return getattr(_local, "compression", None)
+
+class HashingFileIO(io.RawIOBase):
+    """書き込みながらハッシュ値とサイズを計算するファイル
+
+    圧縮して保存する場合も、ハッシュ値とサイズは圧縮前の内容から計算する
+    """
+    def __init__(self, path: str, algorithm: str, compression: Optional[str] = None) -> None:
+        super().__init__()
+        self.path = path
+        self.output_path = get_compressed_path(path, compression)
+        self.algorithm = algorithm
+        self._hash_obj = new_hash(algorithm)
+        self._file = open_compressed(self.output_path, "wb", compression)
+        self.size = 0
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, b) -> int: # type: ignore[override]
+        written = self._file.write(b)
+        self._hash_obj.update(memoryview(b)[:written])
+        self.size += written
+        return written
+
+    def close(self) -> None:
+        if not self.closed:
+            self._file.close()
+            with _stream_infos_lock:
+                _stream_infos[os.path.abspath(self.path)] = self.info()
+        super().close()
+
+    def info(self) -> OutputInfo:
+        return OutputInfo(self.output_path, self.size, self._hash_obj.hexdigest(), self.algorithm)
+
+def open_output_stream(path: str) -> io.TextIOWrapper:
+    """ハッシュ値を計算しながら書き込むテキストファイルを開く
+
+    testcase_handlerの中で標準出力などのファイルに直接書き込むときに使うと、
+    書き込み後にファイルを読み直してハッシュ値を計算する必要がなくなる
+    log_compressionが指定されている場合は、圧縮しながら書き込む
+    """
+    raw = HashingFileIO(path, get_hash_algorithm(), get_log_compression())
+    return io.TextIOWrapper(io.BufferedWriter(raw, buffer_size=1 << 20))
+
+def write_output(path: str, text: str) -> OutputInfo:
+    """文字列をファイルに書き込み、その情報を返す"""
+    with open_output_stream(path) as f:
+        f.write(text)
+    info = pop_output_info(path)
+    assert info is not None, "書き込んだファイルの情報がないよ"
+    return info
+
+def pop_output_info(path: str) -> Optional[OutputInfo]:
+    """open_output_streamで書き込まれたファイルの情報を取り出す"""
+    with _stream_infos_lock:
+        info = _stream_infos.pop(os.path.abspath(path), None)
+    if info is not None and info.algorithm != get_hash_algorithm():
+        return None # 別のハッシュ関数で計算されたものは使えない
+    return info
+
+def hash_output(path: str) -> OutputInfo:
+    """書き込み済みのファイルのハッシュ値を計算する"""
+    algorithm = get_hash_algorithm()
+    return OutputInfo(path, os.path.getsize(path), calculate_file_hash(path, algorithm), algorithm)
+
+def compress_output(path: str, compression: str) -> OutputInfo:
+    """書き込み済みのファイルを、ハッシュ値を計算しながら圧縮する. 元のファイルは消す"""
+    with open(path, mode="rb") as fin, HashingFileIO(path, get_hash_algorithm(), compression) as fout:
+        shutil.copyfileobj(fin, fout, COPY_CHUNK_SIZE)
+    os.remove(path)
+    info = pop_output_info(path)
+    assert info is not None, "圧縮したファイルの情報がないよ"
+    return info
+
+def collect_output(path: str) -> Optional[OutputInfo]:
+    """ハンドラが書き込んだファイルの情報を返す. ファイルがなければNone"""
+    info = pop_output_info(path)
+    if info is not None:
+        return info
+    if not os.path.exists(path):
+        return None
+    compression = get_log_compression()
+    if compression is not None:
+        return compress_output(path, compression)
+    return hash_output(path)
+
+__all__ = [
+    "open_output_stream",
+]
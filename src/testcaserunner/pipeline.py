@@ -0,0 +1,136 @@
+import time
+import dataclasses
+from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor, Future, wait, FIRST_COMPLETED
+from typing import Any, Callable, Iterable, Iterator, Optional, Self
+
+from .runner_defines import TestCase, TestCaseResult, ResultStatus
+from .logger import RunnerLogger
+from .testccase_executor import TestcaseExecutor
+
+logger = RunnerLogger("VerificationPipeline")
+
+def merge_verification(solved: TestCaseResult, verified: TestCaseResult, verify_time: float) -> TestCaseResult:
+    """ソルバーの結果に検証の結果を重ねる. ステータスは検証の結果を使い、同じ名前の値は検証の値で上書きする"""
+    attribute = {**solved.attribute, **verified.attribute, "verify_time": verify_time}
+    return dataclasses.replace(solved, error_status=verified.error_status, attribute=attribute)
+
+def run_verification(verifier: Callable[[TestCase, TestCaseResult], TestCaseResult], testcase: TestCase,
+                     result: TestCaseResult) -> TestCaseResult:
+    """検証用のワーカーで1つのテストケースを検証する"""
+    # 出力ファイルが圧縮されている場合は、実際に書き込んだファイルを渡す
+    testcase = dataclasses.replace(
+        testcase,
+        stdout_file_path=result.stdout_info.path if result.stdout_info is not None else testcase.stdout_file_path,
+        stderr_file_path=result.stderr_info.path if result.stderr_info is not None else testcase.stderr_file_path,
+    )
+    start_time = time.perf_counter_ns()
+    try:
+        verified = verifier(testcase, result)
+    except Exception as e:
+        logger.warning(f"テストケース{testcase.testcase_name}の検証中に例外が発生しました。\n{str(e)}")
+        verified = TestCaseResult(error_status=ResultStatus.IE)
+    return merge_verification(result, verified, (time.perf_counter_ns() - start_time) / 1e9)
+
+def finished_future(result: TestCaseResult) -> Future:
+    future: Future = Future()
+    future.set_result(result)
+    return future
+
+class PipelineTestcaseExecutor(TestcaseExecutor):
+    """1段目のExecutorで終わったテストケースから順に、2段目の検証用のプロセスプールに投入するExecutor
+
+    ソルバーの実行と検証を別々のプールで同時に進める. 結果を受け取る関数には検証まで終わった結果を渡す
+    ソルバーの結果がACでないテストケースは検証しない
+    """
+    POLL_INTERVAL = 0.2 # 1段目が終わった後、キャンセルを確かめる間隔(秒)
+
+    def __init__(self, solver_executor: TestcaseExecutor,
+                 verifier: Callable[[TestCase, TestCaseResult], TestCaseResult], verifier_workers: Optional[int] = None):
+        super().__init__(0)
+        self._status = self.NOT_START
+        self._solver_executor = solver_executor
+        self._verifier = verifier
+        self._verifier_workers = verifier_workers
+        self._submitted_cases: list[TestCase] = []
+        # 同じテストケースを繰り返し投入する場合があるので、テストケースごとに投入した順に持つ
+        self._verifications: defaultdict[TestCase, list[Future]] = defaultdict(list)
+        self._running: dict[Future, TestCase] = {}
+        solver_executor.add_result_listener(self.verify)
+
+    @property
+    def interrupted(self) -> bool:
+        return self._solver_executor.interrupted
+
+    def add_interrupt_listener(self, listener: Callable[[], None]) -> None:
+        self._solver_executor.add_interrupt_listener(listener)
+
+    def verify(self, testcase: TestCase, result: TestCaseResult) -> None:
+        """1段目で終わったテストケースを検証用のプールに投入する"""
+        if result.error_status == ResultStatus.AC:
+            future = self._pool.submit(run_verification, self._verifier, testcase, result)
+            self._running[future] = testcase
+        else:
+            future = finished_future(result)
+            self.notify_result(testcase, result)
+        self._verifications[testcase].append(future)
+        self.notify_verified([future for future in self._running if future.done()])
+
+    def notify_verified(self, done: Iterable[Future]) -> None:
+        for future in done:
+            testcase = self._running.pop(future)
+            if not future.cancelled():
+                self.notify_result(testcase, future.result())
+
+    def submit(self, testcase_handler: Callable[[TestCase], Any], test_cases: Iterable[TestCase]) -> None:
+        if self._status != self.STARTED:
+            raise ValueError("使い方間違ってるよ")
+        def record() -> Iterator[TestCase]:
+            for testcase in test_cases:
+                self._submitted_cases.append(testcase)
+                yield testcase
+        self._solver_executor.submit(testcase_handler, record())
+        self._status = self.SUBMITTED
+
+    def wait_and_get_results(self) -> list[Optional[TestCaseResult]]:
+        if self._status != self.SUBMITTED:
+            raise ValueError("使い方間違ってるよ")
+        solved = self._solver_executor.wait_and_get_results()
+        # 1段目が終わったら、残りの検証を待つ
+        while self._running and not self.interrupted:
+            done, _ = wait(set(self._running), timeout=self.POLL_INTERVAL, return_when=FIRST_COMPLETED)
+            self.notify_verified(done)
+        for future in self._running:
+            future.cancel()
+        self._running.clear()
+
+        results: list[Optional[TestCaseResult]] = []
+        for testcase, result in zip(self._submitted_cases, solved):
+            if result is None:
+                results.append(None)
+                continue
+            future = self._verifications[testcase].pop(0)
+            # キャンセルされて検証していないテストケースの結果はNoneにする
+            results.append(future.result() if future.done() and not future.cancelled() else None)
+        self._submitted_cases = []
+        self._verifications.clear()
+        self._status = self.STARTED # 続けて投入できるようにする
+        return results
+
+    def __enter__(self) -> Self:
+        self._status = self.STARTED
+        self._pool = ProcessPoolExecutor(max_workers=self._verifier_workers)
+        # 検証用のワーカーはソルバーを起動する前にまとめて起動しておく(fork方式では最初の投入で全て起動する)
+        # ソルバーのスレッドが子プロセスを起動している最中にforkすると、子プロセスとのパイプを引き継いで待ち合わせが終わらなくなる
+        self._pool.submit(time.perf_counter).result()
+        self._solver_executor.__enter__()
+        return self
+
+    def __exit__(self, exc_type: Optional[type[BaseException]], exc_val: Optional[BaseException],
+                 exc_tb: Optional[BaseException]) -> None:
+        self._solver_executor.__exit__(exc_type, exc_val, exc_tb)
+        self._pool.shutdown(cancel_futures=True)
+
+__all__ = [
+    "PipelineTestcaseExecutor",
+]
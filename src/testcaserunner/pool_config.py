@@ -0,0 +1,89 @@
+import os
+import multiprocessing
+from queue import Empty
+from dataclasses import dataclass
+from multiprocessing.queues import Queue
+from typing import Any, Optional
+
+@dataclass
+class ProcessPoolConfig:
+    """プロセスプールのワーカーの起動方法とCPUの割り当ての設定"""
+    start_method: Optional[str] = None             # 'fork', 'spawn', 'forkserver'. Noneならmultiprocessingの既定
+    preload_modules: Optional[list[str]] = None    # forkserverで先に読み込むモジュール. Noneならtestcaserunnerとハンドラのモジュール
+    pin_workers: bool = False                      # ワーカーごとに別の物理コアに固定するかどうか
+    use_smt_siblings: bool = False                 # 固定するときに、同じ物理コアの別の論理CPUも使うかどうか
+
+    def validate(self) -> None:
+        if self.start_method is not None and self.start_method not in multiprocessing.get_all_start_methods():
+            raise ValueError(f"start_methodには{multiprocessing.get_all_start_methods()}のいずれかを指定してください。")
+        if self.preload_modules is not None and self.start_method != "forkserver":
+            raise ValueError("preload_modulesはstart_methodが'forkserver'の場合にのみ指定できます。")
+        if self.pin_workers and not hasattr(os, "sched_setaffinity"):
+            raise ValueError("この環境ではワーカーをCPUに固定できません。")
+
+    def get_context(self) -> Any:
+        """ProcessPoolExecutorのmp_contextに渡すコンテキスト. 指定がなければNone"""
+        if self.start_method is None:
+            return None
+        context = multiprocessing.get_context(self.start_method)
+        if self.start_method == "forkserver" and self.preload_modules:
+            # forkserverがまだ起動していない場合にだけ効く
+            context.set_forkserver_preload(self.preload_modules)
+        return context
+
+def get_physical_cores() -> list[list[int]]:
+    """このプロセスが使える論理CPUを物理コアごとにまとめて返す
+
+    トポロジーが読めない環境(Linux以外など)では、論理CPUをそれぞれ1つの物理コアとみなす
+    """
+    if hasattr(os, "sched_getaffinity"):
+        allowed = sorted(os.sched_getaffinity(0))
+    else:
+        allowed = list(range(os.cpu_count() or 1))
+    cores: dict[tuple[str, str], list[int]] = {}
+    for cpu in allowed:
+        topology = f"/sys/devices/system/cpu/cpu{cpu}/topology"
+        try:
+            with open(os.path.join(topology, "physical_package_id"), mode="r") as f:
+                package = f.read().strip()
+            with open(os.path.join(topology, "core_id"), mode="r") as f:
+                core = f.read().strip()
+        except OSError:
+            package, core = "", str(cpu)
+        cores.setdefault((package, core), []).append(cpu)
+    return sorted(cores.values())
+
+def select_worker_cpus(max_workers: Optional[int], use_smt_siblings: bool) -> list[int]:
+    """ワーカーを固定する論理CPUを選ぶ. SMTの兄弟を使わない場合は物理コアごとに1つだけ選ぶ"""
+    cores = get_physical_cores()
+    if use_smt_siblings:
+        cpus = [cpu for core in cores for cpu in core]
+    else:
+        cpus = [core[0] for core in cores]
+    if max_workers is None:
+        return cpus
+    if max_workers > len(cpus):
+        raise ValueError(f"ワーカーを固定できるCPUは{len(cpus)}個なので、max_workersは{len(cpus)}以下にしてください。")
+    return cpus[:max_workers]
+
+def make_cpu_queue(context: Any, cpus: list[int]) -> Queue:
+    """ワーカーが起動時に1つずつ取り出す論理CPUの待ち行列を作る"""
+    queue = (context or multiprocessing).Queue()
+    for cpu in cpus:
+        queue.put(cpu)
+    return queue
+
+def pin_current_process(cpu_queue: Queue) -> None:
+    """待ち行列から論理CPUを1つ取り出し、このプロセスをそのCPUに固定する
+
+    起動し直したワーカーなど、取り出せるCPUが残っていない場合は固定しない
+    """
+    try:
+        cpu = cpu_queue.get(timeout=1)
+    except Empty:
+        return
+    os.sched_setaffinity(0, {cpu})
+
+__all__ = [
+    "ProcessPoolConfig",
+]
@@ -0,0 +1,277 @@
+import os
+import sys
+import time
+import signal
+import asyncio
+import subprocess
+import threading
+from collections import defaultdict
+from dataclasses import dataclass
+from typing import Any, Callable, Optional, Self
+
+try:
+    import resource
+except ImportError: # Windowsにはresourceモジュールがない
+    resource = None # type: ignore[assignment]
+
+@dataclass
+class ResourceUsage:
+    """プロセスの資源使用量"""
+    cpu_user: float        # ユーザーCPU時間(秒)
+    cpu_sys: float         # システムCPU時間(秒)
+    max_rss: Optional[int] # 最大常駐メモリ(KiB), 分からない場合はNone
+    ctx_voluntary: int     # 自発的コンテキストスイッチ回数
+    ctx_involuntary: int   # 非自発的コンテキストスイッチ回数
+
+    columns = ("cpu_user", "cpu_sys", "max_rss", "ctx_voluntary", "ctx_involuntary")
+
+    @classmethod
+    def from_rusage(cls, usage: Any) -> "ResourceUsage":
+        max_rss = usage.ru_maxrss
+        if sys.platform == "darwin":
+            max_rss //= 1024 # macOSではバイト単位
+        return cls(usage.ru_utime, usage.ru_stime, max_rss, usage.ru_nvcsw, usage.ru_nivcsw)
+
+    def __sub__(self, other: "ResourceUsage") -> "ResourceUsage":
+        # 最大常駐メモリは差分を取れないのでNoneにする
+        return ResourceUsage(
+            self.cpu_user - other.cpu_user,
+            self.cpu_sys - other.cpu_sys,
+            None,
+            self.ctx_voluntary - other.ctx_voluntary,
+            self.ctx_involuntary - other.ctx_involuntary,
+        )
+
+    def __add__(self, other: "ResourceUsage") -> "ResourceUsage":
+        return ResourceUsage(
+            self.cpu_user + other.cpu_user,
+            self.cpu_sys + other.cpu_sys,
+            None,
+            self.ctx_voluntary + other.ctx_voluntary,
+            self.ctx_involuntary + other.ctx_involuntary,
+        )
+
+    def to_attribute(self) -> dict[str, int | float]:
+        attribute: dict[str, int | float] = {
+            "cpu_user": self.cpu_user,
+            "cpu_sys": self.cpu_sys,
+        }
+        if self.max_rss is not None:
+            attribute["max_rss"] = self.max_rss
+        attribute["ctx_voluntary"] = self.ctx_voluntary
+        attribute["ctx_involuntary"] = self.ctx_involuntary
+        return attribute
+
+def get_process_usage() -> Optional[ResourceUsage]:
+    """自プロセスと回収済みの子プロセスの資源使用量の合計を返す
+
+    resourceモジュールが使えない環境ではNoneを返す
+    """
+    if resource is None:
+        return None
+    usage_self = ResourceUsage.from_rusage(resource.getrusage(resource.RUSAGE_SELF))
+    usage_children = ResourceUsage.from_rusage(resource.getrusage(resource.RUSAGE_CHILDREN))
+    return usage_self + usage_children
+
+def get_cpu_times() -> tuple[float, float]:
+    """自プロセスと回収済みの子プロセスのCPU時間(秒)を返す
+
+    resourceモジュールが使えない環境では、子プロセスのCPU時間は0とする
+    """
+    if resource is None:
+        return time.process_time(), 0.0
+    usage = resource.getrusage(resource.RUSAGE_CHILDREN)
+    return time.process_time(), usage.ru_utime + usage.ru_stime
+
+def get_children_max_rss() -> Optional[int]:
+    """回収済みの子プロセスの最大常駐メモリ(KiB)を返す
+
+    これまでに回収した子プロセス全体での最大値なので、増えたときだけ直前の子プロセスの値とみなせる
+    """
+    if resource is None:
+        return None
+    return ResourceUsage.from_rusage(resource.getrusage(resource.RUSAGE_CHILDREN)).max_rss
+
+# メモリ確保に失敗したときに標準エラー出力に出る文言
+MEMORY_ERROR_MESSAGES = (
+    b"MemoryError",
+    b"bad_alloc",
+    b"memory allocation of",
+    b"out of memory",
+    b"Cannot allocate memory",
+)
+MEMORY_ERROR_TAIL_SIZE = 4096 # 標準エラー出力の末尾のこのバイト数だけを見る
+
+def is_memory_error_output(stderr: bytes) -> bool:
+    """標準エラー出力の末尾にメモリ確保の失敗が出ているかどうか
+
+    アドレス空間の上限を超えたプロセスはシグナルではなくメモリ確保の失敗で終了するので、出力から判定する
+    """
+    tail = stderr[-MEMORY_ERROR_TAIL_SIZE:]
+    return any(message in tail for message in MEMORY_ERROR_MESSAGES)
+
+def apply_memory_limit(pid: int, memory_limit: Optional[int]) -> None:
+    """起動済みのプロセスのアドレス空間の上限(MiB)を設定する
+
+    起動してから設定するまでに確保したメモリは制限されない. 設定できない環境では何もしない
+    """
+    if memory_limit is None or resource is None or not hasattr(resource, "prlimit"):
+        return
+    limit = memory_limit * 1024 * 1024
+    try:
+        resource.prlimit(pid, resource.RLIMIT_AS, (limit, limit))
+    except ProcessLookupError: # 既に終了している
+        pass
+
+def limit_memory_command(cmd: list[str], memory_limit: Optional[int]) -> list[str]:
+    """アドレス空間の上限(MiB)を設定してからcmdを実行するコマンドを返す
+
+    preexec_fnはスレッドと同時に使うと安全でなく、apply_memory_limitは起動してから設定するまでの間が空くので、
+    起動を待つ間に他の処理が進むasyncioでは、シェルで上限を設定してからexecする. POSIX以外ではcmdをそのまま返す
+    """
+    if memory_limit is None or os.name != "posix":
+        return cmd
+    return ["/bin/sh", "-c", f'ulimit -v {memory_limit * 1024} 2>/dev/null; exec "$@"', "sh", *cmd]
+
+def wait_process(proc: subprocess.Popen) -> tuple[int, Optional[ResourceUsage]]:
+    """プロセスの終了を待ち、終了コードと資源使用量を返す
+
+    wait4が使える環境ではプロセスとその子孫の資源使用量も取得する
+    """
+    if not hasattr(os, "wait4"):
+        return proc.wait(), None
+    try:
+        _, status, usage = os.wait4(proc.pid, 0)
+    except ChildProcessError:
+        return proc.wait(), None
+    proc.returncode = os.waitstatus_to_exitcode(status)
+    return proc.returncode, ResourceUsage.from_rusage(usage)
+
+class Watchdog:
+    """制限時間を過ぎたらコールバックを呼ぶタイマー
+
+    withブロックを抜けるとタイマーは止まる
+    """
+    def __init__(self, time_limit: Optional[float], on_timeout: Callable[[], None]) -> None:
+        self.time_limit = time_limit
+        self.on_timeout = on_timeout
+        self.expired = False
+        self._timer: Optional[threading.Timer] = None
+
+    def _fire(self) -> None:
+        self.expired = True
+        self.on_timeout()
+
+    def __enter__(self) -> Self:
+        if self.time_limit is not None:
+            self._timer = threading.Timer(self.time_limit, self._fire)
+            self._timer.daemon = True
+            self._timer.start()
+        return self
+
+    def __exit__(self, *args: Any) -> None:
+        if self._timer is not None:
+            self._timer.cancel()
+
+class TimeLimitExceeded(BaseException):
+    """制限時間を過ぎたときに、実行中のハンドラの中で送出される例外
+
+    ハンドラのexcept Exceptionで握りつぶされないように、BaseExceptionを継承する
+    """
+
+class Alarm:
+    """制限時間を過ぎたら、メインスレッドで実行中の処理にTimeLimitExceededを送出するタイマー
+
+    SIGALRMを使うので、メインスレッド以外とSIGALRMがない環境では何もしない
+    Cの処理の途中では送出されず、Pythonに戻ったところで送出される
+    on_timeoutは送出する前に呼ぶ. ハンドラがsubprocess.runなどで待っている子プロセスは、
+    例外で回収されると孫プロセスの親が分からなくなるので、ここで終了させる
+    """
+    def __init__(self, time_limit: Optional[float], on_timeout: Optional[Callable[[], None]] = None) -> None:
+        self.time_limit = time_limit
+        self.on_timeout = on_timeout
+        self._previous: Any = None
+        self._active = False
+
+    @staticmethod
+    def available() -> bool:
+        return hasattr(signal, "setitimer") and threading.current_thread() is threading.main_thread()
+
+    def _raise(self, signum: int, frame: Any) -> None:
+        if self.on_timeout is not None:
+            self.on_timeout()
+        raise TimeLimitExceeded()
+
+    def __enter__(self) -> Self:
+        if self.time_limit is not None and self.available():
+            self._previous = signal.signal(signal.SIGALRM, self._raise)
+            self._active = True
+            signal.setitimer(signal.ITIMER_REAL, self.time_limit)
+        return self
+
+    def __exit__(self, *args: Any) -> None:
+        if self._active:
+            self._active = False
+            try:
+                signal.setitimer(signal.ITIMER_REAL, 0)
+            finally:
+                signal.signal(signal.SIGALRM, self._previous)
+
+def new_process_group_options() -> dict[str, Any]:
+    """子プロセスを新しいプロセスグループで起動するためのPopenの引数"""
+    if os.name == "posix":
+        return {"start_new_session": True}
+    return {"creationflags": subprocess.CREATE_NEW_PROCESS_GROUP} # type: ignore[attr-defined]
+
+def kill_process_group(proc: subprocess.Popen | asyncio.subprocess.Process) -> None:
+    """new_process_group_optionsで起動したプロセスをその子孫ごと終了させる"""
+    # wait_processと同時に呼ばれるので、ここではプロセスの回収(poll)はしない
+    if proc.returncode is not None:
+        return
+    try:
+        if os.name == "posix":
+            os.killpg(proc.pid, signal.SIGKILL)
+        else:
+            subprocess.run(["taskkill", "/F", "/T", "/PID", str(proc.pid)],
+                           stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    except ProcessLookupError:
+        pass # すでに終了している
+
+def get_descendant_pids(pid: int, excluded: frozenset[int] = frozenset()) -> list[int]:
+    """子孫プロセスのpidの一覧を返す
+
+    excludedに含まれるプロセスとその子孫は含めない
+    /procが読める環境(Linux)でのみ動作し、それ以外では空のリストを返す
+    """
+    if not os.path.isdir("/proc"):
+        return []
+    children: defaultdict[int, list[int]] = defaultdict(list)
+    for entry in os.listdir("/proc"):
+        if not entry.isdigit():
+            continue
+        try:
+            with open(os.path.join("/proc", entry, "stat"), mode="r") as f:
+                stat = f.read()
+        except OSError:
+            continue
+        # プロセス名に空白や括弧が含まれる場合があるので、最後の')'より後ろを見る
+        fields = stat[stat.rfind(")") + 2:].split()
+        children[int(fields[1])].append(int(entry))
+
+    descendants = []
+    stack = [pid]
+    while stack:
+        for child in children[stack.pop()]:
+            if child in excluded:
+                continue
+            descendants.append(child)
+            stack.append(child)
+    return descendants
+
+def kill_descendants(pid: int, excluded: frozenset[int] = frozenset()) -> None:
+    """子孫プロセスをすべて終了させる. excludedに含まれるプロセスとその子孫は終了させない"""
+    for descendant in get_descendant_pids(pid, excluded):
+        try:
+            os.kill(descendant, signal.SIGKILL)
+        except ProcessLookupError:
+            pass # すでに終了している
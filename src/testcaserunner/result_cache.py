@@ -0,0 +1,202 @@
+import os
+import shutil
+import pickle
+import hashlib
+import tempfile
+import functools
+import types
+from collections import defaultdict
+from dataclasses import replace
+from pathlib import Path
+from typing import Any, Optional
+
+from .runner_defines import TestCase, TestCaseResult, ResultStatus
+from .logger import RunnerLogger
+from .file_hasher import FileHasher, calculate_file_hash
+from .compression import get_compressed_path
+
+class ResultCache:
+    """テストケースの結果のキャッシュ
+
+    ソルバーのフィンガープリントと入力ファイルのハッシュ値をキーにして、
+    TestCaseResultと標準出力/標準エラー出力のファイルを保存する
+    合計サイズが上限を超えたら、最後に使われたのが古いものから消す
+    """
+    logger = RunnerLogger("ResultCache")
+    result_file = "result.pickle"
+    stdout_file = "stdout"
+    stderr_file = "stderr"
+    # 実行環境の問題で起きた可能性が高いので保存しないステータス
+    uncached_statuses = (ResultStatus.IE, ResultStatus.CAN)
+
+    def __init__(self, cache_dir: str, fingerprint: str, size_limit: int, debug: bool = False,
+                 log_compression: Optional[str] = None, hasher: Optional[FileHasher] = None) -> None:
+        if debug:
+            self.logger.enable_debug_mode()
+        self.cache_dir = cache_dir
+        self.fingerprint = fingerprint
+        self.size_limit = size_limit
+        self.log_compression = log_compression # 出力ファイルは圧縮されたまま保存する
+        # ログを作るときと同じFileHasherを使えば、入力ファイルのハッシュ値を計算し直さない
+        self.hasher = hasher if hasher is not None else FileHasher()
+        self.keys: dict[int, str] = {}
+        os.makedirs(self.cache_dir, exist_ok=True)
+
+    def make_keys(self, test_cases: list[TestCase]) -> None:
+        # 同じ入力ファイルを複数回実行する場合は何回目かもキーに含める
+        counter: defaultdict[str, int] = defaultdict(int)
+        input_hashes = self.hasher.hash_files([testcase.input_file_path for testcase in test_cases])
+        for testcase in test_cases:
+            input_hash = input_hashes[testcase.input_file_path]
+            occurrence = counter[input_hash]
+            counter[input_hash] += 1
+            key_source = f"{self.fingerprint}.{input_hash}.{occurrence}"
+            self.keys[testcase.testcase_index] = hashlib.sha256(key_source.encode()).hexdigest()
+
+    def entry_path(self, testcase: TestCase) -> str:
+        return os.path.join(self.cache_dir, self.keys[testcase.testcase_index])
+
+    @logger.function_tracer
+    def load(self, test_cases: list[TestCase]) -> dict[int, TestCaseResult]:
+        """キャッシュにあるテストケースの結果を返し、出力ファイルをログフォルダに復元する"""
+        self.make_keys(test_cases)
+        results: dict[int, TestCaseResult] = {}
+        for testcase in test_cases:
+            entry = self.entry_path(testcase)
+            try:
+                with open(os.path.join(entry, self.result_file), mode="rb") as f:
+                    result: TestCaseResult = pickle.load(f)
+                self.restore_file(os.path.join(entry, self.stdout_file), self.get_output_path(testcase.stdout_file_path))
+                self.restore_file(os.path.join(entry, self.stderr_file), self.get_output_path(testcase.stderr_file_path))
+                os.utime(entry) # 最後に使われた時刻を更新する
+            except (OSError, pickle.UnpicklingError, EOFError, AttributeError):
+                continue # キャッシュにない、または壊れている
+            results[testcase.testcase_index] = result
+        self.logger.debug(f"{len(results)}/{len(test_cases)} testcases are loaded from cache.")
+        return results
+
+    def get_output_path(self, path: str) -> str:
+        return get_compressed_path(path, self.log_compression)
+
+    def restore_file(self, src: str, dst: str) -> None:
+        if os.path.exists(src):
+            shutil.copy(src, dst)
+
+    def store(self, testcase: TestCase, result: TestCaseResult) -> None:
+        """テストケースの結果をキャッシュに保存する"""
+        if result.error_status in self.uncached_statuses:
+            return
+        entry = self.entry_path(testcase)
+        # 書きかけのエントリが読まれないように、一時フォルダに書いてから名前を変える
+        work_dir = tempfile.mkdtemp(dir=self.cache_dir, prefix=".tmp")
+        try:
+            for path, name in ((testcase.stdout_file_path, self.stdout_file), (testcase.stderr_file_path, self.stderr_file)):
+                src = self.get_output_path(path)
+                if os.path.exists(src):
+                    shutil.copy(src, os.path.join(work_dir, name))
+            with open(os.path.join(work_dir, self.result_file), mode="wb") as f:
+                # 出力の中身はファイルとして保存するので、文字列は持たない
+                pickle.dump(replace(result, stdout="", stderr=""), f)
+            shutil.rmtree(entry, ignore_errors=True)
+            os.replace(work_dir, entry)
+        except OSError as e:
+            self.logger.warning(f"キャッシュの保存に失敗しました。\n{str(e)}")
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+    @logger.function_tracer
+    def evict(self) -> None:
+        """合計サイズが上限以下になるまで、最後に使われたのが古いエントリから消す"""
+        entries = []
+        total = 0
+        for entry in Path(self.cache_dir).iterdir():
+            if not entry.is_dir() or entry.name.startswith(".tmp"):
+                continue
+            size = sum(file.stat().st_size for file in entry.iterdir())
+            entries.append((entry.stat().st_mtime, size, entry))
+            total += size
+        for _, size, entry in sorted(entries):
+            if total <= self.size_limit:
+                break
+            shutil.rmtree(entry, ignore_errors=True)
+            total -= size
+
+def stable_repr(value: Any) -> str:
+    """実行ごとに変わらない値の文字列表現を返す. メモリ上のアドレスを含む表現になる値はValueErrorにする"""
+    if isinstance(value, dict):
+        pairs = sorted((stable_repr(key), stable_repr(item)) for key, item in value.items())
+        return "{" + ", ".join(f"{key}: {item}" for key, item in pairs) + "}"
+    if isinstance(value, (list, tuple, set, frozenset)):
+        items = [stable_repr(item) for item in value]
+        if isinstance(value, (set, frozenset)):
+            items.sort()
+        return f"{type(value).__name__}({', '.join(items)})"
+    if callable(value):
+        return handler_identity(value)
+    if type(value).__repr__ is object.__repr__:
+        raise ValueError(f"{type(value).__qualname__}の値は実行ごとに変わらない文字列にできません。")
+    return repr(value)
+
+def code_digest(code: types.CodeType) -> str:
+    """関数の中身のハッシュ値を返す. 関数の中で定義された関数やlambdaの中身も含める"""
+    hash_obj = hashlib.sha256(code.co_code)
+    hash_obj.update(repr(code.co_names).encode())
+    for const in code.co_consts:
+        if isinstance(const, types.CodeType):
+            hash_obj.update(code_digest(const).encode())
+        else:
+            hash_obj.update(stable_repr(const).encode())
+    return hash_obj.hexdigest()
+
+def function_digest(function: Any, visiting: frozenset[int] = frozenset()) -> str:
+    """関数の中身と、結果に影響するデフォルト引数とクロージャの値から作ったハッシュ値を返す
+
+    同じ名前になるlambdaや関数の中で定義された関数を区別し、関数を書き換えたことを検出する
+    visitingはたどっている途中の関数で、再帰する関数のクロージャで無限に再帰しないようにする
+    """
+    visiting = visiting | {id(function)}
+    hash_obj = hashlib.sha256(code_digest(function.__code__).encode())
+    hash_obj.update(stable_repr(getattr(function, "__defaults__", None)).encode())
+    hash_obj.update(stable_repr(getattr(function, "__kwdefaults__", None)).encode())
+    for cell in getattr(function, "__closure__", None) or ():
+        try:
+            contents = cell.cell_contents
+        except ValueError: # まだ値が入っていない
+            contents = None
+        if isinstance(contents, types.FunctionType):
+            digest = contents.__qualname__ if id(contents) in visiting else function_digest(contents, visiting)
+            hash_obj.update(digest.encode())
+        else:
+            hash_obj.update(stable_repr(contents).encode())
+    return hash_obj.hexdigest()
+
+def handler_identity(handler: Any) -> str:
+    """ハンドラを識別する文字列を返す. 実行ごとに変わらないように、メモリ上のアドレスは含めない
+
+    関数は名前と中身のハッシュ値から、functools.partialは元の関数と引数から作る. 識別できないハンドラはValueErrorにする
+    """
+    if isinstance(handler, functools.partial):
+        args = [stable_repr(arg) for arg in handler.args]
+        args += [f"{name}={stable_repr(value)}" for name, value in sorted(handler.keywords.items())]
+        return f"partial({handler_identity(handler.func)}, {', '.join(args)})"
+    qualname = getattr(handler, "__qualname__", None)
+    if isinstance(qualname, str):
+        identity = f"{getattr(handler, '__module__', '')}.{qualname}"
+        if isinstance(getattr(handler, "__code__", None), types.CodeType):
+            identity += f"@{function_digest(handler)}"
+        return identity
+    # 呼び出し可能なインスタンスは、__repr__を定義している場合だけその文字列を使う
+    if type(handler).__repr__ is object.__repr__:
+        raise ValueError(f"ハンドラ{type(handler).__qualname__}を識別できないので、引数solver_fingerprintを指定してください。")
+    return f"{type(handler).__module__}.{repr(handler)}"
+
+def make_fingerprint(identity: str, files: list[str]) -> str:
+    """ソルバーのフィンガープリントを作る
+
+    ハンドラを識別する文字列とファイルの中身から計算する
+    """
+    hash_obj = hashlib.sha256(identity.encode())
+    for file in sorted(files):
+        if os.path.isfile(file):
+            hash_obj.update(file.encode())
+            hash_obj.update(calculate_file_hash(file).encode())
+    return hash_obj.hexdigest()
@@ -1,22 +1,42 @@
-import glob
 import os
-from typing import Callable
+import pickle
+import functools
+from typing import Callable, Any, Iterator
 import time
 from typing import Optional
 import shutil
 from pathlib import Path
 import datetime
+import dataclasses
+import multiprocessing
 from dataclasses import dataclass
 
 from .runner_defines import TestCase, TestCaseResult, ResultStatus, NoTestcaseFileException, InvalidPathException
 from .logger import RunnerLogger
-from .testccase_executor import TestcaseExecutor, ProcessTestcaseExecutor, ThreadTestcaseExecutor, SingleTestcaseExecutor
+from .testccase_executor import TestcaseExecutor, PoolTestcaseExecutor, ProcessTestcaseExecutor, ThreadTestcaseExecutor, \
+    SingleTestcaseExecutor, CommandTestcaseExecutor, SharedPool, SharedPoolTestcaseExecutor
+from .command_handler import CommandTestcaseHandler
+from .worker_context import WorkerLifecycle
+from .testcase_worker import TestcaseWorker, run_installed_testcase, run_shared_testcase
+from .benchmark import BenchmarkConfig, BenchmarkController
+from .result_cache import ResultCache, make_fingerprint, handler_identity
+from .scheduler import TestcaseScheduler, SortedTestcaseScheduler, LptTestcaseScheduler, InterleavedTestcaseScheduler
 from .html_builder import make_html
 from .testcase_logger import make_log
+from .file_hasher import FileHasher, new_hash
+from .blob_store import BlobStore, get_blob_root
+from .compression import validate_compression
+from .discovery import TestcaseDiscovery
+from .sharding import TestcaseSharder, HashTestcaseSharder, CostTestcaseSharder
+from .distributed import DistributedConfig, DistributedTestcaseExecutor
+from .async_executor import AsyncTestcaseExecutor
+from .auto_executor import AutoTestcaseExecutor
+from .pool_config import ProcessPoolConfig, get_physical_cores, select_worker_cpus
+from .pipeline import PipelineTestcaseExecutor
 
 @dataclass
 class TestCaseRunner:
-    testcase_handler: Callable[[TestCase], TestCaseResult]
+    testcase_handler: Callable[..., TestCaseResult]
     input_file_path: str
     log_folder_name: str
     repeat_count: int
@@ -25,19 +45,81 @@ class TestCaseRunner:
     stdout_file_output: bool
     stderr_file_output: bool
     debug: bool
+    time_limit: Optional[float] = None
+    memory_limit: Optional[int] = None
+    scheduling_method: str = "sorted"
+    use_cache: bool = False
+    solver_fingerprint: Optional[str] = None
+    cache_size_limit: int = 1024
+    benchmark: Optional[BenchmarkConfig] = None
+    worker_setup: Optional[Callable[[], Any]] = None
+    worker_teardown: Optional[Callable[[Any], None]] = None
+    keep_output: bool = False
+    hash_algorithm: str = "sha256"
+    dedup_storage: bool = False
+    log_compression: Optional[str] = None
+    include_patterns: Optional[list[str]] = None
+    exclude_patterns: Optional[list[str]] = None
+    recursive: bool = False
+    shard_index: int = 0
+    shard_count: int = 1
+    sharding_method: str = "hash"
+    distributed: Optional[DistributedConfig] = None
+    shared_pool: Optional[SharedPool] = None # 複数の実行で使い回すプール
+    async_concurrency: Optional[int] = None
+    max_workers: Optional[int] = None
+    process_pool: Optional[ProcessPoolConfig] = None
+    verifier: Optional[Callable[[TestCase, TestCaseResult], TestCaseResult]] = None
+    verifier_workers: Optional[int] = None
     def __post_init__(self) -> None:
         self.logger = RunnerLogger("TestCaseRunner")
+        self.result_listeners: list[Callable[[TestCase, TestCaseResult], None]] = []
+        self.auto_executor: Optional[AutoTestcaseExecutor] = None # 'auto'で実行方法を選んだExecutor
         self.init_parameters()
         self.init_folders()
         if self.debug:
             self.logger.enable_debug_mode()
-        self.input_file_path = self.input_file_copy_path
+        self.file_hasher = FileHasher(self.hash_algorithm) # キャッシュのキーとログで同じファイルを計算し直さない
+        self.cache = self.make_cache() if self.use_cache else None
+        # 実行ごとにワーカーの初期化やプールの設定が必要な場合は、使い回しているプールは使えない
+        self.use_shared_pool = self.shared_pool is not None and self.worker_setup is None \
+            and self.max_workers is None and self.process_pool is None and self.shared_pool.accepts(self.Executor)
+        pass_context = self.worker_setup is not None \
+            or (self.use_shared_pool and self.shared_pool is not None and self.shared_pool.has_context)
+        self.worker = TestcaseWorker(
+            self.testcase_handler,
+            self.stdout_file_output,
+            self.stderr_file_output,
+            self.parallel_processing_method.lower() in ("process", "single", "distributed", "auto"),
+            pass_context,
+            self.time_limit,
+            self.memory_limit,
+            self.keep_output,
+            self.hash_algorithm,
+            self.log_compression,
+        )
+        self.lifecycle = WorkerLifecycle(self.worker_setup, self.worker_teardown, self.worker)
+
+    def make_cache(self) -> ResultCache:
+        fingerprint = self.solver_fingerprint
+        if fingerprint is None:
+            if not self.copy_target_files:
+                self.logger.warning("copy_target_filesが空なので、ソルバーの変更をキャッシュに反映できません。")
+            fingerprint = make_fingerprint(handler_identity(self.testcase_handler), self.copy_target_files)
+        # 実行条件が変わると結果も変わるので、キーに含める
+        verifier = handler_identity(self.verifier) if self.verifier is not None else None
+        options = (self.time_limit, self.memory_limit, self.stdout_file_output, self.stderr_file_output, self.log_compression,
+                   verifier)
+        cache_dir = os.path.join(os.path.dirname(self.log_folder_name), ".cache")
+        return ResultCache(cache_dir, f"{fingerprint}.{options}", self.cache_size_limit * 1024 * 1024, self.debug,
+                           self.log_compression, self.file_hasher)
 
     def make_folder(self, path: str) -> None:
         os.makedirs(path, exist_ok=True)
 
-    def copy_folder(self, src: str, dst: str) -> None:
-        shutil.copytree(src, dst)
+    def add_result_listener(self, listener: Callable[[TestCase, TestCaseResult], None]) -> None:
+        """テストケースが終わった順に結果を受け取る関数を登録する"""
+        self.result_listeners.append(listener)
 
     def copy_file(self, src: str, dst: str) -> None:
         shutil.copy(src, dst)
@@ -52,12 +134,22 @@ class TestCaseRunner:
             else:
                 self.logger.warning(f"{file}が見つかりません。コピーは行いません。")
 
+    def copy_input(self, src: str, dst: str) -> None:
+        if self.blob_store is not None:
+            self.blob_store.copy_file(src, dst)
+        else:
+            shutil.copy2(src, dst)
+
     def init_folders(self) -> None:
         self.make_folder(self.log_folder_name)
         self.make_folder(self.stdout_log_path)
         self.make_folder(self.stderr_log_path)
-        self.make_folder(self.stdout_log_path)
-        self.copy_folder(self.input_file_path, self.input_file_copy_path)
+        # 入力ファイルは見つけたときに1つずつコピーする
+        self.make_folder(self.input_file_copy_path)
+        self.blob_store: Optional[BlobStore] = None
+        if self.dedup_storage:
+            blob_root = get_blob_root(os.path.dirname(self.log_folder_name))
+            self.blob_store = BlobStore(blob_root, self.hash_algorithm, self.debug)
         self.copy_files()
 
     def get_executor(self) -> type[TestcaseExecutor]:
@@ -68,100 +160,381 @@ class TestCaseRunner:
                 return ThreadTestcaseExecutor
             case "single":
                 return SingleTestcaseExecutor
+            case "command":
+                return CommandTestcaseExecutor
+            case "distributed":
+                return DistributedTestcaseExecutor
+            case "async":
+                return AsyncTestcaseExecutor
+            case "auto":
+                return AutoTestcaseExecutor
             case _:
                 raise ValueError("引数parallel_processing_methodの値が不正です。")
 
+    def get_scheduler(self) -> TestcaseScheduler:
+        match self.scheduling_method.lower():
+            case "sorted":
+                return SortedTestcaseScheduler()
+            case "lpt":
+                return LptTestcaseScheduler()
+            case "interleaved":
+                return InterleavedTestcaseScheduler()
+            case _:
+                raise ValueError("引数scheduling_methodの値が不正です。")
+
+    def get_sharder(self) -> Optional[TestcaseSharder]:
+        if self.shard_count == 1:
+            return None
+        match self.sharding_method.lower():
+            case "hash":
+                return HashTestcaseSharder(self.shard_index, self.shard_count)
+            case "cost":
+                return CostTestcaseSharder(self.shard_index, self.shard_count, os.path.dirname(self.log_folder_name))
+            case _:
+                raise ValueError("引数sharding_methodの値が不正です。")
+
     def init_parameters(self) -> None:
         self.stdout_log_path = os.path.join(self.log_folder_name, "stdout")
         self.stderr_log_path = os.path.join(self.log_folder_name, "stderr")
         self.input_file_copy_path = os.path.join(self.log_folder_name, "in")
         self.Executor = self.get_executor()
+        self.scheduler = self.get_scheduler()
 
         if self.repeat_count <= 0 or type(self.repeat_count) is not int:
             raise ValueError("引数repeat_countの値は1以上の整数である必要があります。")
+        if self.time_limit is not None and self.time_limit <= 0:
+            raise ValueError("引数time_limitの値は正の数である必要があります。")
+        if self.time_limit is not None and issubclass(self.Executor, ThreadTestcaseExecutor):
+            # スレッドは止められず、ハンドラが起動した子プロセスも他のケースと区別できないので、制限時間を守らせられない
+            raise ValueError("引数time_limitはparallel_processing_methodが'thread'の場合は指定できません。")
+        if self.memory_limit is not None and self.memory_limit <= 0:
+            raise ValueError("引数memory_limitの値は正の数である必要があります。")
+        if self.memory_limit is not None and issubclass(self.Executor, ThreadTestcaseExecutor):
+            # 子プロセスの最大常駐メモリを他のケースと区別できないので、MLEかどうかを判定できない
+            raise ValueError("引数memory_limitはparallel_processing_methodが'thread'の場合は指定できません。")
+        if self.cache_size_limit <= 0:
+            raise ValueError("引数cache_size_limitの値は正の数である必要があります。")
+        if type(self.shard_count) is not int or self.shard_count <= 0:
+            raise ValueError("引数shard_countの値は1以上の整数である必要があります。")
+        if type(self.shard_index) is not int or not 0 <= self.shard_index < self.shard_count:
+            raise ValueError("引数shard_indexの値は0以上shard_count未満の整数である必要があります。")
+        self.sharder = self.get_sharder()
+        new_hash(self.hash_algorithm) # 使えないハッシュ関数ならValueErrorになる
+        validate_compression(self.log_compression)
+        if issubclass(self.Executor, DistributedTestcaseExecutor):
+            if self.distributed is None:
+                raise ValueError("parallel_processing_methodが'distributed'の場合は、引数distributedを指定してください。")
+            self.distributed.validate()
+        if self.async_concurrency is not None and (type(self.async_concurrency) is not int or self.async_concurrency <= 0):
+            raise ValueError("引数async_concurrencyの値は1以上の整数である必要があります。")
+        if self.max_workers is not None and (type(self.max_workers) is not int or self.max_workers <= 0):
+            raise ValueError("引数max_workersの値は1以上の整数である必要があります。")
+        if self.verifier_workers is not None and (type(self.verifier_workers) is not int or self.verifier_workers <= 0):
+            raise ValueError("引数verifier_workersの値は1以上の整数である必要があります。")
+        if self.verifier_workers is not None and self.verifier is None:
+            raise ValueError("引数verifier_workersはverifierを指定した場合にのみ指定できます。")
+        if issubclass(self.Executor, AutoTestcaseExecutor) and (self.max_workers is not None or self.process_pool is not None):
+            raise ValueError("parallel_processing_methodが'auto'の場合は、max_workersやprocess_poolは指定できません。")
+        self.worker_cpus: Optional[list[int]] = None # ワーカーを固定する論理CPU
+        if self.process_pool is not None:
+            if not issubclass(self.Executor, ProcessTestcaseExecutor):
+                raise ValueError("引数process_poolはparallel_processing_methodが'process'の場合にのみ指定できます。")
+            self.process_pool.validate()
+            self.process_pool = self.resolve_process_pool(self.process_pool)
+            if self.process_pool.pin_workers:
+                self.worker_cpus = select_worker_cpus(self.max_workers, self.process_pool.use_smt_siblings)
+        if self.benchmark is not None:
+            self.benchmark.validate()
+            if self.repeat_count != 1 or self.use_cache:
+                raise ValueError("引数benchmarkはrepeat_countやuse_cacheと同時に指定できません。")
         if not Path(self.input_file_path).is_dir():
             raise InvalidPathException(f"テストケースファイルへのパス{self.input_file_path}は無効なパスです。")
-        if len(glob.glob(os.path.join(self.input_file_path, "*"))) == 0:
+        if not self.make_discovery().has_files():
             raise NoTestcaseFileException(f"{self.input_file_path}ディレクトリにファイルが1つもありません。")
-    
-    def make_testcases(self) -> list[TestCase]:
-        files = glob.glob(os.path.join(self.input_file_path, "*"))
-        test_cases = []
+        if self.sharder is not None and next(self.iter_input_paths(), None) is None:
+            raise NoTestcaseFileException(f"シャード{self.shard_index}に割り当てられたファイルが1つもありません。")
+
+    def resolve_process_pool(self, config: ProcessPoolConfig) -> ProcessPoolConfig:
+        """forkserverで先に読み込むモジュールが指定されていなければ、testcaserunnerとハンドラのモジュールにする"""
+        if config.start_method != "forkserver" or config.preload_modules is not None:
+            return config
+        preload_modules = [__package__ or "testcaserunner"]
+        module = getattr(self.testcase_handler, "__module__", None)
+        if module is not None and module != "__main__": # __main__はforkserverから読み込めない
+            preload_modules.append(module)
+        return dataclasses.replace(config, preload_modules=preload_modules)
+
+    def executor_metadata(self) -> Optional[dict[str, Any]]:
+        """result.jsonのメタデータに記録する実行方法. 既定の設定で実行した場合はNone"""
+        if self.auto_executor is not None:
+            return self.auto_executor.decision.metadata() if self.auto_executor.decision is not None else None
+        if self.max_workers is None and self.process_pool is None:
+            return None
+        method = self.parallel_processing_method.lower()
+        cpu_count = os.cpu_count() or 1
+        max_workers = self.max_workers or (len(self.worker_cpus) if self.worker_cpus else None)
+        if max_workers is None:
+            max_workers = min(32, cpu_count + 4) if method == "thread" else cpu_count # プールの既定値
+        metadata: dict[str, Any] = {"method": method, "max_workers": max_workers}
+        if self.process_pool is not None:
+            metadata["start_method"] = self.process_pool.start_method or multiprocessing.get_start_method()
+        if self.worker_cpus is not None:
+            metadata["cpu_affinity"] = self.worker_cpus
+            metadata["physical_cores"] = len(get_physical_cores())
+        return metadata
+
+    def make_discovery(self) -> TestcaseDiscovery:
+        return TestcaseDiscovery(
+            self.input_file_path,
+            list(self.include_patterns or []),
+            list(self.exclude_patterns or []),
+            self.recursive,
+        )
+
+    def iter_input_paths(self) -> Iterator[str]:
+        """このシャードで実行する入力ファイルのinput_file_pathからの相対パスを返す"""
+        relative_paths = self.make_discovery().iter_relative_paths()
+        if self.sharder is None:
+            return relative_paths
+        return self.sharder.select(self.input_file_path, relative_paths)
+
+    def iter_testcases(self) -> Iterator[TestCase]:
+        """入力ファイルを見つけた順に、ログフォルダにコピーしてTestCaseを作る
+
+        対象から外したファイルや他のシャードのファイルはコピーしない
+        """
         testcase_index = 0
-        for input_file in sorted(files):
+        created_dirs: set[str] = set()
+        for relative_path in self.iter_input_paths():
+            relative_dir, file_name = os.path.split(os.path.join(*relative_path.split("/")))
+            input_file = os.path.join(self.input_file_copy_path, relative_dir, file_name)
+            if relative_dir not in created_dirs:
+                # 入力ファイルと同じ階層に出力ファイルを置く
+                self.make_folder(os.path.join(self.input_file_copy_path, relative_dir))
+                self.make_folder(os.path.join(self.stdout_log_path, relative_dir))
+                self.make_folder(os.path.join(self.stderr_log_path, relative_dir))
+                created_dirs.add(relative_dir)
+            self.copy_input(os.path.join(self.input_file_path, relative_dir, file_name), input_file)
             for rep in range(self.repeat_count):
                 if self.repeat_count != 1:
-                    name, extension = os.path.splitext(os.path.basename(input_file))
+                    name, extension = os.path.splitext(file_name)
                     basename = f"{name}_{rep+1}{extension}"
                 else:
-                    basename = os.path.basename(input_file)
-                stdout_file = os.path.join(self.stdout_log_path, basename)
-                stderr_file = os.path.join(self.stderr_log_path, basename)
-                testcase_name = os.path.basename(input_file)
-                testcase = TestCase(testcase_name, input_file, stdout_file, stderr_file, testcase_index)
-                test_cases.append(testcase)
+                    basename = file_name
+                stdout_file = os.path.join(self.stdout_log_path, relative_dir, basename)
+                stderr_file = os.path.join(self.stderr_log_path, relative_dir, basename)
+                yield TestCase(relative_path, input_file, stdout_file, stderr_file, testcase_index)
                 testcase_index += 1
-        return test_cases
+        if self.blob_store is not None:
+            self.blob_store.save_index()
+
+    def make_testcases(self) -> list[TestCase]:
+        return list(self.iter_testcases())
+
+    def make_executor(self, total: int) -> TestcaseExecutor:
+        executor = self.make_solver_executor(total)
+        if self.verifier is not None:
+            # ソルバーの実行と検証を別々のプールで同時に進める
+            return PipelineTestcaseExecutor(executor, self.verifier, self.verifier_workers)
+        return executor
+
+    def make_solver_executor(self, total: int) -> TestcaseExecutor:
+        if self.use_shared_pool:
+            assert self.shared_pool is not None
+            return SharedPoolTestcaseExecutor(total, self.lifecycle, self.shared_pool.executor)
+        if issubclass(self.Executor, DistributedTestcaseExecutor):
+            return DistributedTestcaseExecutor(total, self.lifecycle, self.distributed)
+        if issubclass(self.Executor, AsyncTestcaseExecutor):
+            return AsyncTestcaseExecutor(total, self.lifecycle, self.async_concurrency)
+        if issubclass(self.Executor, AutoTestcaseExecutor):
+            self.auto_executor = AutoTestcaseExecutor(total, self.lifecycle, self.worker)
+            return self.auto_executor
+        if issubclass(self.Executor, ProcessTestcaseExecutor):
+            max_workers = self.max_workers or (len(self.worker_cpus) if self.worker_cpus else None)
+            return ProcessTestcaseExecutor(total, self.lifecycle, max_workers, self.process_pool, self.worker_cpus)
+        if issubclass(self.Executor, PoolTestcaseExecutor):
+            return self.Executor(total, self.lifecycle, self.max_workers)
+        return self.Executor(total, self.lifecycle)
+
+    def setup_executor(self, executor: TestcaseExecutor) -> None:
+        for listener in self.result_listeners:
+            executor.add_result_listener(listener)
+        if self.cache is not None:
+            executor.add_result_listener(self.cache.store)
+        if isinstance(self.testcase_handler, CommandTestcaseHandler):
+            executor.add_interrupt_listener(self.testcase_handler.kill_all)
 
     def start(self) -> list[tuple[TestCase, TestCaseResult]]:
+        if self.benchmark is not None:
+            return self.start_benchmark(self.benchmark)
+        if self.cache is None and isinstance(self.scheduler, SortedTestcaseScheduler):
+            return self.start_streaming()
         test_cases: list[TestCase] = self.make_testcases()
+        # 投入する順番を変えても、testcase_indexと結果の並びはファイル名順のままにする
+        submit_order: list[TestCase] = self.scheduler.order(test_cases)
+
+        result_table: dict[int, Optional[TestCaseResult]] = {}
+        if self.cache is not None:
+            result_table.update(self.cache.load(test_cases))
+            submit_order = [testcase for testcase in submit_order if testcase.testcase_index not in result_table]
 
         self.logger.debug("start testcase run process.")
-        with self.Executor(len(test_cases)) as executor:
-            executor.submit(self.run_testcase, test_cases)
+        with self.make_executor(len(submit_order)) as executor:
+            self.setup_executor(executor)
+            executor.submit(self.get_task(), submit_order)
             results: list[Optional[TestCaseResult]] = executor.wait_and_get_results()
-        
+        assert len(submit_order) == len(results)
+        if self.cache is not None:
+            self.cache.evict()
+
+        for testcase, result in zip(submit_order, results):
+            result_table[testcase.testcase_index] = result
+
         parsed_results: list[TestCaseResult] = []
-        for result in results:
+        for testcase in test_cases:
+            result = result_table[testcase.testcase_index]
             if result is None:
                 result = TestCaseResult(ResultStatus.CAN)
             parsed_results.append(result)
-        
-        assert len(test_cases) == len(results)
+
         return list(zip(test_cases, parsed_results))
-    
-    def run_testcase(self, testcase: TestCase) -> TestCaseResult:
-        start_time = time.time()
-        try:
-            test_result: TestCaseResult = self.testcase_handler(testcase)
-        except Exception as e:
-            self.logger.warning(f"テストケース{os.path.basename(testcase.input_file_path)}において、\
-                引数で渡された関数の中で例外が発生しました。\n{str(e)}")
-            test_result = TestCaseResult(error_status=ResultStatus.IE, stderr=str(e))
-        erapsed_time = time.time() - start_time
-        test_result.attribute["time"] = erapsed_time
-        if self.stdout_file_output:
-            with open(testcase.stdout_file_path, mode='w') as f:
-                f.write(test_result.stdout)
-        if self.stderr_file_output:
-            with open(testcase.stderr_file_path, mode='w') as f:
-                f.write(test_result.stderr)
-        return test_result
-
-def get_log_file_path() -> str:
-    log_name = f"{datetime.datetime.now().strftime('%Y%m%d%H%M%S')}_LOG"
-    return os.path.join("log", log_name)
+
+    def start_streaming(self) -> list[tuple[TestCase, TestCaseResult]]:
+        """入力ファイルを見つけながら投入する
+
+        投入する順番を変える必要がない場合は、TestCaseの一覧を先に作らずにExecutorに渡す
+        進捗バーの総数は入力ファイルの数を別に数えて見積もる
+        """
+        test_cases: list[TestCase] = []
+        def produce() -> Iterator[TestCase]:
+            for testcase in self.iter_testcases():
+                test_cases.append(testcase)
+                yield testcase
+
+        self.logger.debug("start testcase run process.")
+        total = sum(1 for _ in self.iter_input_paths()) * self.repeat_count
+        with self.make_executor(total) as executor:
+            self.setup_executor(executor)
+            executor.submit(self.get_task(), produce())
+            results: list[Optional[TestCaseResult]] = executor.wait_and_get_results()
+        assert len(test_cases) == len(results)
+
+        return [(testcase, result if result is not None else TestCaseResult(ResultStatus.CAN))
+                for testcase, result in zip(test_cases, results)]
+
+    def start_benchmark(self, config: BenchmarkConfig) -> list[tuple[TestCase, TestCaseResult]]:
+        """計測値が収束するまで、収束していないテストケースをまとめて実行することを繰り返す"""
+        test_cases: list[TestCase] = self.make_testcases()
+        controller = BenchmarkController(config, self.scheduler.order(test_cases))
+
+        self.logger.debug("start benchmark process.")
+        total = len(test_cases) * (config.warmup_count + config.min_runs)
+        with self.make_executor(total) as executor:
+            self.setup_executor(executor)
+            executor.add_result_listener(controller.add_result)
+            while (round_cases := controller.next_round()) and not executor.interrupted:
+                executor.submit(self.get_task(), round_cases)
+                executor.wait_and_get_results()
+
+        return [(testcase, controller.summarize(testcase)) for testcase in test_cases]
+
+    def get_task(self) -> Callable[[TestCase], Any]:
+        """Executorに投入する関数を返す"""
+        if issubclass(self.Executor, AsyncTestcaseExecutor):
+            return self.worker.run_testcase_async
+        if self.use_shared_pool and issubclass(self.Executor, ProcessTestcaseExecutor):
+            # プールのワーカーは実行より前に起動しているので、TestcaseWorkerはテストケースと一緒に送る
+            return functools.partial(run_shared_testcase, os.getcwd(), pickle.dumps(self.worker))
+        if issubclass(self.Executor, (ProcessTestcaseExecutor, DistributedTestcaseExecutor)):
+            # TestCaseRunner全体をpickleしないように、ワーカーに登録済みのTestcaseWorkerを使う
+            return run_installed_testcase
+        return self.worker.run_testcase
+
+def get_log_file_path(suffix: str = "LOG") -> str:
+    timestamp = datetime.datetime.now().strftime('%Y%m%d%H%M%S')
+    path = os.path.join("log", f"{timestamp}_{suffix}")
+    count = 0
+    while os.path.exists(path):
+        # 同じ秒に実行されたログフォルダがある. 名前順が実行順になるように、"_LOG"より後ろになる名前にする
+        count += 1
+        path = os.path.join("log", f"{timestamp}_r{count:04d}_{suffix}")
+    return path
 
 def run(
-        testcase_handler: Callable[[TestCase], TestCaseResult],
+        testcase_handler: Callable[..., TestCaseResult],
         input_file_path: str,
         repeat_count: int = 1,
         copy_target_files: list[str] = [],
         parallel_processing_method: str = "process",
         stdout_file_output: bool = True,
         stderr_file_output: bool = True,
+        time_limit: Optional[float] = None,
+        memory_limit: Optional[int] = None,
+        scheduling_method: str = "sorted",
+        use_cache: bool = False,
+        solver_fingerprint: Optional[str] = None,
+        cache_size_limit: int = 1024,
+        benchmark: Optional[BenchmarkConfig] = None,
+        worker_setup: Optional[Callable[[], Any]] = None,
+        worker_teardown: Optional[Callable[[Any], None]] = None,
+        keep_output: bool = False,
+        hash_algorithm: str = "sha256",
+        dedup_storage: bool = False,
+        log_compression: Optional[str] = None,
+        include_patterns: Optional[list[str]] = None,
+        exclude_patterns: Optional[list[str]] = None,
+        recursive: bool = False,
+        shard_index: int = 0,
+        shard_count: int = 1,
+        sharding_method: str = "hash",
+        distributed: Optional[DistributedConfig] = None,
+        async_concurrency: Optional[int] = None,
+        max_workers: Optional[int] = None,
+        process_pool: Optional[ProcessPoolConfig] = None,
+        verifier: Optional[Callable[[TestCase, TestCaseResult], TestCaseResult]] = None,
+        verifier_workers: Optional[int] = None,
         _debug: bool = False,
-        ) -> None:
+        _shared_pool: Optional[SharedPool] = None,
+        ) -> str:
     """ランナーを実行する
 
     Args:
-        testcase_handler (Callable[[TestCase], TestCaseResult]): 並列実行する関数
+        testcase_handler (Callable[..., TestCaseResult]): 並列実行する関数
         input_file_path (str): 入力ファイル群が置いてあるディレクトリへのパス
         repeat_count (int, optional): それぞれのテストケースを何回実行するか. Defaults to 1.
         copy_target_files (list[str], optional): コピーしたいファイルパスのリスト. Defaults to [].
-        parallel_processing_method (str, optional): 並列化の方法(プロセスかスレッドか). Defaults to 'process'.
+        parallel_processing_method (str, optional): 並列化の方法('process', 'thread', 'single', 'distributed', 'async', 'auto'). Defaults to 'process'.
         stdout_file_output (bool, optional): 標準出力をファイルで保存するかどうか. Defaults to True.
         stderr_file_output (bool, optional): 標準エラー出力をファイルで保存するかどうか. Defaults to True.
+        time_limit (Optional[float], optional): 1ケースあたりの制限時間(秒). Defaults to None.
+        memory_limit (Optional[int], optional): 1ケースあたりのメモリ制限(MiB). 制限はかけず、超えたケースをMLEとして記録するだけ.
+            'thread'では指定できない. Defaults to None.
+        scheduling_method (str, optional): テストケースを投入する順番('sorted', 'lpt', 'interleaved'). Defaults to 'sorted'.
+        use_cache (bool, optional): 前回までの結果を再利用するかどうか. Defaults to False.
+        solver_fingerprint (Optional[str], optional): ソルバーを識別する文字列. Defaults to None.
+        cache_size_limit (int, optional): キャッシュの合計サイズの上限(MiB). Defaults to 1024.
+        benchmark (Optional[BenchmarkConfig], optional): 計測値が収束するまで繰り返し実行する設定. Defaults to None.
+        worker_setup (Optional[Callable[[], Any]], optional): ワーカーごとに1回呼ばれる初期化関数. Defaults to None.
+        worker_teardown (Optional[Callable[[Any], None]], optional): ワーカーの終了時に呼ばれる関数. Defaults to None.
+        keep_output (bool, optional): 出力の文字列をワーカーから受け取るかどうか. Defaults to False.
+        hash_algorithm (str, optional): ファイルのハッシュ値の計算に使うハッシュ関数. Defaults to 'sha256'.
+        dedup_storage (bool, optional): 入力ファイルと出力ファイルを重複排除して保存するかどうか. Defaults to False.
+        log_compression (Optional[str], optional): 出力ファイルの圧縮形式('gzip', 'lzma', 'zstd'). Defaults to None.
+        include_patterns (Optional[list[str]], optional): 対象にする入力ファイルのパターンのリスト. Defaults to None.
+        exclude_patterns (Optional[list[str]], optional): 対象から外す入力ファイルのパターンのリスト. Defaults to None.
+        recursive (bool, optional): 入力ファイルをサブディレクトリからも探すかどうか. Defaults to False.
+        shard_index (int, optional): 複数のマシンで分けて実行するときの、このマシンの番号. Defaults to 0.
+        shard_count (int, optional): 複数のマシンで分けて実行するときの、マシンの数. Defaults to 1.
+        sharding_method (str, optional): 入力ファイルの分け方('hash'か'cost'か). Defaults to 'hash'.
+        distributed (Optional[DistributedConfig], optional): エージェントにテストケースを配る設定. Defaults to None.
+        async_concurrency (Optional[int], optional): 'async'で同時に実行するテストケースの数の上限. Defaults to None.
+        max_workers (Optional[int], optional): 'process', 'thread'で起動するワーカーの数. Defaults to None.
+        process_pool (Optional[ProcessPoolConfig], optional): 'process'のワーカーの起動方法とCPUの割り当て. Defaults to None.
+        verifier (Optional[Callable[[TestCase, TestCaseResult], TestCaseResult]], optional): 出力を検証する関数. Defaults to None.
+        verifier_workers (Optional[int], optional): verifierを実行するワーカープロセスの数. Defaults to None.
+
+    Returns:
+        str: 作成したログフォルダのパス
     """
     log_folder_name = get_log_file_path()
     runner = TestCaseRunner(
@@ -174,13 +547,143 @@ def run(
         stdout_file_output,
         stderr_file_output,
         _debug,
+        time_limit,
+        memory_limit,
+        scheduling_method,
+        use_cache,
+        solver_fingerprint,
+        cache_size_limit,
+        benchmark,
+        worker_setup,
+        worker_teardown,
+        keep_output,
+        hash_algorithm,
+        dedup_storage,
+        log_compression,
+        include_patterns,
+        exclude_patterns,
+        recursive,
+        shard_index,
+        shard_count,
+        sharding_method,
+        distributed,
+        _shared_pool,
+        async_concurrency,
+        max_workers,
+        process_pool,
+        verifier,
+        verifier_workers,
     )
+    execute_runner(runner, log_folder_name, _debug)
+    return log_folder_name
+
+def run_command(
+        cmd_template: str,
+        input_file_path: str,
+        repeat_count: int = 1,
+        copy_target_files: list[str] = [],
+        stdout_file_output: bool = True,
+        stderr_file_output: bool = True,
+        time_limit: Optional[float] = None,
+        memory_limit: Optional[int] = None,
+        scheduling_method: str = "sorted",
+        use_cache: bool = False,
+        solver_fingerprint: Optional[str] = None,
+        cache_size_limit: int = 1024,
+        benchmark: Optional[BenchmarkConfig] = None,
+        hash_algorithm: str = "sha256",
+        dedup_storage: bool = False,
+        log_compression: Optional[str] = None,
+        include_patterns: Optional[list[str]] = None,
+        exclude_patterns: Optional[list[str]] = None,
+        recursive: bool = False,
+        shard_index: int = 0,
+        shard_count: int = 1,
+        sharding_method: str = "hash",
+        max_workers: Optional[int] = None,
+        verifier: Optional[Callable[[TestCase, TestCaseResult], TestCaseResult]] = None,
+        verifier_workers: Optional[int] = None,
+        _debug: bool = False,
+        ) -> str:
+    """コマンドを直接起動してランナーを実行する
+
+    Args:
+        cmd_template (str): 実行するコマンド. {input_file_path}, {testcase_name}, {testcase_index}で置き換えられる
+        input_file_path (str): 入力ファイル群が置いてあるディレクトリへのパス
+        repeat_count (int, optional): それぞれのテストケースを何回実行するか. Defaults to 1.
+        copy_target_files (list[str], optional): コピーしたいファイルパスのリスト. Defaults to [].
+        stdout_file_output (bool, optional): 標準出力をファイルで保存するかどうか. Defaults to True.
+        stderr_file_output (bool, optional): 標準エラー出力をファイルで保存するかどうか. Defaults to True.
+        time_limit (Optional[float], optional): 1ケースあたりの制限時間(秒). Defaults to None.
+        memory_limit (Optional[int], optional): 1ケースあたりのメモリ制限(MiB). Defaults to None.
+        scheduling_method (str, optional): テストケースを投入する順番('sorted'か'lpt'か). Defaults to 'sorted'.
+        use_cache (bool, optional): 前回までの結果を再利用するかどうか. Defaults to False.
+        solver_fingerprint (Optional[str], optional): ソルバーを識別する文字列. Defaults to None.
+        cache_size_limit (int, optional): キャッシュの合計サイズの上限(MiB). Defaults to 1024.
+        benchmark (Optional[BenchmarkConfig], optional): 計測値が収束するまで繰り返し実行する設定. Defaults to None.
+        hash_algorithm (str, optional): ファイルのハッシュ値の計算に使うハッシュ関数. Defaults to 'sha256'.
+        dedup_storage (bool, optional): 入力ファイルと出力ファイルを重複排除して保存するかどうか. Defaults to False.
+        log_compression (Optional[str], optional): 出力ファイルの圧縮形式('gzip', 'lzma', 'zstd'). Defaults to None.
+        include_patterns (Optional[list[str]], optional): 対象にする入力ファイルのパターンのリスト. Defaults to None.
+        exclude_patterns (Optional[list[str]], optional): 対象から外す入力ファイルのパターンのリスト. Defaults to None.
+        recursive (bool, optional): 入力ファイルをサブディレクトリからも探すかどうか. Defaults to False.
+        shard_index (int, optional): 複数のマシンで分けて実行するときの、このマシンの番号. Defaults to 0.
+        shard_count (int, optional): 複数のマシンで分けて実行するときの、マシンの数. Defaults to 1.
+        sharding_method (str, optional): 入力ファイルの分け方('hash'か'cost'か). Defaults to 'hash'.
+        max_workers (Optional[int], optional): 同時に実行するコマンドの数. Defaults to None.
+        verifier (Optional[Callable[[TestCase, TestCaseResult], TestCaseResult]], optional): 出力を検証する関数. Defaults to None.
+        verifier_workers (Optional[int], optional): verifierを実行するワーカープロセスの数. Defaults to None.
+
+    Returns:
+        str: 作成したログフォルダのパス
+    """
+    log_folder_name = get_log_file_path()
+    handler = CommandTestcaseHandler(cmd_template, stdout_file_output, stderr_file_output, time_limit, memory_limit)
+    # 出力は子プロセスが直接ファイルに書くので、ランナー側では書き込まない
+    runner = TestCaseRunner(
+        handler,
+        input_file_path,
+        log_folder_name,
+        repeat_count,
+        copy_target_files,
+        "command",
+        False,
+        False,
+        _debug,
+        time_limit,
+        memory_limit,
+        scheduling_method,
+        use_cache,
+        solver_fingerprint,
+        cache_size_limit,
+        benchmark,
+        hash_algorithm=hash_algorithm,
+        dedup_storage=dedup_storage,
+        log_compression=log_compression,
+        include_patterns=include_patterns,
+        exclude_patterns=exclude_patterns,
+        recursive=recursive,
+        shard_index=shard_index,
+        shard_count=shard_count,
+        sharding_method=sharding_method,
+        max_workers=max_workers,
+        verifier=verifier,
+        verifier_workers=verifier_workers,
+    )
+    execute_runner(runner, log_folder_name, _debug)
+    return log_folder_name
+
+def execute_runner(runner: TestCaseRunner, log_folder_name: str, debug: bool) -> None:
     result = runner.start()
-    log = make_log(result, log_folder_name, _debug)
+    shard = runner.sharder.metadata() if runner.sharder is not None else None
+    executor = runner.executor_metadata()
+    log = make_log(result, log_folder_name, debug, runner.hash_algorithm, runner.blob_store, runner.log_compression, shard,
+                   executor, runner.file_hasher)
     file = os.path.join(log_folder_name, "result.html")
-    make_html(file, log, _debug)
+    make_html(file, log, debug)
 
 # 公開するメンバーを制御する
 __all__ = [
     "run",
+    "run_command",
 ]
@@ -1,4 +1,4 @@
-from typing import Iterator
+from typing import Iterator, Optional
 from dataclasses import dataclass, field
 from enum import IntEnum, auto
 
@@ -32,6 +32,15 @@ class ResultStatus(IntEnum):
     TLE = auto()            # 実行時間制限超過
     IE = auto()             # 内部エラー
     CAN = auto()            # キャンセルされた
+    MLE = auto()            # メモリ制限超過
+
+@dataclass(frozen=True)
+class OutputInfo:
+    """ワーカーで書き込んだ出力ファイルの情報"""
+    path: str                                    # ファイルへのパス
+    size: int                                    # ファイルのサイズ(バイト)
+    digest: str                                  # ファイルのハッシュ値
+    algorithm: str = "sha256"                    # ハッシュ値の計算に使ったハッシュ関数
 
 @dataclass
 class TestCaseResult:
@@ -41,6 +50,8 @@ class TestCaseResult:
     stderr: str = ""                             # 標準エラー出力(なければ空文字でいい)
     attribute: dict[str, int | float] \
         = field(default_factory=dict)            # 結果ファイルに乗せたい情報の一覧
+    stdout_info: Optional[OutputInfo] = None     # 標準出力のファイルの情報(ライブラリが設定する)
+    stderr_info: Optional[OutputInfo] = None     # 標準エラー出力のファイルの情報(ライブラリが設定する)
 
 @dataclass(frozen=True)
 class TestCase:
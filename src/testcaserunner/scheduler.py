@@ -0,0 +1,120 @@
+import os
+import glob
+import json
+import random
+from abc import ABC, abstractmethod
+from collections import defaultdict
+from typing import Optional
+
+from .runner_defines import RunnerMetadata, TestCase
+from .logger import RunnerLogger
+from .testcase_logger import RunnerLogManager
+from .file_hasher import DEFAULT_HASH_ALGORITHM, HASH_ALGORITHMS, FileHasher
+
+class TestcaseScheduler(ABC): # pragma: no cover
+    """テストケースを投入する順番を決めるクラス"""
+    @abstractmethod
+    def order(self, test_cases: list[TestCase]) -> list[TestCase]:
+        pass
+
+class SortedTestcaseScheduler(TestcaseScheduler):
+    """ファイル名順にそのまま投入する"""
+    def order(self, test_cases: list[TestCase]) -> list[TestCase]:
+        return test_cases
+
+class InterleavedTestcaseScheduler(TestcaseScheduler):
+    """先頭のフォルダを除いた相対パスが同じテストケースをまとめ、まとめた中ではランダムな順番で投入する
+
+    フォルダごとに別のハンドラで同じ入力ファイルを実行する場合に、ハンドラごとの実行時期の偏りをなくす
+    """
+    def __init__(self, seed: Optional[int] = None) -> None:
+        self.random = random.Random(seed)
+
+    def order(self, test_cases: list[TestCase]) -> list[TestCase]:
+        groups: defaultdict[str, list[TestCase]] = defaultdict(list) # 最初に見つけた入力ファイルの順番を保つ
+        for testcase in test_cases:
+            _, _, name = testcase.testcase_name.partition("/")
+            groups[name or testcase.testcase_name].append(testcase)
+        ordered: list[TestCase] = []
+        for group in groups.values():
+            self.random.shuffle(group)
+            ordered.extend(group)
+        return ordered
+
+class LptTestcaseScheduler(TestcaseScheduler):
+    """実行時間が長いと予想されるテストケースから投入する(LPT)
+
+    過去のresult.jsonのtime列を入力ファイルのハッシュ値で引いて実行時間を予想する
+    履歴がない入力ファイルはファイルサイズから予想する
+    """
+    logger = RunnerLogger("LptTestcaseScheduler")
+    time_col = "time"
+
+    def __init__(self, log_dir: str = "log", use_shard_logs: bool = True) -> None:
+        self.log_dir = log_dir
+        self.use_shard_logs = use_shard_logs
+        # 入力ファイルのハッシュ値はハッシュ関数ごとに並列に計算し、続けて並べ替えるときは覚えた値を使う
+        self._hashers: dict[str, FileHasher] = {}
+
+    def get_hasher(self, algorithm: str) -> Optional[FileHasher]:
+        """ハッシュ関数のFileHasherを返す. 使えないハッシュ関数ならNoneを返す"""
+        if algorithm not in self._hashers:
+            try:
+                self._hashers[algorithm] = FileHasher(algorithm)
+            except ValueError:
+                return None
+        return self._hashers[algorithm]
+
+    @logger.function_tracer
+    def load_history(self) -> dict[tuple[str, str], float]:
+        """ハッシュ関数の名前と入力ファイルのハッシュ値から過去の平均実行時間を引く辞書を作る"""
+        times: defaultdict[tuple[str, str], list[float]] = defaultdict(list)
+        for file in glob.glob(os.path.join(self.log_dir, "*", "result.json")):
+            try:
+                with open(file, mode="r") as f:
+                    data = json.load(f)
+                if data["metadata"]["library_name"] != RunnerMetadata.LIB_NAME:
+                    continue
+                if not self.use_shard_logs and "shard" in data["metadata"]:
+                    continue
+                algorithm = data["metadata"].get("hash_algorithm", DEFAULT_HASH_ALGORITHM)
+                contents = data["contents"]
+                hashes = contents[RunnerLogManager.input_hash_col]
+                elapsed = contents.get(self.time_col, {})
+            except (OSError, ValueError, KeyError, TypeError):
+                continue # 読めないログは使わない
+            for row, input_hash in hashes.items():
+                value = elapsed.get(row)
+                if input_hash and value is not None:
+                    # ハッシュ値には".in.0"のような添字がついているので取り除く
+                    times[(algorithm, input_hash.split(".")[0])].append(value)
+        return {key: sum(values) / len(values) for key, values in times.items()}
+
+    @logger.function_tracer
+    def estimate_costs(self, input_files: list[str]) -> dict[str, float]:
+        history = self.load_history()
+        sizes = {file: os.path.getsize(file) for file in input_files}
+        known: dict[str, float] = {}
+        # ログごとにハッシュ関数が違うことがあるので、履歴にあるハッシュ関数ごとに計算する
+        algorithms = {algorithm for algorithm, _ in history if algorithm in HASH_ALGORITHMS}
+        for algorithm in sorted(algorithms):
+            hasher = self.get_hasher(algorithm)
+            if hasher is None:
+                continue # このハッシュ関数は使えない
+            hashes = hasher.hash_files([file for file in input_files if file not in known])
+            for file, digest in hashes.items():
+                if (algorithm, digest) in history:
+                    known[file] = history[(algorithm, digest)]
+
+        if not known:
+            return {file: float(size) for file, size in sizes.items()}
+
+        # 履歴のない入力ファイルは、履歴のあるファイルの1バイトあたりの実行時間から予想する
+        known_size = sum(sizes[file] for file in known)
+        time_per_byte = sum(known.values()) / known_size if known_size > 0 else 0.0
+        return {file: known.get(file, sizes[file] * time_per_byte) for file in input_files}
+
+    def order(self, test_cases: list[TestCase]) -> list[TestCase]:
+        input_files = list(dict.fromkeys(testcase.input_file_path for testcase in test_cases))
+        costs = self.estimate_costs(input_files)
+        return sorted(test_cases, key=lambda testcase: costs[testcase.input_file_path], reverse=True)
@@ -0,0 +1,59 @@
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, Executor
+from typing import Any, Callable, Optional, Self
+
+from .runner_defines import TestCaseResult
+from .worker_context import WorkerLifecycle
+from .testccase_executor import SharedPool
+from .runner import run
+
+class RunnerSession:
+    """複数回のrunで1つのプールを使い回すためのコンテキストマネージャ
+
+    プールの起動とworker_setupの呼び出しはセッションの開始時に1回だけ行い、
+    worker_teardownはセッションの終了時に呼ぶ. 実行ごとにログフォルダは別々に作る
+    """
+    def __init__(self, parallel_processing_method: str = "process", max_workers: Optional[int] = None,
+                 worker_setup: Optional[Callable[[], Any]] = None,
+                 worker_teardown: Optional[Callable[[Any], None]] = None) -> None:
+        if parallel_processing_method.lower() not in ("process", "thread"):
+            raise ValueError("RunnerSessionのparallel_processing_methodは'process'か'thread'を指定してください。")
+        if max_workers is not None and max_workers <= 0:
+            raise ValueError("max_workersの値は1以上である必要があります。")
+        self.parallel_processing_method = parallel_processing_method.lower()
+        self.max_workers = max_workers
+        self.worker_setup = worker_setup
+        self._lifecycle = WorkerLifecycle(worker_setup, worker_teardown)
+        self._pool: Optional[SharedPool] = None
+
+    def make_executor(self) -> Executor:
+        if self.parallel_processing_method == "process":
+            return ProcessPoolExecutor(max_workers=self.max_workers, initializer=self._lifecycle.initialize_process)
+        return ThreadPoolExecutor(max_workers=self.max_workers, initializer=self._lifecycle.initialize)
+
+    def __enter__(self) -> Self:
+        self._pool = SharedPool(self.make_executor(), self.worker_setup is not None)
+        return self
+
+    def __exit__(self, exc_type: Optional[type[BaseException]], exc_val: Optional[BaseException],
+                 exc_tb: Optional[BaseException]) -> None:
+        if self._pool is not None:
+            self._pool.executor.shutdown()
+            self._pool = None
+        self._lifecycle.finalize()
+
+    def run(self, testcase_handler: Callable[..., TestCaseResult], input_file_path: str, **options: Any) -> str:
+        """セッションのプールでrunを実行する. 引数はrunと同じで、戻り値はログフォルダのパス
+
+        parallel_processing_methodはセッションで指定したものを使う
+        worker_setupを指定した場合は、その実行だけ新しいプールを起動する
+        """
+        if self._pool is None:
+            raise ValueError("RunnerSessionはwith文の中で使ってください。")
+        if "parallel_processing_method" in options:
+            raise ValueError("parallel_processing_methodはRunnerSessionで指定してください。")
+        return run(testcase_handler, input_file_path, parallel_processing_method=self.parallel_processing_method,
+                   _shared_pool=self._pool, **options)
+
+__all__ = [
+    "RunnerSession",
+]
@@ -0,0 +1,146 @@
+import os
+import json
+import shutil
+import datetime
+from collections import defaultdict
+from pathlib import Path
+from typing import Any, Optional
+
+import pandas as pd
+
+from .runner_defines import RunnerMetadata, InvalidPathException
+from .logger import RunnerLogger
+from .testcase_logger import RunnerLogManager
+from .html_builder import make_html
+from .file_hasher import DEFAULT_HASH_ALGORITHM
+from .runner import get_log_file_path
+
+logger = RunnerLogger("ShardMerge")
+# ログフォルダのうち、結合したログから作り直すもの
+_generated_entries = ("result.json", "result.html", "fig")
+_hash_cols = (
+    (RunnerLogManager.input_hash_col, "in"),
+    (RunnerLogManager.stdout_hash_col, "stdout"),
+    (RunnerLogManager.stderr_hash_col, "stderr"),
+)
+
+def load_shard(shard_dir: str) -> dict:
+    file = os.path.join(shard_dir, "result.json")
+    if not os.path.isfile(file):
+        raise InvalidPathException(f"{shard_dir}にresult.jsonがありません。")
+    with open(file, mode="r") as f:
+        data = json.load(f)
+    if data["metadata"]["library_name"] != RunnerMetadata.LIB_NAME:
+        raise ValueError(f"{file}は{RunnerMetadata.LIB_NAME}のログではありません。")
+    return data
+
+def check_shards(shards: list[dict]) -> None:
+    """シャードの実行条件がそろっているかを確かめる"""
+    metadatas = [shard["metadata"] for shard in shards]
+    if len({metadata.get("hash_algorithm", DEFAULT_HASH_ALGORITHM) for metadata in metadatas}) != 1:
+        raise ValueError("hash_algorithmが違うシャードは結合できません。")
+    if len({metadata.get("log_compression") for metadata in metadatas}) != 1:
+        raise ValueError("log_compressionが違うシャードは結合できません。")
+    infos = [metadata["shard"] for metadata in metadatas if "shard" in metadata]
+    if not infos:
+        return
+    if len({(info["count"], info["method"]) for info in infos}) != 1:
+        raise ValueError("shard_countかsharding_methodが違うシャードは結合できません。")
+    indices = [info["index"] for info in infos]
+    if len(set(indices)) != len(indices):
+        raise ValueError("同じshard_indexのシャードが含まれています。")
+    missing = sorted(set(range(infos[0]["count"])) - set(indices))
+    if missing:
+        logger.warning(f"シャード{missing}の結果がないため、一部のテストケースが含まれません。")
+
+def copy_shard_files(shard_dir: str, output_dir: str) -> None:
+    """シャードのログフォルダの中身をコピーする. 同じ名前のファイルは最初のシャードのものを使う"""
+    def copy_function(src: str, dst: str) -> None:
+        if os.path.exists(dst):
+            return
+        try:
+            os.link(src, dst) # 容量を使わないようにハードリンクにする
+        except OSError:
+            shutil.copy2(src, dst)
+
+    for entry in os.scandir(shard_dir):
+        if entry.name in _generated_entries:
+            continue
+        dst = os.path.join(output_dir, entry.name)
+        if entry.is_dir():
+            shutil.copytree(entry.path, dst, copy_function=copy_function, dirs_exist_ok=True)
+        else:
+            copy_function(entry.path, dst)
+
+def merge_contents(shards: list[dict]) -> tuple[dict, list[str]]:
+    """テストケースを1回の実行と同じファイル名順に並べ、行番号とハッシュ値の添字をつけ直す"""
+    attributes: dict[str, str] = dict() # setだと順番が保持されないのでdictにする
+    rows: list[dict[str, Any]] = []
+    for shard in shards:
+        for attribute in shard["metadata"]["attributes"]:
+            attributes[attribute] = ""
+        contents = shard["contents"]
+        for row in sorted(contents[RunnerLogManager.infile_col], key=int):
+            rows.append({column: values.get(row) for column, values in contents.items()})
+    # 入力ファイルの相対パスで並べる. 繰り返し実行した結果は元の順番のまま
+    rows.sort(key=lambda row: Path(row[RunnerLogManager.infile_col]).parts)
+
+    counter: dict[str, int] = defaultdict(int)
+    columns = list(dict.fromkeys(column for row in rows for column in row))
+    merged: defaultdict[str, list[Any]] = defaultdict(list)
+    for row in rows:
+        for column in columns:
+            merged[column].append(row.get(column))
+        for column, suffix in _hash_cols:
+            # ".in.0"のような添字を取り除き、結合後の出現回数でつけ直す
+            subhash = f"{row[column].rsplit('.', 2)[0]}.{suffix}"
+            merged[column][-1] = f"{subhash}.{counter[subhash]}"
+            counter[subhash] += 1
+    return json.loads(pd.DataFrame(merged).to_json()), list(attributes.keys())
+
+def merge_shards(shard_dirs: list[str], output_dir: Optional[str] = None, debug: bool = False) -> str:
+    """シャードごとのログフォルダを結合し、1回の実行と同じログフォルダを作る
+
+    Args:
+        shard_dirs (list[str]): 結合するシャードのログフォルダのリスト
+        output_dir (Optional[str], optional): 結合したログフォルダのパス. 指定しない場合はlogフォルダに新しく作る. Defaults to None.
+        debug (bool, optional): デバッグ用のメッセージを出すかどうか. Defaults to False.
+
+    Returns:
+        str: 結合したログフォルダのパス
+    """
+    if debug:
+        logger.enable_debug_mode()
+    if not shard_dirs:
+        raise ValueError("結合するシャードのログフォルダを指定してください。")
+    shards = [load_shard(shard_dir) for shard_dir in shard_dirs]
+    check_shards(shards)
+    if output_dir is None:
+        output_dir = get_log_file_path()
+    if os.path.exists(output_dir):
+        raise InvalidPathException(f"{output_dir}は既に存在します。")
+    os.makedirs(output_dir)
+    for shard_dir in shard_dirs:
+        copy_shard_files(shard_dir, output_dir)
+
+    contents, attributes = merge_contents(shards)
+    first = shards[0]["metadata"]
+    metadata: dict[str, Any] = {
+        "library_name": RunnerMetadata.LIB_NAME,
+        "created_date": datetime.datetime.now().strftime("%Y/%m/%d %H:%M"),
+        "attributes": attributes,
+        "hash_algorithm": first.get("hash_algorithm", DEFAULT_HASH_ALGORITHM),
+    }
+    if first.get("log_compression") is not None:
+        metadata["log_compression"] = first["log_compression"]
+    metadata["merged_shards"] = [os.path.basename(os.path.normpath(shard_dir)) for shard_dir in shard_dirs]
+
+    log_manager = RunnerLogManager([], output_dir, debug, metadata["hash_algorithm"], None, first.get("log_compression"))
+    log_manager.save_json_file(contents, metadata)
+    log_manager.make_figure()
+    make_html(os.path.join(output_dir, "result.html"), log_manager.get_log(), debug)
+    return output_dir
+
+__all__ = [
+    "merge_shards",
+]
@@ -0,0 +1,82 @@
+import os
+import hashlib
+from abc import ABC, abstractmethod
+from typing import Iterable, Iterator, Optional
+
+from .scheduler import LptTestcaseScheduler
+
+class TestcaseSharder(ABC): # pragma: no cover
+    """入力ファイルを複数のマシンに分けるクラス
+
+    どのマシンで実行しても同じ分け方になるように、入力ファイルのrootからの相対パスだけで決める
+    """
+    def __init__(self, shard_index: int, shard_count: int) -> None:
+        self.shard_index = shard_index
+        self.shard_count = shard_count
+
+    @property
+    @abstractmethod
+    def method(self) -> str:
+        pass
+
+    @abstractmethod
+    def select(self, root: str, relative_paths: Iterable[str]) -> Iterator[str]:
+        """このシャードで実行する入力ファイルの相対パスだけを返す"""
+        pass
+
+    def metadata(self) -> dict:
+        return {"index": self.shard_index, "count": self.shard_count, "method": self.method}
+
+class HashTestcaseSharder(TestcaseSharder):
+    """相対パスのハッシュ値で分ける. 入力ファイルを見つけながら分けられる"""
+    @property
+    def method(self) -> str:
+        return "hash"
+
+    def get_shard(self, relative_path: str) -> int:
+        # hash()はプロセスごとに値が変わるので使わない
+        digest = hashlib.sha256(relative_path.encode()).digest()
+        return int.from_bytes(digest[:8], "big") % self.shard_count
+
+    def select(self, root: str, relative_paths: Iterable[str]) -> Iterator[str]:
+        for relative_path in relative_paths:
+            if self.get_shard(relative_path) == self.shard_index:
+                yield relative_path
+
+class CostTestcaseSharder(TestcaseSharder):
+    """過去のresult.jsonのtime列から予想した実行時間が均等になるように分ける
+
+    実行時間が長い順に、予想実行時間の合計が一番少ないシャードへ入れる
+    全てのマシンで同じ履歴(ログフォルダ)を使わないと分け方がずれるので注意
+    先に終わったシャードのログで分け方が変わらないように、シャードごとのログは履歴に使わない
+    (結合したログは使う)
+    """
+    def __init__(self, shard_index: int, shard_count: int, log_dir: str = "log") -> None:
+        super().__init__(shard_index, shard_count)
+        self.log_dir = log_dir
+        self._selected: Optional[set[str]] = None
+
+    @property
+    def method(self) -> str:
+        return "cost"
+
+    def assign(self, root: str, relative_paths: list[str]) -> set[str]:
+        files = {relative_path: os.path.join(root, *relative_path.split("/")) for relative_path in relative_paths}
+        costs = LptTestcaseScheduler(self.log_dir, use_shard_logs=False).estimate_costs(list(files.values()))
+        loads = [0.0] * self.shard_count
+        selected: set[str] = set()
+        for relative_path in sorted(relative_paths, key=lambda path: (-costs[files[path]], path)):
+            shard = min(range(self.shard_count), key=lambda index: (loads[index], index))
+            loads[shard] += costs[files[relative_path]]
+            if shard == self.shard_index:
+                selected.add(relative_path)
+        return selected
+
+    def select(self, root: str, relative_paths: Iterable[str]) -> Iterator[str]:
+        paths = list(relative_paths)
+        if self._selected is None:
+            # 入力ファイルのハッシュ値の計算は重いので、分け方は1回だけ決める
+            self._selected = self.assign(root, paths)
+        for relative_path in paths:
+            if relative_path in self._selected:
+                yield relative_path
@@ -0,0 +1,249 @@
+import os
+import json
+import math
+import random
+import shutil
+import datetime
+import functools
+import itertools
+from dataclasses import dataclass, field
+from typing import Any, Callable, Optional, Union
+
+from jinja2 import Environment, FileSystemLoader
+
+from .runner_defines import TestCaseResult, RunnerMetadata, NoTestcaseFileException, InvalidPathException
+from .logger import RunnerLogger
+from .testcase_logger import RunnerLogManager
+from .discovery import TestcaseDiscovery, link_inputs
+from .session import RunnerSession
+from .shard_merge import load_shard
+from .ab_compare import VariantHandler, split_contents, split_log
+from .runner import get_log_file_path
+
+logger = RunnerLogger("ParameterSweep")
+
+@dataclass
+class SweepTrial:
+    """1つのパラメータの組の評価結果"""
+    index: int
+    params: dict[str, Any]
+    rung: int = 0                                          # 到達した段の番号
+    values: list[Optional[float]] = field(default_factory=list) # 実行したテストケースの評価値. 失敗したものはNone
+    log_dirs: list[str] = field(default_factory=list)      # 段ごとの結合したログフォルダ
+
+    @property
+    def name(self) -> str:
+        """ログフォルダと、段ごとの実行で入力ファイルを置くフォルダの名前"""
+        return f"trial_{self.index:04d}"
+
+    @property
+    def failures(self) -> int:
+        return sum(1 for value in self.values if value is None)
+
+    @property
+    def mean(self) -> Optional[float]:
+        values = [value for value in self.values if value is not None]
+        return sum(values) / len(values) if values else None
+
+    def sort_key(self, maximize: bool) -> tuple[int, float]:
+        """評価値がないテストケースが少ない順、次に評価値の平均が良い順"""
+        mean = self.mean
+        if mean is None:
+            return (self.failures, math.inf)
+        return (self.failures, -mean if maximize else mean)
+
+def expand_param_space(param_space: Union[dict[str, list[Any]], list[dict[str, Any]]]) -> list[dict[str, Any]]:
+    """辞書の場合は全ての組み合わせ(グリッド)を、リストの場合はそのまま返す"""
+    if isinstance(param_space, dict):
+        keys = list(param_space.keys())
+        return [dict(zip(keys, values)) for values in itertools.product(*(param_space[key] for key in keys))]
+    return [dict(params) for params in param_space]
+
+def make_budgets(trial_count: int, input_count: int, reduction_factor: int, min_inputs: Optional[int]) -> list[int]:
+    """段ごとに評価する入力ファイルの数. 最後の段は全ての入力ファイルを使う"""
+    halvings = 0
+    while reduction_factor ** (halvings + 1) <= trial_count:
+        halvings += 1
+    if min_inputs is None:
+        min_inputs = max(1, input_count // reduction_factor ** halvings)
+    budgets: list[int] = []
+    for rung in range(halvings + 1):
+        budget = input_count if rung == halvings else min(input_count, min_inputs * reduction_factor ** rung)
+        budgets.append(budget)
+        if budget == input_count:
+            break
+    return budgets
+
+def load_values(contents: dict, metric: str) -> list[Optional[float]]:
+    values = contents.get(metric, {})
+    ret: list[Optional[float]] = []
+    for row in sorted(contents[RunnerLogManager.infile_col], key=int):
+        value = values.get(row)
+        ret.append(float(value) if isinstance(value, (int, float)) and not math.isnan(value) else None)
+    return ret
+
+def write_leaderboard(sweep_dir: str, trials: list[SweepTrial], metadata: dict[str, Any]) -> None:
+    """leaderboard.jsonとleaderboard.htmlを書き出す. trialsは順位順に並べておく"""
+    rows: list[dict[str, Any]] = []
+    for rank, trial in enumerate(trials, start=1):
+        rows.append({
+            "rank": rank,
+            "trial": trial.index,
+            "params": trial.params,
+            "rung": trial.rung,
+            "inputs": len(trial.values),
+            metadata["metric"]: trial.mean,
+            "failures": trial.failures,
+            "log": os.path.basename(trial.log_dirs[-1]),
+        })
+    with open(os.path.join(sweep_dir, "leaderboard.json"), mode="w") as f:
+        json.dump({"metadata": metadata, "leaderboard": rows}, f, indent=2, ensure_ascii=False, default=str)
+
+    environment = Environment(loader=FileSystemLoader(os.path.join(os.path.split(__file__)[0], r"templates")))
+    cell = environment.get_template("cell.j2")
+    link = environment.get_template("cell_with_file_link.j2")
+    param_names = list(dict.fromkeys(name for trial in trials for name in trial.params))
+    table = []
+    for row in rows:
+        cells = {
+            "rank": cell.render({"value": row["rank"]}),
+            "trial": link.render({"link": f"{row['log']}/result.html", "value": row["log"]}),
+        }
+        for name in param_names:
+            cells[name] = cell.render({"value": row["params"].get(name, "")})
+        for column in ("rung", "inputs", metadata["metric"], "failures"):
+            value = row[column]
+            cells[column] = cell.render({"value": "" if value is None else round(value, 3) if isinstance(value, float) else value})
+        table.append(cells)
+    columns = {"rank": "sort", "trial": "normal", **{name: "sort" for name in param_names},
+               "rung": "sort", "inputs": "sort", metadata["metric"]: "sort", "failures": "sort"}
+    sections = [
+        environment.get_template("datetime.j2").render({"date": metadata["created_date"]}),
+        environment.get_template("table.j2").render({"table": table, "table_columns": columns}),
+    ]
+    for script in ("js/Table.js", "js/checkbox.js"):
+        with open(os.path.join(os.path.split(__file__)[0], script), mode="r", encoding="utf-8") as f:
+            sections.append(environment.get_template("script.j2").render({"text": f.read()}))
+    with open(os.path.join(os.path.split(__file__)[0], "js/SortTable.css"), mode="r", encoding="utf-8") as f:
+        sections.append(environment.get_template("css.j2").render({"text": f.read()}))
+    sections.append(environment.get_template("css_link.j2").render({"link": r"https://newcss.net/new.min.css"}))
+    with open(os.path.join(sweep_dir, "leaderboard.html"), mode="w") as f:
+        f.write(environment.get_template("main.j2").render({"title": "Sweep Leaderboard", "sections": sections}))
+
+def sweep(
+        testcase_handler: Callable[..., TestCaseResult],
+        input_file_path: str,
+        param_space: Union[dict[str, list[Any]], list[dict[str, Any]]],
+        metric: str = "score",
+        maximize: bool = True,
+        reduction_factor: int = 3,
+        min_inputs: Optional[int] = None,
+        seed: int = 0,
+        parallel_processing_method: str = "process",
+        max_workers: Optional[int] = None,
+        worker_setup: Optional[Callable[[], Any]] = None,
+        worker_teardown: Optional[Callable[[Any], None]] = None,
+        include_patterns: Optional[list[str]] = None,
+        exclude_patterns: Optional[list[str]] = None,
+        recursive: bool = False,
+        _debug: bool = False,
+        **options: Any,
+        ) -> str:
+    """パラメータの組を逐次半減法(successive halving)で絞り込みながら評価する
+
+    Args:
+        testcase_handler (Callable[..., TestCaseResult]): 並列実行する関数. パラメータの辞書をキーワード引数paramsで受け取る
+        input_file_path (str): 入力ファイル群が置いてあるディレクトリへのパス
+        param_space (Union[dict[str, list[Any]], list[dict[str, Any]]]): パラメータごとの候補の辞書か、パラメータの組のリスト
+        metric (str, optional): 比較に使うTestCaseResultのattributesのキー. Defaults to 'score'.
+        maximize (bool, optional): metricが大きいほど良いかどうか. Defaults to True.
+        reduction_factor (int, optional): 1段ごとにパラメータの組を何分の1に減らすか. Defaults to 3.
+        min_inputs (Optional[int], optional): 最初の段で評価する入力ファイルの数. Defaults to None(自動).
+        seed (int, optional): 段ごとに使う入力ファイルを選ぶ乱数のシード. Defaults to 0.
+        parallel_processing_method (str, optional): 並列化の方法('process'か'thread'). Defaults to 'process'.
+        max_workers (Optional[int], optional): プールのワーカー数. Defaults to None.
+        worker_setup (Optional[Callable[[], Any]], optional): ワーカーごとに1回呼ばれる初期化関数. Defaults to None.
+        worker_teardown (Optional[Callable[[Any], None]], optional): ワーカーの終了時に呼ばれる関数. Defaults to None.
+        include_patterns (Optional[list[str]], optional): 対象にする入力ファイルのパターンのリスト. Defaults to None.
+        exclude_patterns (Optional[list[str]], optional): 対象から外す入力ファイルのパターンのリスト. Defaults to None.
+        recursive (bool, optional): 入力ファイルをサブディレクトリからも探すかどうか. Defaults to False.
+        **options: runに渡すその他の引数
+
+    Returns:
+        str: パラメータの組ごとのログフォルダと順位表を置いたフォルダのパス
+    """
+    if _debug:
+        logger.enable_debug_mode()
+    trials = [SweepTrial(index, params) for index, params in enumerate(expand_param_space(param_space))]
+    if not trials:
+        raise ValueError("param_spaceにパラメータの組が1つもありません。")
+    if type(reduction_factor) is not int or reduction_factor < 2:
+        raise ValueError("引数reduction_factorの値は2以上の整数である必要があります。")
+    if min_inputs is not None and (type(min_inputs) is not int or min_inputs <= 0):
+        raise ValueError("引数min_inputsの値は1以上の整数である必要があります。")
+    for name in ("shard_index", "shard_count", "sharding_method", "distributed"):
+        if name in options:
+            raise ValueError(f"sweepでは引数{name}は指定できません。")
+    if not os.path.isdir(input_file_path):
+        raise InvalidPathException(f"テストケースファイルへのパス{input_file_path}は無効なパスです。")
+    discovery = TestcaseDiscovery(input_file_path, list(include_patterns or []), list(exclude_patterns or []), recursive)
+    relative_paths = list(discovery.iter_relative_paths())
+    if not relative_paths:
+        raise NoTestcaseFileException(f"{input_file_path}ディレクトリにファイルが1つもありません。")
+    # どの段でも偏りのない入力ファイルを使うように、並べ替えてから先頭から順に使う
+    random.Random(seed).shuffle(relative_paths)
+    budgets = make_budgets(len(trials), len(relative_paths), reduction_factor, min_inputs)
+
+    sweep_dir = get_log_file_path("SWEEP")
+    inputs_dir = os.path.join(sweep_dir, ".inputs")
+    os.makedirs(sweep_dir)
+    alive = trials
+    rung_logs: list[str] = []
+    try:
+        with RunnerSession(parallel_processing_method, max_workers, worker_setup, worker_teardown) as session:
+            for rung, budget in enumerate(budgets):
+                start = budgets[rung - 1] if rung > 0 else 0
+                rung_dir = os.path.join(inputs_dir, f"rung_{rung}")
+                # パラメータの組ごとのフォルダに同じ入力ファイルを置き、段ごとに1回の実行にまとめてプールを使い切る
+                for trial in alive:
+                    link_inputs(input_file_path, relative_paths[start:budget], os.path.join(rung_dir, trial.name))
+                logger.info(f"段{rung}: {len(alive)}個のパラメータの組を入力ファイル{budget}個で評価します。")
+                handler = VariantHandler({trial.name: functools.partial(testcase_handler, params=trial.params) for trial in alive})
+                log_dir = session.run(handler, rung_dir, recursive=True, _debug=_debug, **options)
+                data = load_shard(log_dir)
+                for trial in alive:
+                    contents, _ = split_contents(data["contents"], data["metadata"], trial.name)
+                    trial.rung = rung
+                    trial.log_dirs.append(log_dir)
+                    trial.values.extend(load_values(contents, metric))
+                rung_logs.append(log_dir)
+                if rung != len(budgets) - 1:
+                    alive = sorted(alive, key=lambda trial: trial.sort_key(maximize))[:math.ceil(len(alive) / reduction_factor)]
+    finally:
+        # 段の実行で例外が出ても、入力ファイルを置いたフォルダは残さない
+        shutil.rmtree(inputs_dir, ignore_errors=True)
+
+    # 段ごとの結合したログフォルダから、パラメータの組ごとに1つのログフォルダを作る
+    for trial in trials:
+        trial_dir = os.path.join(sweep_dir, trial.name)
+        split_log(trial.log_dirs, trial.name, trial_dir, _debug)
+        trial.log_dirs.append(trial_dir)
+    for log_dir in rung_logs:
+        shutil.rmtree(log_dir)
+
+    ranking = sorted(trials, key=lambda trial: (-trial.rung, trial.sort_key(maximize)))
+    metadata: dict[str, Any] = {
+        "library_name": RunnerMetadata.LIB_NAME,
+        "created_date": datetime.datetime.now().strftime("%Y/%m/%d %H:%M"),
+        "metric": metric,
+        "maximize": maximize,
+        "reduction_factor": reduction_factor,
+        "budgets": budgets,
+        "seed": seed,
+    }
+    write_leaderboard(sweep_dir, ranking, metadata)
+    return sweep_dir
+
+__all__ = [
+    "sweep",
+]
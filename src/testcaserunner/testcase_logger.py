@@ -1,16 +1,19 @@
 import os
-import hashlib
 import json
+import warnings
 from collections import defaultdict
-from typing import Any
+from typing import Any, Optional
 import datetime
 
 import matplotlib.pyplot as plt
 import seaborn as sns
 import pandas as pd
 
-from .runner_defines import RunnerMetadata, TestCase, TestCaseResult
+from .runner_defines import RunnerMetadata, TestCase, TestCaseResult, OutputInfo
 from .logger import RunnerLogger
+from .file_hasher import DEFAULT_HASH_ALGORITHM, FileHasher, calculate_file_hash
+from .blob_store import BlobStore
+from .compression import get_compressed_path
 
 class RunnerLog:
     def __init__(self, contents: dict, metadata: dict, base_dir: str) -> None:
@@ -47,11 +50,21 @@ class RunnerLogManager:
     stderr_hash_col = "stderr_hash"
 
     logger = RunnerLogger("RunnerLogManager")
-    def __init__(self, results: list[tuple[TestCase, TestCaseResult]], log_folder_name: str, debug: bool) -> None:
+    def __init__(self, results: list[tuple[TestCase, TestCaseResult]], log_folder_name: str, debug: bool,
+                 hash_algorithm: str = DEFAULT_HASH_ALGORITHM, blob_store: Optional[BlobStore] = None,
+                 log_compression: Optional[str] = None, shard: Optional[dict] = None,
+                 executor: Optional[dict] = None, hasher: Optional[FileHasher] = None) -> None:
         self.log_folder_name = log_folder_name
         if debug:
             self.logger.enable_debug_mode()
         self.results = results
+        # 実行中に計算したハッシュ値を使い回すため、runnerと同じFileHasherを渡せる
+        self.hasher = hasher if hasher is not None and hasher.algorithm == hash_algorithm else FileHasher(hash_algorithm)
+        self.hashes: dict[str, str] = {}
+        self.blob_store = blob_store
+        self.log_compression = log_compression
+        self.shard = shard
+        self.executor = executor # 'auto'で選んだ実行方法
 
     def make_folder(self, path: str) -> None:
         os.makedirs(path, exist_ok=True)
@@ -59,6 +72,7 @@ class RunnerLogManager:
     @logger.function_tracer
     def make_log(self) -> None:
         self.make_json_file()
+        self.store_blobs()
         self.make_figure()
     
     @logger.function_tracer
@@ -102,15 +116,18 @@ class RunnerLogManager:
                 attributes[attribute] = ""
         user_attributes = list(attributes.keys())
 
+        self.hashes = self.compute_hashes(testcases, results)
         contents: defaultdict[str, list[Any]] = defaultdict(list)
         for testcase, result in zip(testcases, results):
-            contents[self.infilename_col].append(os.path.basename(testcase.input_file_path))
+            stdout_path = self.get_output_path(testcase.stdout_file_path)
+            stderr_path = self.get_output_path(testcase.stderr_file_path)
+            contents[self.infilename_col].append(testcase.testcase_name) # 入力フォルダからの相対パス
             contents[self.input_hash_col].append(add_hash_info(self.get_file_hash(testcase.input_file_path), "in"))
-            contents[self.stdout_hash_col].append(add_hash_info(self.get_file_hash(testcase.stdout_file_path), "stdout"))
-            contents[self.stderr_hash_col].append(add_hash_info(self.get_file_hash(testcase.stderr_file_path), "stderr"))
+            contents[self.stdout_hash_col].append(add_hash_info(self.get_output_hash(stdout_path, result.stdout_info), "stdout"))
+            contents[self.stderr_hash_col].append(add_hash_info(self.get_output_hash(stderr_path, result.stderr_info), "stderr"))
             contents[self.infile_col].append(os.path.relpath(testcase.input_file_path, self.log_folder_name))
-            contents[self.stdout_col].append(os.path.relpath(testcase.stdout_file_path, self.log_folder_name))
-            contents[self.stderr_col].append(os.path.relpath(testcase.stderr_file_path, self.log_folder_name))
+            contents[self.stdout_col].append(os.path.relpath(stdout_path, self.log_folder_name))
+            contents[self.stderr_col].append(os.path.relpath(stderr_path, self.log_folder_name))
             contents[self.status_col].append(result.error_status)
             for key in user_attributes:
                 value = result.attribute[key] if key in result.attribute else None
@@ -119,11 +136,21 @@ class RunnerLogManager:
         # jsonデータをそろえるため一度DataFrameにしてからjsonに直す
         contents = json.loads(pd.DataFrame(contents).to_json())
         
-        metadata = {
+        metadata: dict[str, Any] = {
             "library_name": RunnerMetadata.LIB_NAME,
             "created_date": datetime.datetime.now().strftime("%Y/%m/%d %H:%M"),
             "attributes": user_attributes,
+            "hash_algorithm": self.hasher.algorithm,
         }
+        if self.log_compression is not None:
+            metadata["log_compression"] = self.log_compression
+        if self.shard is not None:
+            metadata["shard"] = self.shard
+        if self.executor is not None:
+            metadata["executor"] = self.executor
+        self.save_json_file(contents, metadata)
+
+    def save_json_file(self, contents: dict, metadata: dict) -> None:
         self.json_file = {
             "contents": contents,
             "metadata": metadata,
@@ -133,22 +160,70 @@ class RunnerLogManager:
         with open(json_file_path, 'w') as f:
             json.dump(self.json_file, f, indent=2)
     
+    def get_output_path(self, path: str) -> str:
+        """出力ファイルが実際に保存されているパスを返す"""
+        return get_compressed_path(path, self.log_compression)
+
+    def is_valid_output_info(self, path: str, info: Optional[OutputInfo]) -> bool:
+        return info is not None and info.path == path and info.algorithm == self.hasher.algorithm
+
     @logger.function_tracer
-    def get_file_hash(self, path: str) -> str:
-        if os.path.exists(path):
-            return self.calculate_file_hash(path)
-        else:
-            return "" #ファイルが開けないときは空文字にしておく
+    def compute_hashes(self, testcases: list[TestCase], results: list[TestCaseResult]) -> dict[str, str]:
+        """ハッシュ値が必要なファイルをまとめてスレッドプールで計算する"""
+        known: dict[str, str] = {}
+        if self.blob_store is not None and self.blob_store.algorithm == self.hasher.algorithm:
+            known = dict(self.blob_store.digests) # blobにするときに計算済み
+        input_paths: list[str] = []
+        output_paths: list[str] = []
+        for testcase, result in zip(testcases, results):
+            if testcase.input_file_path not in known:
+                input_paths.append(testcase.input_file_path)
+            for path, info in ((testcase.stdout_file_path, result.stdout_info), (testcase.stderr_file_path, result.stderr_info)):
+                path = self.get_output_path(path)
+                if not self.is_valid_output_info(path, info):
+                    output_paths.append(path)
+        known.update(self.hasher.hash_files(input_paths))
+        # 圧縮された出力ファイルは展開した内容のハッシュ値にする
+        known.update(self.hasher.hash_files(output_paths, self.log_compression))
+        return known
 
     @logger.function_tracer
+    def store_blobs(self) -> None:
+        """出力ファイルをblobにして、同じ内容のファイルを共有する"""
+        if self.blob_store is None or self.blob_store.algorithm != self.hasher.algorithm:
+            return
+        # 同じ内容でも圧縮形式が違えば別のファイルになるので、blobの名前に拡張子をつける
+        suffix = self.get_output_path("")
+        with self.blob_store.lock(): # ファイルごとにロックを取り直さない
+            for testcase, result in self.results:
+                for path, info in ((testcase.stdout_file_path, result.stdout_info), (testcase.stderr_file_path, result.stderr_info)):
+                    path = self.get_output_path(path)
+                    self.blob_store.add(path, self.get_output_hash(path, info), suffix)
+
+    def get_output_hash(self, path: str, info: Optional[OutputInfo]) -> str:
+        # ワーカーで書き込みながら計算したハッシュ値があれば、ファイルを読み直さない
+        if info is not None and self.is_valid_output_info(path, info):
+            return info.digest
+        if path in self.hashes:
+            return self.hashes[path]
+        return self.hasher.hash_file(path, self.log_compression)
+
+    def get_file_hash(self, path: str) -> str:
+        if path in self.hashes:
+            return self.hashes[path]
+        return self.hasher.hash_file(path) #ファイルが開けないときは空文字になる
+
     def calculate_file_hash(self, file_path: str) -> str:
-        hash_obj = hashlib.new('sha256')
-        with open(file_path, 'rb') as file:
-            while chunk := file.read(4096):
-                hash_obj.update(chunk)
-        return hash_obj.hexdigest()
-
-def make_log(result: list[tuple[TestCase, TestCaseResult]], log_folder_name: str, debug: bool) -> RunnerLog:
-    log_manager = RunnerLogManager(result, log_folder_name, debug)
+        """非推奨. ファイルのハッシュ値を計算する. 代わりにfile_hasher.calculate_file_hashを使う"""
+        warnings.warn("RunnerLogManager.calculate_file_hashは非推奨です。file_hasher.calculate_file_hashを使ってください。",
+                      DeprecationWarning, stacklevel=2)
+        return calculate_file_hash(file_path, self.hasher.algorithm)
+
+def make_log(result: list[tuple[TestCase, TestCaseResult]], log_folder_name: str, debug: bool,
+             hash_algorithm: str = DEFAULT_HASH_ALGORITHM, blob_store: Optional[BlobStore] = None,
+             log_compression: Optional[str] = None, shard: Optional[dict] = None,
+             executor: Optional[dict] = None, hasher: Optional[FileHasher] = None) -> RunnerLog:
+    log_manager = RunnerLogManager(result, log_folder_name, debug, hash_algorithm, blob_store, log_compression, shard,
+                                   executor, hasher)
     log_manager.make_log()
     return log_manager.get_log()
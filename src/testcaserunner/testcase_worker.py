@@ -0,0 +1,207 @@
+import os
+import sys
+import asyncio
+import inspect
+import time
+import pickle
+import functools
+from dataclasses import dataclass
+from typing import Callable, Optional
+
+from .runner_defines import TestCase, TestCaseResult, ResultStatus
+from .logger import RunnerLogger
+from .worker_context import get_worker_context
+from .output_stream import write_output, collect_output, configure_output
+from .process_control import Watchdog, Alarm, TimeLimitExceeded, kill_descendants, get_descendant_pids, get_process_usage, \
+    get_children_max_rss, ResourceUsage, is_memory_error_output, MEMORY_ERROR_TAIL_SIZE
+
+@dataclass
+class TestcaseWorker:
+    """ワーカー側でテストケースを1つ実行するのに必要な情報だけを持つクラス
+
+    プロセス並列ではワーカーの起動時に1回だけ送られ、以降はTestCaseだけを送る
+    """
+    testcase_handler: Callable[..., TestCaseResult]
+    stdout_file_output: bool
+    stderr_file_output: bool
+    exclusive_process: bool                 # 1つのプロセスで同時に1つのテストケースしか実行しないかどうか
+    pass_context: bool = False              # ハンドラにワーカーのコンテキストを渡すかどうか
+    time_limit: Optional[float] = None
+    memory_limit: Optional[int] = None
+    keep_output: bool = False               # 出力の文字列を親プロセスに返すかどうか
+    hash_algorithm: str = "sha256"          # 出力ファイルのハッシュ値の計算に使うハッシュ関数
+    log_compression: Optional[str] = None   # 出力ファイルの圧縮形式
+
+    logger = RunnerLogger("TestcaseWorker")
+
+    def get_existing_processes(self) -> frozenset[int]:
+        """テストケースを始める前からある子孫プロセス. 制限時間を過ぎても終了させない
+
+        'single'では呼び出し元のプロセスで実行するので、呼び出し元が起動した子プロセスを巻き込まないようにする
+        """
+        if self.time_limit is None or not self.exclusive_process:
+            return frozenset()
+        return frozenset(get_descendant_pids(os.getpid()))
+
+    def kill_testcase_processes(self, existing: frozenset[int]) -> None:
+        """このテストケースが起動した子孫プロセスだけを終了させる"""
+        # スレッド並列では他のテストケースの子プロセスと区別できないので終了させない
+        if self.exclusive_process:
+            kill_descendants(os.getpid(), existing)
+
+    def is_memory_limit_exceeded(self, start_max_rss: Optional[int]) -> bool:
+        """子プロセスの最大常駐メモリが制限を超えたかどうか. ベストエフォートの判定
+
+        回収済みの子プロセス全体での最大値しか分からないので、最大値が増えたときだけ
+        このテストケースの子プロセスの値とみなせる. それまでの最大値以下で制限を超えたケースは見逃す
+        ハンドラが起動する子プロセスを個別に回収できないので、wait4で子プロセスごとには計測できない
+        """
+        if self.memory_limit is None or start_max_rss is None:
+            return False
+        end_max_rss = get_children_max_rss()
+        if end_max_rss is None or end_max_rss <= start_max_rss:
+            return False
+        return end_max_rss >= self.memory_limit * 1024
+
+    def call_handler(self, testcase: TestCase) -> TestCaseResult:
+        if self.pass_context:
+            return self.testcase_handler(testcase, get_worker_context())
+        return self.testcase_handler(testcase)
+
+    def run_testcase(self, testcase: TestCase) -> TestCaseResult:
+        configure_output(self.hash_algorithm, self.log_compression)
+        # スレッド並列では資源使用量を他のテストケースと区別できないので計測しない
+        start_usage = get_process_usage() if self.exclusive_process else None
+        start_max_rss = get_children_max_rss() if self.exclusive_process else None
+        kill_processes = functools.partial(self.kill_testcase_processes, self.get_existing_processes())
+        start_time = time.perf_counter_ns()
+        try:
+            # 1つのプロセスで1ケースずつ実行する場合は、制限時間を過ぎたらハンドラ自体を止める
+            with Watchdog(self.time_limit, kill_processes), \
+                    Alarm(self.time_limit if self.exclusive_process else None, kill_processes):
+                test_result: TestCaseResult = self.call_handler(testcase)
+        except TimeLimitExceeded:
+            # Watchdogのタイマーは止まっているので、残った子プロセスはここで終了させる
+            kill_processes()
+            test_result = TestCaseResult(error_status=ResultStatus.TLE)
+        except Exception as e:
+            self.logger.warning(f"テストケース{os.path.basename(testcase.input_file_path)}において、\
+                引数で渡された関数の中で例外が発生しました。\n{str(e)}")
+            test_result = TestCaseResult(error_status=ResultStatus.IE, stderr=str(e))
+        erapsed_time = (time.perf_counter_ns() - start_time) / 1e9
+        return self.finish_testcase(testcase, test_result, erapsed_time, start_usage, start_max_rss)
+
+    async def call_handler_async(self, testcase: TestCase) -> TestCaseResult:
+        if self.pass_context:
+            ret = self.testcase_handler(testcase, get_worker_context())
+        else:
+            ret = self.testcase_handler(testcase)
+        if inspect.isawaitable(ret):
+            ret = await ret
+        return ret
+
+    async def run_testcase_async(self, testcase: TestCase) -> TestCaseResult:
+        """イベントループの中でasync defのハンドラを実行する
+
+        time_limitを過ぎたらハンドラをキャンセルしてTLEにする. 資源使用量は他のテストケースと区別できないので計測しない
+        memory_limitを指定した場合は、メモリ確保に失敗して終了したREをMLEにする
+        """
+        configure_output(self.hash_algorithm, self.log_compression)
+        start_time = time.perf_counter_ns()
+        try:
+            test_result = await asyncio.wait_for(self.call_handler_async(testcase), self.time_limit)
+        except asyncio.TimeoutError:
+            test_result = TestCaseResult(error_status=ResultStatus.TLE)
+        except Exception as e:
+            self.logger.warning(f"テストケース{os.path.basename(testcase.input_file_path)}において、\
+                引数で渡された関数の中で例外が発生しました。\n{str(e)}")
+            test_result = TestCaseResult(error_status=ResultStatus.IE, stderr=str(e))
+        erapsed_time = (time.perf_counter_ns() - start_time) / 1e9
+        if self.is_async_memory_error(test_result):
+            test_result.error_status = ResultStatus.MLE
+        # 出力の書き込みとハッシュ値の計算、圧縮はイベントループを止めないようにスレッドで行う
+        return await asyncio.to_thread(self.finish_testcase_in_thread, testcase, test_result, erapsed_time)
+
+    def is_async_memory_error(self, test_result: TestCaseResult) -> bool:
+        """最大常駐メモリは他のテストケースと区別できないので、標準エラー出力からメモリ制限を超えたかを判定する"""
+        if self.memory_limit is None or test_result.error_status != ResultStatus.RE:
+            return False
+        return is_memory_error_output(test_result.stderr[-MEMORY_ERROR_TAIL_SIZE:].encode(errors="replace"))
+
+    def finish_testcase_in_thread(self, testcase: TestCase, test_result: TestCaseResult,
+                                  erapsed_time: float) -> TestCaseResult:
+        # ハッシュ関数と圧縮形式はスレッドごとの設定なので、このスレッドでも設定する
+        configure_output(self.hash_algorithm, self.log_compression)
+        return self.finish_testcase(testcase, test_result, erapsed_time, None, None)
+
+    def finish_testcase(self, testcase: TestCase, test_result: TestCaseResult, erapsed_time: float,
+                        start_usage: Optional[ResourceUsage], start_max_rss: Optional[int]) -> TestCaseResult:
+        """実行時間と資源使用量を記録し、制限を超えたかを判定して出力を書き込む"""
+        test_result.attribute["time"] = erapsed_time
+        end_usage = get_process_usage()
+        if start_usage is not None and end_usage is not None:
+            test_result.attribute.update((end_usage - start_usage).to_attribute())
+        # 実行モードによらず列の並びがそろうように、資源使用量はtimeの後ろに置く
+        for column in ResourceUsage.columns:
+            if column in test_result.attribute:
+                test_result.attribute[column] = test_result.attribute.pop(column)
+        if self.time_limit is not None and erapsed_time >= self.time_limit:
+            test_result.error_status = ResultStatus.TLE
+        elif self.is_memory_limit_exceeded(start_max_rss):
+            test_result.error_status = ResultStatus.MLE
+        self.write_outputs(testcase, test_result)
+        return test_result
+
+    def write_outputs(self, testcase: TestCase, test_result: TestCaseResult) -> None:
+        """出力をワーカー内でファイルに書き込み、ハッシュ値を計算する
+
+        親プロセスにはファイルのパス、サイズ、ハッシュ値だけを返す
+        """
+        if self.stdout_file_output:
+            test_result.stdout_info = write_output(testcase.stdout_file_path, test_result.stdout)
+        else:
+            test_result.stdout_info = collect_output(testcase.stdout_file_path)
+        if self.stderr_file_output:
+            test_result.stderr_info = write_output(testcase.stderr_file_path, test_result.stderr)
+        else:
+            test_result.stderr_info = collect_output(testcase.stderr_file_path)
+        if not self.keep_output:
+            test_result.stdout = ""
+            test_result.stderr = ""
+
+# ワーカープロセスに登録されたTestcaseWorker
+_installed_worker: Optional[TestcaseWorker] = None
+
+def install_worker(worker: Optional[TestcaseWorker]) -> None:
+    global _installed_worker
+    _installed_worker = worker
+
+def run_installed_testcase(testcase: TestCase) -> TestCaseResult:
+    """ワーカープロセスに登録されたTestcaseWorkerでテストケースを実行する
+
+    モジュールのトップレベルの関数なので、投入のたびにpickleされるのは関数名とTestCaseだけになる
+    """
+    assert _installed_worker is not None, "TestcaseWorkerが登録されていないよ"
+    return _installed_worker.run_testcase(testcase)
+
+# 常駐プロセスのプールで復元したTestcaseWorker. pickleしたバイト列から引く
+_shared_workers: dict[bytes, TestcaseWorker] = {}
+MAX_SHARED_WORKERS = 8
+
+def run_shared_testcase(cwd: str, worker_data: bytes, testcase: TestCase) -> TestCaseResult:
+    """ジョブをまたいで使い回すプロセスプールで、ジョブのTestcaseWorkerを使ってテストケースを実行する
+
+    作業ディレクトリとimportパスをジョブに合わせてからTestcaseWorkerを復元する
+    同じジョブのTestcaseWorkerは1回だけ復元する
+    """
+    if os.getcwd() != cwd:
+        os.chdir(cwd)
+    if cwd not in sys.path:
+        sys.path.insert(0, cwd)
+    worker = _shared_workers.get(worker_data)
+    if worker is None:
+        if len(_shared_workers) >= MAX_SHARED_WORKERS:
+            _shared_workers.clear()
+        worker = pickle.loads(worker_data)
+        _shared_workers[worker_data] = worker
+    return worker.run_testcase(testcase)
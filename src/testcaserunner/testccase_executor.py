@@ -1,7 +1,9 @@
-from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, Future, wait, Executor
-from typing import Callable
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, Future, wait, Executor, FIRST_COMPLETED
+from typing import Callable, Iterable, Iterator
 from typing import Self, Optional
 from abc import ABC, abstractmethod
+from dataclasses import dataclass
+import os
 import signal
 import types
 from typing import Any
@@ -10,6 +12,8 @@ from tqdm import tqdm
 
 from .runner_defines import TestCase, TestCaseResult
 from .logger import RunnerLogger
+from .worker_context import WorkerLifecycle
+from .pool_config import ProcessPoolConfig, make_cpu_queue
 
 class TestcaseExecutor(ABC): # pragma: no cover
     logger = RunnerLogger("TestcaseExecutor")
@@ -17,11 +21,41 @@ class TestcaseExecutor(ABC): # pragma: no cover
     STARTED = 1
     SUBMITTED = 2
     FINISHED = 3
-    def __init__(self, total: int):
-        pass
+    _progress: tqdm
+    def __init__(self, total: int, lifecycle: Optional[WorkerLifecycle] = None):
+        self._lifecycle = lifecycle if lifecycle is not None else WorkerLifecycle()
+        self._result_listeners: list[Callable[[TestCase, TestCaseResult], None]] = []
+        self._interrupt_listeners: list[Callable[[], None]] = []
+        self._submitted = 0
+        self._interrupted = False
+
+    @property
+    def interrupted(self) -> bool:
+        """実行がキャンセルされたかどうか"""
+        return self._interrupted
+
+    def count_submitted(self, count: int) -> None:
+        """投入したテストケースの数を数え、最初に伝えられた総数を超えたら進捗バーの総数を増やす"""
+        self._submitted += count
+        if self._progress.total is not None and self._submitted > self._progress.total:
+            self._progress.total = self._submitted
+            self._progress.refresh()
+
+    def add_result_listener(self, listener: Callable[[TestCase, TestCaseResult], None]) -> None:
+        """テストケースが1つ終わるたびに呼ばれる関数を登録する"""
+        self._result_listeners.append(listener)
+
+    def notify_result(self, testcase: TestCase, result: TestCaseResult) -> None:
+        for listener in self._result_listeners:
+            listener(testcase, result)
+
+    def add_interrupt_listener(self, listener: Callable[[], None]) -> None:
+        """実行がキャンセルされたときに呼ばれる関数を登録する"""
+        self._interrupt_listeners.append(listener)
 
     @abstractmethod
-    def submit(self, testcase_handler: Callable[[TestCase], TestCaseResult], test_cases: list[TestCase]) -> None:
+    def submit(self, testcase_handler: Callable[[TestCase], TestCaseResult], test_cases: Iterable[TestCase]) -> None:
+        """テストケースを投入する. test_casesはジェネレータでもよく、wait_and_get_resultsの中で少しずつ取り出す"""
         pass
 
     @abstractmethod
@@ -39,39 +73,67 @@ class TestcaseExecutor(ABC): # pragma: no cover
 
     def notify_catch_keyboard_interrupt(self):
         self.logger.warning("ランナーの実行をキャンセルします。")
+        for listener in self._interrupt_listeners:
+            listener()
 
 class PoolTestcaseExecutor(TestcaseExecutor):
-    def __init__(self, total: int):
+    # 同時に投入しておくテストケースの数はCPU数のこの倍数にする
+    # ThreadPoolExecutorのスレッド数の既定値は最大32なので、それより少なくはしない
+    WINDOW_FACTOR = 4
+    MIN_WINDOW = 32
+    def __init__(self, total: int, lifecycle: Optional[WorkerLifecycle] = None, max_workers: Optional[int] = None):
+        super().__init__(total, lifecycle)
         self._total = total
         self._status = self.NOT_START
-        self._interrupted = False
+        self._max_workers = max_workers # Noneならプールの既定値
+        self._window = max((os.cpu_count() or 1) * self.WINDOW_FACTOR, self.MIN_WINDOW, max_workers or 0)
+        # 割り込みを待ち合わせに参加させるためのFuture
+        self._interrupt_future: Future = Future()
     
     def get_executor(self) -> Executor:
         return Executor()
 
-    def submit(self, testcase_handler: Callable[[TestCase], TestCaseResult], test_cases: list[TestCase]):
+    def submit(self, testcase_handler: Callable[[TestCase], TestCaseResult], test_cases: Iterable[TestCase]):
         if self._status != self.STARTED:
             raise ValueError("使い方間違ってるよ")
-        self._futures:list[Future] = []
-        for testcase in test_cases:
-            future = self._executor.submit(testcase_handler, testcase)
-            future.add_done_callback(lambda p: self._progress.update())
-            self._futures.append(future)
+        self._handler = testcase_handler
+        self._pending: Iterator[TestCase] = iter(test_cases)
         self._status = self.SUBMITTED
+
+    def fill_window(self, futures: dict[Future, tuple[int, TestCase]], results: list[Optional[TestCaseResult]]) -> None:
+        """実行中のテストケースが上限になるまで投入する"""
+        while len(futures) < self._window and not self._interrupted:
+            testcase = next(self._pending, None)
+            if testcase is None:
+                return
+            self.count_submitted(1)
+            futures[self._executor.submit(self._handler, testcase)] = (len(results), testcase)
+            results.append(None)
     
     def wait_and_get_results(self) -> list[Optional[TestCaseResult]]:
-        results: list[Optional[TestCaseResult]] = []
         if self._status != self.SUBMITTED:
             raise ValueError("使い方間違ってるよ")
-        for future in self._futures:
-            while not future.done():
-                if self._interrupted:
-                    break
-            if self._interrupted:
-                result = None
-            else:
+        # 終わった順に結果を受け取り、戻り値は投入した順に並べる
+        # Futureは投入済みで終わっていないものだけを持つので、テストケースが多くてもメモリを使わない
+        results: list[Optional[TestCaseResult]] = []
+        futures: dict[Future, tuple[int, TestCase]] = {}
+        self.fill_window(futures, results)
+        while futures and not self._interrupted:
+            done, _ = wait(set(futures) | {self._interrupt_future}, return_when=FIRST_COMPLETED)
+            for future in done:
+                if future is self._interrupt_future:
+                    continue
+                index, testcase = futures.pop(future)
                 result = future.result()
-            results.append(result)
+                results[index] = result
+                self._progress.update()
+                self.notify_result(testcase, result)
+            self.fill_window(futures, results)
+        for future in futures:
+            future.cancel()
+        # キャンセルされた場合、まだ投入していないテストケースの結果はNoneにする
+        results.extend(None for _ in self._pending)
+        self._status = self.STARTED # 続けて投入できるようにする
         return results
 
     def __enter__(self) -> Self:
@@ -84,31 +146,86 @@ class PoolTestcaseExecutor(TestcaseExecutor):
     def __exit__(self, exc_type: Optional[type[BaseException]], exc_val: Optional[BaseException],
                  exc_tb: Optional[BaseException]) -> None:
         self._progress.close()
-        self._executor.shutdown()
+        self.shutdown_executor()
+        self._lifecycle.finalize()
         signal.signal(signal.SIGINT, signal.SIG_DFL)
+
+    def shutdown_executor(self) -> None:
+        self._executor.shutdown()
     
     def signal_handler(self, signum: int, frame: None | types.FrameType) -> Any:
         self._interrupted = True
+        if not self._interrupt_future.done():
+            self._interrupt_future.set_result(None)
         self.notify_catch_keyboard_interrupt()
 
 class ProcessTestcaseExecutor(PoolTestcaseExecutor):
+    def __init__(self, total: int, lifecycle: Optional[WorkerLifecycle] = None, max_workers: Optional[int] = None,
+                 pool_config: Optional[ProcessPoolConfig] = None, worker_cpus: Optional[list[int]] = None):
+        super().__init__(total, lifecycle, max_workers)
+        self._pool_config = pool_config if pool_config is not None else ProcessPoolConfig()
+        self._worker_cpus = worker_cpus # ワーカーを1つずつ固定する論理CPU
+
     def get_executor(self) -> Executor:
-        return ProcessPoolExecutor()
+        context = self._pool_config.get_context()
+        initargs: tuple = ()
+        if self._worker_cpus:
+            initargs = (make_cpu_queue(context, self._worker_cpus),)
+        return ProcessPoolExecutor(max_workers=self._max_workers, mp_context=context,
+                                   initializer=self._lifecycle.initialize_process, initargs=initargs)
 
 class ThreadTestcaseExecutor(PoolTestcaseExecutor):
     def get_executor(self) -> Executor:
-        return ThreadPoolExecutor()
+        return ThreadPoolExecutor(max_workers=self._max_workers, initializer=self._lifecycle.initialize)
+
+class CommandTestcaseExecutor(PoolTestcaseExecutor):
+    """子プロセスを直接起動するハンドラ向けのExecutor
+
+    スレッドは子プロセスの終了を待つだけなので、同時に動く子プロセスがCPU数になるようにする
+    """
+    def get_executor(self) -> Executor:
+        return ThreadPoolExecutor(max_workers=self._max_workers or os.cpu_count(), initializer=self._lifecycle.initialize)
+
+@dataclass
+class SharedPool:
+    """複数の実行で使い回すプロセスプールかスレッドプール"""
+    executor: Executor
+    has_context: bool = False # ワーカーにworker_setupで作ったコンテキストがあるかどうか
+
+    def accepts(self, executor_type: type[TestcaseExecutor]) -> bool:
+        """executor_typeの代わりにこのプールを使えるかどうか"""
+        if isinstance(self.executor, ProcessPoolExecutor):
+            return issubclass(executor_type, ProcessTestcaseExecutor)
+        if isinstance(self.executor, ThreadPoolExecutor):
+            return issubclass(executor_type, ThreadTestcaseExecutor)
+        return False
+
+class SharedPoolTestcaseExecutor(PoolTestcaseExecutor):
+    """起動済みのプールにテストケースを投入するExecutor
+
+    複数の実行でプールを使い回すためのもので、終了してもプールは止めない
+    """
+    def __init__(self, total: int, lifecycle: Optional[WorkerLifecycle], pool: Executor):
+        super().__init__(total, lifecycle)
+        self._pool = pool
+
+    def get_executor(self) -> Executor:
+        return self._pool
+
+    def shutdown_executor(self) -> None:
+        pass
 
 class SingleTestcaseExecutor(TestcaseExecutor):
-    def __init__(self, total: int):
+    def __init__(self, total: int, lifecycle: Optional[WorkerLifecycle] = None):
+        super().__init__(total, lifecycle)
         self._total = total
         self._status = self.NOT_START
 
-    def submit(self, testcase_handler: Callable[[TestCase], TestCaseResult], test_cases: list[TestCase]) -> None:
+    def submit(self, testcase_handler: Callable[[TestCase], TestCaseResult], test_cases: Iterable[TestCase]) -> None:
         if self._status != self.STARTED:
             raise ValueError("使い方間違ってるよ")
         self._handler = testcase_handler
-        self._testcases = test_cases
+        self._pending: Iterator[TestCase] = iter(test_cases)
         self._status = self.SUBMITTED
     
     def wait_and_get_results(self) -> list[Optional[TestCaseResult]]:
@@ -116,20 +233,27 @@ class SingleTestcaseExecutor(TestcaseExecutor):
         if self._status != self.SUBMITTED:
             raise ValueError("使い方間違ってるよ")
         try:
-            for testcase in self._testcases:
-                results.append(self._handler(testcase))
+            for testcase in self._pending:
+                self.count_submitted(1)
+                results.append(None)
+                result = self._handler(testcase)
+                results[-1] = result
                 self._progress.update()
+                self.notify_result(testcase, result)
         except KeyboardInterrupt:
+            self._interrupted = True
             self.notify_catch_keyboard_interrupt()
-            while len(results) < len(self._testcases):
-                results.append(None)
+            results.extend(None for _ in self._pending)
+        self._status = self.STARTED # 続けて投入できるようにする
         return results
 
     def __enter__(self) -> Self:
         self._status = self.STARTED
         self._progress = tqdm(total=self._total)
+        self._lifecycle.initialize()
         return self
 
     def __exit__(self, exc_type: Optional[type[BaseException]], exc_val: Optional[BaseException],
                  exc_tb: Optional[BaseException]) -> None:
         self._progress.close()
+        self._lifecycle.finalize()
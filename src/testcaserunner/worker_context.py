@@ -0,0 +1,61 @@
+import threading
+import multiprocessing.util
+from multiprocessing.queues import Queue
+from dataclasses import dataclass, field
+from typing import Any, Callable, Optional, TYPE_CHECKING
+
+from .pool_config import pin_current_process
+
+if TYPE_CHECKING:
+    from .testcase_worker import TestcaseWorker
+
+# ワーカーごとのコンテキスト
+# プロセス並列のワーカーもテストケースはメインスレッドで実行するので、スレッドローカルで管理できる
+_local = threading.local()
+
+def get_worker_context() -> Any:
+    """実行中のワーカーのコンテキストを返す
+
+    worker_setupが指定されていない場合はNoneを返す
+    """
+    return getattr(_local, "context", None)
+
+@dataclass
+class WorkerLifecycle:
+    """ワーカーの初期化と終了処理
+
+    ワーカーごとに1回initializeかinitialize_processを呼ぶ
+    """
+    setup: Optional[Callable[[], Any]] = None
+    teardown: Optional[Callable[[Any], None]] = None
+    worker: Optional["TestcaseWorker"] = None # ワーカープロセスに登録するTestcaseWorker
+    _contexts: list[Any] = field(default_factory=list, init=False, repr=False)
+
+    def create_context(self) -> Any:
+        context = self.setup() if self.setup is not None else None
+        _local.context = context
+        return context
+
+    def initialize(self) -> None:
+        """スレッドの初期化. 終了処理はfinalizeで呼ぶ"""
+        self._contexts.append(self.create_context())
+
+    def initialize_process(self, cpu_queue: Optional[Queue] = None) -> None:
+        """ワーカープロセスの初期化. 終了処理はワーカープロセスの終了時に呼ばれる
+
+        cpu_queueを渡した場合は、取り出した論理CPUにワーカーを固定する
+        """
+        if cpu_queue is not None:
+            pin_current_process(cpu_queue)
+        from .testcase_worker import install_worker # 循環importを避ける
+        install_worker(self.worker)
+        context = self.create_context()
+        if self.teardown is not None:
+            multiprocessing.util.Finalize(None, self.teardown, args=(context,), exitpriority=10)
+
+    def finalize(self) -> None:
+        """同じプロセス内で作られたコンテキストの終了処理を呼ぶ"""
+        if self.teardown is not None:
+            for context in self._contexts:
+                self.teardown(context)
+        self._contexts.clear()
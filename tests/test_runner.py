@@ -3,6 +3,15 @@ import sys
 import shutil
 import os
 import logging
+import glob
+import json
+import time
+import pickle
+import hashlib
+import concurrent.futures
+import functools
+import signal
+from pathlib import Path
 
 import pytest
 
@@ -10,12 +19,35 @@ sys.path.append(os.path.join("..", "src"))
 
 from testcaserunner import (
     run,
+    run_command,
     ResultStatus,
     TestCaseResult,
     TestCase,
     InvalidPathException,
     NoTestcaseFileException,
+    BenchmarkConfig,
+    TestcaseWorker,
+    open_output_stream,
+    FileHasher,
+    collect_garbage,
+    read_log_file,
+    merge_shards,
+    DistributedConfig,
+    submit_job,
+    shutdown_daemon,
+    RunnerSession,
+    sweep,
+    run_subprocess_async,
+    ProcessPoolConfig,
+    run_ab,
     )
+from testcaserunner.daemon import JobQueue
+from testcaserunner.cli import make_parser
+from testcaserunner.ab_compare import VariantHandler
+from testcaserunner.blob_store import BlobStore, get_blob_root
+from testcaserunner.testcase_logger import RunnerLogManager
+from testcaserunner.runner import TestCaseRunner
+from testcaserunner.testccase_executor import ThreadTestcaseExecutor, ProcessTestcaseExecutor
 
 def no_error_program(testcase: TestCase):
     cmd = f"python main.py < {testcase.input_file_path}"
@@ -50,6 +82,98 @@ def no_error_program_attribute(testcase: TestCase):
         attrbute["odd"] = int(case)
     return TestCaseResult(attribute=attrbute)
 
+def sleep_program(testcase: TestCase):
+    cmd = "python -c \"import time; time.sleep(10)\""
+    proc = subprocess.run(cmd, shell=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True)
+    return TestCaseResult(stdout=proc.stdout, stderr=proc.stderr)
+
+def python_sleep_program(testcase: TestCase):
+    time.sleep(6)
+    return TestCaseResult()
+
+def grandchild_sleep_program(testcase: TestCase):
+    subprocess.run(["sh", "-c", "sleep 37; echo done"])
+    return TestCaseResult()
+
+def staggered_sleep_program(testcase: TestCase):
+    # 後に投入したケースほど早く終わる
+    time.sleep((10 - testcase.testcase_index) * 0.1)
+    return TestCaseResult(attribute={"index": testcase.testcase_index})
+
+def pid_program(testcase: TestCase):
+    return TestCaseResult(attribute={"pid": os.getpid()})
+
+def find_processes(command: str):
+    """コマンドラインがcommandのプロセスのpidの一覧"""
+    pids = []
+    for entry in os.listdir("/proc"):
+        try:
+            with open(os.path.join("/proc", entry, "cmdline"), mode="rb") as f:
+                cmdline = f.read().replace(b"\0", b" ").decode().strip()
+        except OSError:
+            continue
+        if cmdline == command:
+            pids.append(int(entry))
+    return pids
+
+def worker_setup():
+    return {"count": 0}
+
+def worker_teardown(context):
+    with open(os.path.join("log", f"teardown_{os.getpid()}_{id(context)}"), mode="w") as f:
+        f.write(str(context["count"]))
+
+def program_with_context(testcase: TestCase, context):
+    context["count"] += 1
+    return TestCaseResult(attribute={"count": context["count"]})
+
+def program_with_output(testcase: TestCase):
+    return TestCaseResult(stdout="out\n" * 1000, stderr="err")
+
+def program_with_stream(testcase: TestCase):
+    with open_output_stream(testcase.stdout_file_path) as f:
+        for i in range(1000):
+            f.write(f"{i}\n")
+    return TestCaseResult()
+
+def program_with_params(testcase: TestCase, params):
+    with open(testcase.input_file_path, mode="r") as f:
+        n, m = map(int, f.readline().split())
+    return TestCaseResult(attribute={"score": n * params["a"] + m * params["b"]})
+
+def verify_sum(testcase: TestCase, result: TestCaseResult):
+    answer = int(read_log_file(testcase.stdout_file_path))
+    with open(testcase.input_file_path, mode="r") as f:
+        n, m = map(int, f.readline().split())
+    return TestCaseResult(ResultStatus.AC if answer == n + m else ResultStatus.WA, attribute={"answer": answer})
+
+def verify_product(testcase: TestCase, result: TestCaseResult):
+    answer = int(read_log_file(testcase.stdout_file_path))
+    with open(testcase.input_file_path, mode="r") as f:
+        n, m = map(int, f.readline().split())
+    return TestCaseResult(ResultStatus.AC if answer == n * m else ResultStatus.WA)
+
+async def async_program(testcase: TestCase):
+    return await run_subprocess_async([sys.executable, "main.py"], testcase)
+
+async def async_sleep_program(testcase: TestCase):
+    return await run_subprocess_async([sys.executable, "-c", "import time; time.sleep(10)"], testcase)
+
+async def async_memory_program(testcase: TestCase):
+    return await run_subprocess_async([sys.executable, "-c", "x = bytearray(2 * 1024 ** 3)"], testcase, memory_limit=256)
+
+def cpu_bound_program(testcase: TestCase):
+    end = time.process_time() + 0.2
+    while time.process_time() < end:
+        pass
+    return TestCaseResult()
+
+def load_result_json(index=-1):
+    """作られた順でindex番目のresult.jsonを読み込む"""
+    file = sorted(glob.glob(os.path.join("log", "*", "result.json")))[index]
+    with open(file, mode="r") as f:
+        return json.load(f)
+
 @pytest.fixture
 def setup_normally():
     """logフォルダを消してno_filesフォルダを作る"""
@@ -168,3 +292,779 @@ def test_with_debugmessage_case0(caplog, setup_normally):
     with caplog.at_level(logging.DEBUG):
         run(testcase_handler=no_error_program, input_file_path="in", _debug=True)
     assert len(caplog.records) != 0
+
+# コマンドを直接実行する
+def test_run_command_case0(caplog, setup_normally):
+    with caplog.at_level(logging.WARNING):
+        run_command(cmd_template="python main.py", input_file_path="in")
+    assert len(caplog.records) == 0
+
+def test_run_command_case1(caplog, setup_normally):
+    with caplog.at_level(logging.WARNING):
+        run_command(cmd_template="python main.py {testcase_name}", input_file_path="in",
+                    repeat_count=2, stderr_file_output=False)
+    assert len(caplog.records) == 0
+
+def test_run_command_case2(caplog, setup_normally):
+    # 存在しないコマンドは内部エラーとして警告が出る
+    with caplog.at_level(logging.WARNING):
+        run_command(cmd_template="not_exist_command_xyz", input_file_path="in")
+    assert len(caplog.records) != 0
+
+# 制限時間を超えたケースはTLEになる
+def test_time_limit_case0(setup_normally):
+    start = time.time()
+    run(testcase_handler=sleep_program, input_file_path="in", time_limit=0.5)
+    assert time.time() - start < 60 # 制限がなければ1ケース10秒かかる
+    statuses = load_result_json()["contents"]["status"].values()
+    assert all(status == ResultStatus.TLE for status in statuses)
+
+def test_time_limit_case1(setup_normally):
+    start = time.time()
+    run_command(cmd_template="python -c \"import time; time.sleep(10)\"", input_file_path="in", time_limit=0.5)
+    assert time.time() - start < 60 # 制限がなければ1ケース10秒かかる
+    statuses = load_result_json()["contents"]["status"].values()
+    assert all(status == ResultStatus.TLE for status in statuses)
+
+def test_time_limit_case2(setup_normally):
+    run(testcase_handler=no_error_program, input_file_path="in", time_limit=10)
+    statuses = load_result_json()["contents"]["status"].values()
+    assert all(status == ResultStatus.AC for status in statuses)
+
+def test_time_limit_case3(setup_normally):
+    with pytest.raises(ValueError):
+        run(testcase_handler=no_error_program, input_file_path="in", time_limit=0)
+
+# 子プロセスを使わないハンドラも制限時間で打ち切られ、ワーカーが空く
+def test_time_limit_case4(setup_normally):
+    start = time.time()
+    run(testcase_handler=python_sleep_program, input_file_path="in", time_limit=1, max_workers=2)
+    assert time.time() - start < 20 # 打ち切らなければ2ワーカーで10ケースに30秒以上かかる
+    contents = load_result_json()["contents"]
+    assert all(status == ResultStatus.TLE for status in contents["status"].values())
+    assert all(value < 3 for value in contents["time"].values())
+
+# 制限時間を過ぎたケースの孫プロセスも終了する. 呼び出し元が先に起動した子プロセスは終了させない
+@pytest.mark.skipif(not os.path.isdir("/proc"), reason="/procが必要")
+@pytest.mark.parametrize("method", ["process", "single"])
+def test_time_limit_case5(setup_normally, method):
+    unrelated = subprocess.Popen(["sleep", "30"])
+    try:
+        run(testcase_handler=grandchild_sleep_program, input_file_path="in", time_limit=1,
+            parallel_processing_method=method)
+        assert unrelated.poll() is None
+    finally:
+        unrelated.kill()
+        unrelated.wait()
+    statuses = load_result_json()["contents"]["status"].values()
+    assert all(status == ResultStatus.TLE for status in statuses)
+    assert find_processes("sleep 37") == []
+
+# スレッドは止められないので、スレッド並列ではtime_limitを指定できない
+def test_time_limit_case6(setup_normally):
+    with pytest.raises(ValueError):
+        run(testcase_handler=python_sleep_program, input_file_path="in", time_limit=1, parallel_processing_method="thread")
+    with pytest.raises(ValueError):
+        with RunnerSession("thread") as session:
+            session.run(python_sleep_program, "in", time_limit=1)
+
+# 資源使用量が記録される
+RESOURCE_COLUMNS = ["cpu_user", "cpu_sys", "ctx_voluntary", "ctx_involuntary"]
+
+@pytest.mark.skipif(os.name != "posix", reason="resourceモジュールが必要")
+def test_resource_usage_case0(setup_normally):
+    run_command(cmd_template="python main.py", input_file_path="in")
+    attributes = load_result_json()["metadata"]["attributes"]
+    assert all(column in attributes for column in RESOURCE_COLUMNS + ["max_rss", "time"])
+
+@pytest.mark.skipif(os.name != "posix", reason="resourceモジュールが必要")
+def test_resource_usage_case1(setup_normally):
+    run(testcase_handler=no_error_program, input_file_path="in", parallel_processing_method="single")
+    attributes = load_result_json()["metadata"]["attributes"]
+    assert all(column in attributes for column in RESOURCE_COLUMNS)
+
+def test_resource_usage_case2(setup_normally):
+    run(testcase_handler=no_error_program, input_file_path="in", parallel_processing_method="thread")
+    attributes = load_result_json()["metadata"]["attributes"]
+    assert all(column not in attributes for column in RESOURCE_COLUMNS)
+
+# メモリ制限を超えたケースはMLEになる
+@pytest.mark.skipif(os.name != "posix", reason="resourceモジュールが必要")
+def test_memory_limit_case0(setup_normally):
+    run_command(cmd_template="python -c \"x = bytearray(2 * 1024 ** 3)\"", input_file_path="in", memory_limit=256)
+    statuses = load_result_json()["contents"]["status"].values()
+    assert all(status == ResultStatus.MLE for status in statuses)
+
+def test_memory_limit_case1(setup_normally):
+    run_command(cmd_template="python main.py", input_file_path="in", memory_limit=1024)
+    statuses = load_result_json()["contents"]["status"].values()
+    assert all(status == ResultStatus.AC for status in statuses)
+
+def test_memory_limit_case2(setup_normally):
+    with pytest.raises(ValueError):
+        run(testcase_handler=no_error_program, input_file_path="in", memory_limit=-1)
+
+# スレッド並列ではMLEを判定できないので、memory_limitを指定できない. 'auto'ではプロセス並列を選ぶ
+def test_memory_limit_case3(setup_normally):
+    with pytest.raises(ValueError):
+        run(testcase_handler=no_error_program, input_file_path="in", memory_limit=1024, parallel_processing_method="thread")
+    run(testcase_handler=no_error_program, input_file_path="in", memory_limit=1024, parallel_processing_method="auto")
+    assert load_result_json()["metadata"]["executor"]["method"] == "process"
+
+# 終わった順に結果を受け取り、戻り値はファイル名順に並ぶ
+def test_completion_order_case0(setup_normally):
+    runner = TestCaseRunner(staggered_sleep_program, "in", os.path.join("log", "order_LOG"), 1, [], "thread",
+                            True, True, False, max_workers=10)
+    completed = []
+    runner.add_result_listener(lambda testcase, result: completed.append(testcase.testcase_index))
+    results = runner.start()
+    assert [testcase.testcase_index for testcase, _ in results] == list(range(10))
+    assert [result.attribute["index"] for _, result in results] == list(range(10))
+    assert sorted(completed) == list(range(10))
+    assert completed != list(range(10))
+
+# キャンセルされたら割り込みを受け取る関数が呼ばれ、終わっていないケースの結果はNoneになる
+def test_completion_order_case1(tmp_path):
+    test_cases = [TestCase(f"{i}.in", os.path.join("in", f"{i:04}.txt"), str(tmp_path / f"{i}.out"),
+                           str(tmp_path / f"{i}.err"), i) for i in range(10)]
+    interrupted = []
+    with ThreadTestcaseExecutor(len(test_cases), max_workers=2) as executor:
+        executor.add_result_listener(lambda testcase, result: executor.signal_handler(signal.SIGINT, None))
+        executor.add_interrupt_listener(lambda: interrupted.append(True))
+        executor.submit(staggered_sleep_program, test_cases)
+        results = executor.wait_and_get_results()
+    assert executor.interrupted
+    assert interrupted == [True]
+    assert len(results) == 10
+    assert results[-1] is None
+    assert any(result is not None for result in results)
+
+# 実行時間の長いテストケースから投入する
+def test_scheduling_method_case0(caplog, setup_normally):
+    with caplog.at_level(logging.WARNING):
+        # 1回目は履歴がないのでファイルサイズ順、2回目は1回目のtimeを使う
+        run(testcase_handler=no_error_program, input_file_path="in", scheduling_method="lpt")
+        time.sleep(1)
+        run_command(cmd_template="python main.py", input_file_path="in", scheduling_method="LPT", repeat_count=2)
+    assert len(caplog.records) == 0
+    testcases = list(load_result_json()["contents"]["testcase"].values())
+    assert testcases == sorted(testcases)
+
+def test_scheduling_method_case1(setup_normally):
+    with pytest.raises(ValueError):
+        run(testcase_handler=no_error_program, input_file_path="in", scheduling_method="test")
+
+# 前回の結果を再利用する
+def test_use_cache_case0(caplog, setup_normally):
+    with caplog.at_level(logging.WARNING):
+        run(testcase_handler=no_error_program, input_file_path="in", use_cache=True, solver_fingerprint="v1")
+        time.sleep(1)
+        run(testcase_handler=no_error_program, input_file_path="in", use_cache=True, solver_fingerprint="v1")
+    assert len(caplog.records) == 0
+    first, second = load_result_json(0)["contents"], load_result_json(1)["contents"]
+    assert first["time"] == second["time"]
+    assert first["stdout_hash"] == second["stdout_hash"]
+
+def test_use_cache_case1(setup_normally):
+    run_command(cmd_template="python main.py", input_file_path="in", use_cache=True, solver_fingerprint="v1")
+    time.sleep(1)
+    run_command(cmd_template="python main.py", input_file_path="in", use_cache=True, solver_fingerprint="v2")
+    first, second = load_result_json(0)["contents"], load_result_json(1)["contents"]
+    assert first["time"] != second["time"]
+
+def test_use_cache_case2(caplog, setup_normally):
+    # フィンガープリントもコピーするファイルもない場合は警告が出る
+    with caplog.at_level(logging.WARNING):
+        run(testcase_handler=no_error_program, input_file_path="in", use_cache=True)
+    assert len(caplog.records) == 1
+
+# functools.partialのハンドラは、元の関数と引数が同じならキャッシュを再利用する
+def test_use_cache_case3(setup_normally):
+    for _ in range(2):
+        run(testcase_handler=functools.partial(program_with_params, params={"a": 1, "b": 2}), input_file_path="in",
+            use_cache=True, copy_target_files=["main.py"])
+        time.sleep(1)
+    first, second = load_result_json(0)["contents"], load_result_json(1)["contents"]
+    assert first["time"] == second["time"]
+
+# 同じ名前になるlambdaでも、中身が違えばキャッシュを再利用しない
+def test_use_cache_case4(setup_normally):
+    handlers = [lambda testcase: TestCaseResult(attribute={"value": 1}),
+                lambda testcase: TestCaseResult(attribute={"value": 2})]
+    for handler in handlers:
+        run(testcase_handler=handler, input_file_path="in", use_cache=True, copy_target_files=["main.py"],
+            parallel_processing_method="single")
+        time.sleep(1)
+    first, second = load_result_json(0)["contents"], load_result_json(1)["contents"]
+    assert set(first["value"].values()) == {1}
+    assert set(second["value"].values()) == {2}
+
+# キャッシュのキーの入力ファイルのハッシュ値もhash_algorithmで計算する
+def test_use_cache_case5(setup_normally):
+    for _ in range(2):
+        run(testcase_handler=no_error_program, input_file_path="in", use_cache=True, solver_fingerprint="v1",
+            hash_algorithm="blake2b")
+        time.sleep(1)
+    first, second = load_result_json(0)["contents"], load_result_json(1)["contents"]
+    assert first["time"] == second["time"]
+
+# 計測値が収束するまで繰り返し実行する
+def test_benchmark_case0(caplog, setup_normally):
+    config = BenchmarkConfig(min_runs=2, max_runs=3, warmup_count=1, attributes=["time", "score"])
+    with caplog.at_level(logging.WARNING):
+        run_command(cmd_template="python main.py", input_file_path="in", benchmark=config)
+    assert len(caplog.records) == 0
+    log = load_result_json()
+    assert len(log["contents"]["testcase"]) == 10
+    for column in ["runs", "time_mean", "time_median", "time_stddev", "time_ci"]:
+        assert column in log["metadata"]["attributes"]
+    assert all(2 <= runs <= 3 for runs in log["contents"]["runs"].values())
+
+def test_benchmark_case1(setup_normally):
+    config = BenchmarkConfig(min_runs=2, max_runs=5, attributes=["score"])
+    run(testcase_handler=no_error_program, input_file_path="in", benchmark=config, parallel_processing_method="thread")
+    log = load_result_json()
+    # scoreは毎回同じなので最小回数で収束する
+    assert all(runs == 2 for runs in log["contents"]["runs"].values())
+    assert "score_mean" in log["metadata"]["attributes"]
+
+def test_benchmark_case2(setup_normally):
+    with pytest.raises(ValueError):
+        run(testcase_handler=no_error_program, input_file_path="in", benchmark=BenchmarkConfig(), repeat_count=2)
+    with pytest.raises(ValueError):
+        run(testcase_handler=no_error_program, input_file_path="in", benchmark=BenchmarkConfig(min_runs=1))
+
+# ワーカーごとの初期化と終了処理
+def test_worker_setup_case0(caplog, setup_normally):
+    with caplog.at_level(logging.WARNING):
+        run(testcase_handler=program_with_context, input_file_path="in", parallel_processing_method="single",
+            worker_setup=worker_setup, worker_teardown=worker_teardown)
+    assert len(caplog.records) == 0
+    # 1つのコンテキストを使いまわす
+    counts = load_result_json()["contents"]["count"].values()
+    assert sorted(counts) == list(range(1, 11))
+    assert len(glob.glob(os.path.join("log", "teardown_*"))) == 1
+
+@pytest.mark.parametrize("method", ["process", "thread"])
+def test_worker_setup_case1(caplog, setup_normally, method):
+    with caplog.at_level(logging.WARNING):
+        run(testcase_handler=program_with_context, input_file_path="in", parallel_processing_method=method,
+            worker_setup=worker_setup, worker_teardown=worker_teardown)
+    assert len(caplog.records) == 0
+    # 終了処理はワーカーの数だけ呼ばれ、その回数の合計はテストケースの数になる
+    total = 0
+    for file in glob.glob(os.path.join("log", "teardown_*")):
+        with open(file, mode="r") as f:
+            total += int(f.read())
+    assert total == 10
+
+# プロセス並列で投入のたびに送られるのは関数名とTestCaseだけ
+def test_task_payload_case0(setup_normally, monkeypatch):
+    payloads = []
+    get_executor = ProcessTestcaseExecutor.get_executor
+    def get_recording_executor(self):
+        executor = get_executor(self)
+        submit = executor.submit
+        def recording_submit(fn, *args, **kwargs):
+            payloads.append(pickle.dumps((fn, args, kwargs)))
+            return submit(fn, *args, **kwargs)
+        executor.submit = recording_submit
+        return executor
+    monkeypatch.setattr(ProcessTestcaseExecutor, "get_executor", get_recording_executor)
+    run(testcase_handler=no_error_program, input_file_path="in", parallel_processing_method="process")
+    assert len(payloads) == 10
+    assert all(b"run_installed_testcase" in payload for payload in payloads)
+    assert all(b"no_error_program" not in payload for payload in payloads)
+    assert all(len(payload) < 1024 for payload in payloads)
+
+# 出力はワーカー内でファイルに書き込まれ、ハッシュ値とサイズだけが返る
+@pytest.mark.parametrize("keep_output", [False, True])
+def test_output_stream_case0(tmp_path, keep_output):
+    testcase = TestCase("01.in", os.path.join("in", "01.in"),
+                        str(tmp_path / "01.out"), str(tmp_path / "01.err"), 0)
+    worker = TestcaseWorker(program_with_output, True, True, True, keep_output=keep_output)
+    result = worker.run_testcase(testcase)
+    assert (result.stdout != "") == keep_output
+    with open(testcase.stdout_file_path, mode="rb") as f:
+        content = f.read()
+    assert result.stdout_info.size == len(content)
+    assert result.stdout_info.digest == hashlib.sha256(content).hexdigest()
+    assert result.stderr_info.size == 3
+
+# ハンドラが直接書き込んだ出力のハッシュ値が結果ファイルに載る
+def test_output_stream_case1(caplog, setup_normally):
+    with caplog.at_level(logging.WARNING):
+        run(testcase_handler=program_with_stream, input_file_path="in", stdout_file_output=False)
+    assert len(caplog.records) == 0
+    expected = hashlib.sha256("".join(f"{i}\n" for i in range(1000)).encode()).hexdigest()
+    hashes = load_result_json()["contents"]["stdout_hash"].values()
+    assert all(h.startswith(f"{expected}.stdout.") for h in hashes)
+
+# ハッシュ関数を指定できる
+def test_hash_algorithm_case0(caplog, setup_normally):
+    with caplog.at_level(logging.WARNING):
+        run(testcase_handler=program_with_output, input_file_path="in", hash_algorithm="blake2b")
+    assert len(caplog.records) == 0
+    data = load_result_json()
+    assert data["metadata"]["hash_algorithm"] == "blake2b"
+    expected = hashlib.blake2b(("out\n" * 1000).encode(), digest_size=32).hexdigest()
+    assert all(h.startswith(f"{expected}.stdout.") for h in data["contents"]["stdout_hash"].values())
+    with open(os.path.join("in", "0000.txt"), mode="rb") as f:
+        input_hash = hashlib.blake2b(f.read(), digest_size=32).hexdigest()
+    assert f"{input_hash}.in.0" in data["contents"]["input_hash"].values()
+
+def test_hash_algorithm_case1(setup_normally):
+    with pytest.raises(ValueError):
+        run(testcase_handler=no_error_program, input_file_path="in", hash_algorithm="md5")
+
+# 大きいファイルも同じハッシュ値になり、同じファイルは一度だけ計算する
+def test_file_hasher_case0(tmp_path):
+    large = tmp_path / "large"
+    large.write_bytes(os.urandom(3 << 20))
+    small = tmp_path / "small"
+    small.write_bytes(b"abc")
+    hasher = FileHasher("sha256")
+    hashes = hasher.hash_files([str(large), str(small), str(large), str(tmp_path / "missing")])
+    assert hashes[str(large)] == hashlib.sha256(large.read_bytes()).hexdigest()
+    assert hashes[str(small)] == hashlib.sha256(b"abc").hexdigest()
+    assert hashes[str(tmp_path / "missing")] == ""
+    assert len(hasher._memo) == 2
+
+# 以前の公開メソッドは非推奨の警告を出して、FileHasherと同じハッシュ値を返す
+def test_file_hasher_case1(tmp_path):
+    file = tmp_path / "file"
+    file.write_bytes(b"abc")
+    manager = RunnerLogManager([], str(tmp_path), False, "blake2b")
+    with pytest.warns(DeprecationWarning):
+        digest = manager.calculate_file_hash(str(file))
+    assert digest == hashlib.blake2b(b"abc", digest_size=32).hexdigest()
+
+# 入力ファイルと出力ファイルはblobへのハードリンクになり、参照されなくなったblobはgcで消える
+@pytest.mark.skipif(os.name != "posix", reason="ハードリンクのリンク数を確認するため")
+def test_dedup_storage_case0(caplog, setup_normally):
+    with caplog.at_level(logging.WARNING):
+        run(testcase_handler=program_with_output, input_file_path="in", dedup_storage=True)
+        time.sleep(1) # ログフォルダ名が重複しないようにする
+        run(testcase_handler=program_with_output, input_file_path="in", dedup_storage=True)
+    assert len(caplog.records) == 0
+    first, second = sorted(glob.glob(os.path.join("log", "*_LOG")))
+    for name in ("in/0000.txt", "stdout/0000.txt"):
+        assert os.path.samefile(os.path.join(first, name), os.path.join(second, name))
+    # 出力はどのケースも同じなので、1つのblobを共有する
+    stdouts = glob.glob(os.path.join(second, "stdout", "*"))
+    assert len({os.stat(file).st_ino for file in stdouts}) == 1
+    assert collect_garbage("log") == (0, 0)
+    removed, freed = collect_garbage("log", keep_runs=0)
+    assert removed > 0 and freed > 0
+    assert glob.glob(os.path.join("log", ".blobs", "*", "*", "*")) == []
+
+# ランナーがblobを作っている間は、gcはロックが外れるまで待つ
+@pytest.mark.skipif(os.name != "posix", reason="fcntlモジュールが必要")
+def test_dedup_storage_case1(setup_normally):
+    store = BlobStore(get_blob_root("log"))
+    blob = store.blob_path("0" * 64)
+    os.makedirs(os.path.dirname(blob))
+    with concurrent.futures.ThreadPoolExecutor(max_workers=1) as executor:
+        with store.lock():
+            with open(blob, mode="w") as f:
+                f.write("x") # ハードリンクを張る前なのでリンク数は1
+            future = executor.submit(collect_garbage, "log")
+            time.sleep(0.5)
+            assert not future.done() and os.path.exists(blob)
+            os.link(blob, os.path.join("log", "linked"))
+        assert future.result() == (0, 0)
+    os.remove(os.path.join("log", "linked"))
+    assert collect_garbage("log") == (1, 1)
+
+# 出力ファイルを圧縮して保存し、ハッシュ値は展開した内容から計算する
+def test_log_compression_case0(caplog, setup_normally):
+    with caplog.at_level(logging.WARNING):
+        run(testcase_handler=program_with_output, input_file_path="in", log_compression="gzip")
+    assert len(caplog.records) == 0
+    data = load_result_json()
+    assert data["metadata"]["log_compression"] == "gzip"
+    log_folder = sorted(glob.glob(os.path.join("log", "*_LOG")))[-1]
+    expected = hashlib.sha256(("out\n" * 1000).encode()).hexdigest()
+    for row, stdout in data["contents"]["stdout"].items():
+        assert stdout.endswith(".gz")
+        assert read_log_file(os.path.join(log_folder, stdout)) == ("out\n" * 1000).encode()
+        assert data["contents"]["stdout_hash"][row].startswith(f"{expected}.stdout.")
+    assert glob.glob(os.path.join(log_folder, "stdout", "*.txt")) == []
+
+# コマンドが直接書き込んだ出力もワーカーで圧縮する
+def test_log_compression_case1(caplog, setup_normally):
+    with caplog.at_level(logging.WARNING):
+        run_command("python main.py", input_file_path="in", log_compression="lzma")
+    assert len(caplog.records) == 0
+    log_folder = sorted(glob.glob(os.path.join("log", "*_LOG")))[-1]
+    assert glob.glob(os.path.join(log_folder, "stdout", "*.txt")) == []
+    assert len(glob.glob(os.path.join(log_folder, "stdout", "*.xz"))) == 10
+
+def test_log_compression_case2(setup_normally):
+    with pytest.raises(ValueError):
+        run(testcase_handler=no_error_program, input_file_path="in", log_compression="bz2")
+
+# サブディレクトリの入力ファイルも探し、パターンで絞り込める
+def test_discovery_case0(caplog, setup_normally, tmp_path):
+    for name in ("a/1.txt", "a/2.txt", "b/1.txt", "b/skip.log", "c/1.txt", "top.txt"):
+        path = tmp_path / name
+        path.parent.mkdir(exist_ok=True)
+        path.write_text("1 2")
+    with caplog.at_level(logging.WARNING):
+        run(testcase_handler=program_with_output, input_file_path=str(tmp_path), recursive=True,
+            include_patterns=["*.txt"], exclude_patterns=["c"], parallel_processing_method="thread")
+    assert len(caplog.records) == 0
+    data = load_result_json()
+    assert list(data["contents"]["stdout"].values()) == [
+        os.path.join("stdout", "a", "1.txt"),
+        os.path.join("stdout", "a", "2.txt"),
+        os.path.join("stdout", "b", "1.txt"),
+        os.path.join("stdout", "top.txt"),
+    ]
+    # 別のフォルダの同じ名前のファイルを区別できるように、入力フォルダからの相対パスを表示する
+    assert list(data["contents"]["testcase"].values()) == ["a/1.txt", "a/2.txt", "b/1.txt", "top.txt"]
+    # 対象から外したファイルはログフォルダにコピーしない
+    log_folder = sorted(glob.glob(os.path.join("log", "*_LOG")))[-1]
+    copied = sorted(Path(path).relative_to(os.path.join(log_folder, "in")).as_posix()
+                    for path in glob.glob(os.path.join(log_folder, "in", "**", "*"), recursive=True) if os.path.isfile(path))
+    assert copied == ["a/1.txt", "a/2.txt", "b/1.txt", "top.txt"]
+
+def test_discovery_case1(setup_normally):
+    with pytest.raises(NoTestcaseFileException):
+        run(testcase_handler=no_error_program, input_file_path="in", include_patterns=["*.none"])
+
+# 同時に投入する数より多いテストケースも、投入した順に結果がそろう
+def test_submission_window_case0(caplog, setup_normally):
+    with caplog.at_level(logging.WARNING):
+        run(testcase_handler=no_error_program, input_file_path="in", repeat_count=10, parallel_processing_method="thread")
+    assert len(caplog.records) == 0
+    data = load_result_json()
+    stdouts = list(data["contents"]["stdout"].values())
+    assert len(stdouts) == 100
+    assert stdouts[:2] == [os.path.join("stdout", "0000_1.txt"), os.path.join("stdout", "0000_2.txt")]
+
+# シャードごとに実行した結果を結合すると、1回で実行した結果と同じになる
+@pytest.mark.parametrize("method", ["hash", "cost"])
+def test_sharding_case0(caplog, setup_normally, method):
+    with caplog.at_level(logging.WARNING):
+        run(testcase_handler=no_error_program, input_file_path="in", parallel_processing_method="thread")
+        for index in range(3):
+            time.sleep(1) # ログフォルダ名が重複しないようにする
+            run(testcase_handler=no_error_program, input_file_path="in", parallel_processing_method="thread",
+                shard_index=index, shard_count=3, sharding_method=method)
+        full, *shards = sorted(glob.glob(os.path.join("log", "*_LOG")))
+        merged = merge_shards(shards, os.path.join("log", "merged"))
+    assert len(caplog.records) == 0
+    names = [set(load_result_json(i)["contents"]["testcase"].values()) for i in range(1, 4)]
+    assert sum(len(name) for name in names) == 10 and len(set.union(*names)) == 10
+    # シャードごとのログフォルダには、そのシャードの入力ファイルだけをコピーする
+    for shard, name in zip(shards, names):
+        assert set(os.listdir(os.path.join(shard, "in"))) == name
+    with open(os.path.join(full, "result.json"), mode="r") as f:
+        expected = json.load(f)
+    with open(os.path.join(merged, "result.json"), mode="r") as f:
+        data = json.load(f)
+    for column in ("testcase", "input_hash", "stdout_hash", "in", "stdout", "score"):
+        assert data["contents"][column] == expected["contents"][column]
+    assert data["metadata"]["merged_shards"] == [os.path.basename(shard) for shard in shards]
+    assert os.path.exists(os.path.join(merged, "result.html"))
+    for stdout in data["contents"]["stdout"].values():
+        assert os.path.isfile(os.path.join(merged, stdout))
+
+def test_sharding_case1(setup_normally):
+    with pytest.raises(ValueError):
+        run(testcase_handler=no_error_program, input_file_path="in", shard_index=2, shard_count=2)
+
+# ローカルで起動したエージェントにテストケースを配り、出力ファイルを受け取る
+def test_distributed_case0(caplog, setup_normally):
+    with caplog.at_level(logging.WARNING):
+        run(testcase_handler=no_error_program, input_file_path="in", parallel_processing_method="distributed",
+            distributed=DistributedConfig(local_workers=3), log_compression="gzip")
+    assert len(caplog.records) == 0
+    data = load_result_json()
+    log_folder = sorted(glob.glob(os.path.join("log", "*_LOG")))[-1]
+    assert list(data["contents"]["status"].values()) == [ResultStatus.AC] * 10
+    for row, stdout in data["contents"]["stdout"].items():
+        expected = hashlib.sha256(read_log_file(os.path.join(log_folder, stdout))).hexdigest()
+        assert data["contents"]["stdout_hash"][row].startswith(f"{expected}.stdout.")
+
+# Unixドメインソケットで、別に起動したエージェントが接続する
+@pytest.mark.skipif(os.name != "posix", reason="Unixドメインソケットを使うため")
+def test_distributed_case1(caplog, setup_normally, tmp_path):
+    address = f"unix:{tmp_path / 'runner.sock'}"
+    env = dict(os.environ, TESTCASERUNNER_AUTHKEY="secret", PYTHONPATH=os.path.join("..", "src"))
+    def start_agents():
+        # コーディネーターが待ち受けるまで待つ
+        while not (tmp_path / "runner.sock").exists():
+            time.sleep(0.1)
+        return subprocess.Popen([sys.executable, "-m", "testcaserunner", "agent", address, "--jobs", "2"], env=env)
+    with caplog.at_level(logging.WARNING):
+        with concurrent.futures.ThreadPoolExecutor() as pool:
+            agent = pool.submit(start_agents)
+            run(testcase_handler=program_with_context, input_file_path="in", parallel_processing_method="distributed",
+                worker_setup=worker_setup, distributed=DistributedConfig(address=address, authkey="secret"))
+        assert agent.result().wait(timeout=30) == 0
+    assert len(caplog.records) == 0
+    data = load_result_json()
+    assert sum(1 for count in data["contents"]["count"].values() if count == 1) == 2
+
+def test_distributed_case2(setup_normally):
+    with pytest.raises(ValueError):
+        run(testcase_handler=no_error_program, input_file_path="in", parallel_processing_method="distributed")
+
+# 常駐プロセスにジョブを投入すると、同じプロセスプールを使い回してログフォルダを作る
+@pytest.mark.skipif(os.name != "posix", reason="Unixドメインソケットを使うため")
+def test_daemon_case0(caplog, setup_normally, tmp_path):
+    socket_path = str(tmp_path / "daemon.sock")
+    env = dict(os.environ, PYTHONPATH=os.path.join("..", "src"))
+    daemon = subprocess.Popen([sys.executable, "-m", "testcaserunner", "serve", "--socket", socket_path], env=env)
+    try:
+        while not os.path.exists(socket_path):
+            time.sleep(0.1)
+        with caplog.at_level(logging.WARNING):
+            first = submit_job("in", handler="test_runner:no_error_program", socket_path=socket_path, repeat_count=2)
+            second = submit_job("in", command="python main.py", socket_path=socket_path)
+        assert len(caplog.records) == 0
+        assert first != second
+        with open(os.path.join(first, "result.json"), mode="r") as f:
+            assert len(json.load(f)["contents"]["status"]) == 20
+        assert os.path.exists(os.path.join(second, "result.html"))
+        with pytest.raises(ValueError):
+            submit_job("in", handler="test_runner:no_error_program", socket_path=socket_path, repeat_count=0)
+    finally:
+        shutdown_daemon(socket_path)
+        assert daemon.wait(timeout=30) == 0
+
+# ジョブはクライアントごとに順番に取り出す
+def test_daemon_case1():
+    queue = JobQueue()
+    for client, job in (("a", 1), ("a", 2), ("a", 3), ("b", 4)):
+        queue.put(client, job)
+    assert [queue.get() for _ in range(4)] == [1, 4, 2, 3]
+
+# submitの--commandはサブコマンドの名前で上書きされない
+def test_daemon_case2():
+    args = make_parser().parse_args(["submit", "in", "--command", "python main.py"])
+    assert args.subcommand == "submit" and args.command == "python main.py"
+    args = make_parser().parse_args(["submit", "in", "--handler", "main:solve"])
+    assert args.command is None and args.handler == "main:solve"
+
+# セッション内の実行はプールとワーカーのコンテキストを使い回し、ログフォルダは別々に作る
+@pytest.mark.parametrize("method", ["process", "thread"])
+def test_session_case0(caplog, setup_normally, method):
+    with caplog.at_level(logging.WARNING):
+        with RunnerSession(method, max_workers=1, worker_setup=worker_setup, worker_teardown=worker_teardown) as session:
+            first = session.run(program_with_context, "in")
+            second = session.run(program_with_context, "in", repeat_count=2)
+    assert len(caplog.records) == 0
+    assert first != second
+    assert sorted(glob.glob(os.path.join("log", "*_LOG"))) == [first, second]
+    data = load_result_json()
+    assert list(data["contents"]["count"].values()) == list(range(11, 31))
+    teardowns = glob.glob(os.path.join("log", "teardown_*"))
+    assert len(teardowns) == 1
+    with open(teardowns[0], mode="r") as f:
+        assert f.read() == "30"
+
+def test_session_case1(setup_normally):
+    with pytest.raises(ValueError):
+        with RunnerSession() as session:
+            session.run(no_error_program, "in", parallel_processing_method="thread")
+
+@pytest.mark.parametrize("method", ["process", "thread"])
+def test_sweep_case0(caplog, setup_normally, method):
+    with caplog.at_level(logging.WARNING):
+        sweep_dir = sweep(program_with_params, "in", {"a": [1, 2, 3], "b": [0, 1, 2]},
+                          parallel_processing_method=method, max_workers=2)
+    assert len(caplog.records) == 0
+    with open(os.path.join(sweep_dir, "leaderboard.json"), mode="r") as f:
+        data = json.load(f)
+    assert data["metadata"]["budgets"] == [1, 3, 10]
+    leaderboard = data["leaderboard"]
+    assert len(leaderboard) == 9
+    assert leaderboard[0]["params"] == {"a": 3, "b": 2}
+    assert [row["rung"] for row in leaderboard] == [2] + [1] * 2 + [0] * 6
+    assert [row["inputs"] for row in leaderboard] == [10] + [3] * 2 + [1] * 6
+    assert os.path.isfile(os.path.join(sweep_dir, "leaderboard.html"))
+    # 段ごとのログフォルダはパラメータの組ごとに1つにまとめられる
+    assert glob.glob(os.path.join("log", "*_LOG")) == []
+    with open(os.path.join(sweep_dir, leaderboard[0]["log"], "result.json"), mode="r") as f:
+        assert len(json.load(f)["contents"]["score"]) == 10
+
+def test_sweep_case1(setup_normally):
+    with pytest.raises(ValueError):
+        sweep(program_with_params, "in", {"a": [1], "b": [1]}, reduction_factor=1)
+    with pytest.raises(ValueError):
+        sweep(program_with_params, "in", [])
+    # 段の実行で例外が出ても、入力ファイルを置いたフォルダは消す
+    with pytest.raises(ValueError):
+        sweep(program_with_params, "in", {"a": [1], "b": [1]}, hash_algorithm="invalid")
+    assert glob.glob(os.path.join("log", "*", ".inputs")) == []
+
+def test_async_case0(caplog, setup_normally):
+    with caplog.at_level(logging.WARNING):
+        run(async_program, "in", parallel_processing_method="async", async_concurrency=4)
+    assert len(caplog.records) == 0
+    data = load_result_json()
+    assert all(status == ResultStatus.AC for status in data["contents"]["status"].values())
+    with open(os.path.join("in", "0000.txt"), mode="r") as f:
+        n, m = map(int, f.readline().split())
+    log_folder = sorted(glob.glob(os.path.join("log", "*_LOG")))[-1]
+    with open(os.path.join(log_folder, "stdout", "0000.txt"), mode="r") as f:
+        assert f.read().strip() == str(n + m)
+
+def test_async_case1(setup_normally):
+    # 制限時間を過ぎたハンドラはキャンセルされ、子プロセスも終了する
+    start = time.time()
+    run(async_sleep_program, "in", parallel_processing_method="async", time_limit=0.5)
+    assert time.time() - start < 30 # 制限がなければ10秒以上かかる
+    statuses = load_result_json()["contents"]["status"].values()
+    assert all(status == ResultStatus.TLE for status in statuses)
+    with pytest.raises(ValueError):
+        run(async_program, "in", parallel_processing_method="async", async_concurrency=0)
+
+# 出力の書き込みと圧縮はイベントループの外で行うが、設定は同じものが使われる
+def test_async_case2(caplog, setup_normally):
+    with caplog.at_level(logging.WARNING):
+        run(async_program, "in", parallel_processing_method="async", log_compression="gzip", hash_algorithm="blake2b")
+    assert len(caplog.records) == 0
+    data = load_result_json()
+    log_folder = sorted(glob.glob(os.path.join("log", "*_LOG")))[-1]
+    with open(os.path.join("in", "0000.txt"), mode="r") as f:
+        n, m = map(int, f.readline().split())
+    stdout = data["contents"]["stdout"]["0"]
+    assert stdout.endswith(".gz")
+    content = read_log_file(os.path.join(log_folder, stdout))
+    assert content.strip() == str(n + m).encode()
+    expected = hashlib.blake2b(content, digest_size=32).hexdigest()
+    assert data["contents"]["stdout_hash"]["0"].startswith(f"{expected}.stdout.")
+
+# run_subprocess_asyncでメモリ制限を超えたケースはMLEになる
+@pytest.mark.skipif(os.name != "posix", reason="resourceモジュールが必要")
+def test_async_case3(setup_normally):
+    run(async_memory_program, "in", parallel_processing_method="async", memory_limit=256)
+    statuses = load_result_json()["contents"]["status"].values()
+    assert all(status == ResultStatus.MLE for status in statuses)
+
+# 'auto'では計測した結果から実行方法を選び、メタデータに記録する
+def test_auto_case0(caplog, setup_normally):
+    with caplog.at_level(logging.WARNING):
+        run(no_error_program, "in", parallel_processing_method="auto")
+    assert len(caplog.records) == 0
+    data = load_result_json()
+    assert len(data["contents"]["status"]) == 10
+    assert all(status == ResultStatus.AC for status in data["contents"]["status"].values())
+    # 子プロセスを待つだけなのでスレッドを選ぶ
+    executor = data["metadata"]["executor"]
+    assert executor["method"] == "thread"
+    assert executor["max_workers"] >= (os.cpu_count() or 1)
+    assert 1 <= executor["calibration"]["cases"] <= 4
+
+def test_auto_case1(setup_normally):
+    run(cpu_bound_program, "in", parallel_processing_method="auto")
+    data = load_result_json()
+    assert len(data["contents"]["status"]) == 10
+    executor = data["metadata"]["executor"]
+    assert executor["method"] == ("process" if (os.cpu_count() or 1) > 1 else "single")
+    assert executor["calibration"]["cpu_ratio"] >= 0.5
+
+# 'auto'の計測は呼び出し元ではなくワーカープロセスで行う
+def test_auto_case2(setup_normally):
+    run(pid_program, "in", parallel_processing_method="auto")
+    data = load_result_json()
+    pids = list(data["contents"]["pid"].values())
+    calibration_cases = data["metadata"]["executor"]["calibration"]["cases"]
+    assert os.getpid() not in pids[:calibration_cases]
+
+@pytest.mark.parametrize("start_method", ["spawn", "forkserver"])
+def test_process_pool_case0(setup_normally, start_method):
+    config = ProcessPoolConfig(start_method=start_method, pin_workers=True)
+    run(no_error_program, "in", max_workers=1, process_pool=config)
+    data = load_result_json()
+    assert list(data["contents"]["status"].values()) == [ResultStatus.AC] * 10
+    executor = data["metadata"]["executor"]
+    assert executor["method"] == "process"
+    assert executor["max_workers"] == 1
+    assert executor["start_method"] == start_method
+    assert len(executor["cpu_affinity"]) == 1
+
+def test_process_pool_case1(setup_normally):
+    with pytest.raises(ValueError):
+        run(no_error_program, "in", max_workers=0)
+    with pytest.raises(ValueError):
+        run(no_error_program, "in", parallel_processing_method="thread", process_pool=ProcessPoolConfig())
+    with pytest.raises(ValueError):
+        run(no_error_program, "in", parallel_processing_method="auto", max_workers=2)
+    with pytest.raises(ValueError):
+        run(no_error_program, "in", process_pool=ProcessPoolConfig(start_method="unknown"))
+    with pytest.raises(ValueError):
+        run(no_error_program, "in", process_pool=ProcessPoolConfig(pin_workers=True), max_workers=(os.cpu_count() or 1) + 1)
+    run(no_error_program, "in", parallel_processing_method="thread", max_workers=2)
+    executor = load_result_json()["metadata"]["executor"]
+    assert executor == {"method": "thread", "max_workers": 2}
+
+def test_ab_case0(caplog, setup_normally):
+    handlers = {
+        "A": functools.partial(program_with_params, params={"a": 1, "b": 0}),
+        "B": functools.partial(program_with_params, params={"a": 0, "b": 1}),
+    }
+    with caplog.at_level(logging.WARNING):
+        ab_dir = run_ab(handlers, "in", parallel_processing_method="thread")
+    assert len(caplog.records) == 0
+    # 結合した実行のログフォルダは残らない
+    assert glob.glob(os.path.join("log", "*_LOG")) == []
+    assert os.path.isfile(os.path.join(ab_dir, "result.html"))
+    scores = {}
+    for variant in handlers:
+        with open(os.path.join(ab_dir, variant, "result.json"), mode="r") as f:
+            data = json.load(f)
+        assert data["metadata"]["variant"] == variant
+        contents = data["contents"]
+        assert len(contents["status"]) == 10
+        for row, path in contents["stdout"].items():
+            assert os.path.isfile(os.path.join(ab_dir, variant, path))
+            assert contents["in"][row] == os.path.join("in", os.path.basename(path))
+        scores[variant] = {contents["testcase"][row]: score for row, score in contents["score"].items()}
+    for name in os.listdir("in"):
+        with open(os.path.join("in", name), mode="r") as f:
+            n, m = map(int, f.readline().split())
+        assert (scores["A"][name], scores["B"][name]) == (n, m)
+
+def test_ab_case1(setup_normally):
+    with pytest.raises(ValueError):
+        run_ab({"A": no_error_program}, "in")
+    with pytest.raises(ValueError):
+        run_ab({"A": no_error_program, "../B": no_error_program}, "in")
+    with pytest.raises(ValueError):
+        run_ab({"A": no_error_program, "B": no_error_program}, "in", scheduling_method="lpt")
+
+# reprできない引数を持つハンドラでも、VariantHandlerのreprは例外にならない
+def test_ab_case2():
+    class Unreprable:
+        def __repr__(self):
+            raise RuntimeError("repr")
+    handler = VariantHandler({"A": functools.partial(program_with_params, params=Unreprable()), "B": no_error_program})
+    assert repr(handler).startswith("VariantHandler(A=partial@")
+
+def test_pipeline_case0(setup_normally):
+    run(no_error_program, "in", verifier=verify_sum, verifier_workers=2, log_compression="gzip")
+    contents = load_result_json()["contents"]
+    assert list(contents["status"].values()) == [ResultStatus.AC] * 10
+    # ソルバーと検証の値が1つの結果にまとめられる
+    assert contents["answer"] == contents["score"]
+    assert all(value is not None for value in contents["time"].values())
+    assert all(value is not None for value in contents["verify_time"].values())
+
+def test_pipeline_case1(setup_normally):
+    run(no_error_program, "in", parallel_processing_method="thread", verifier=verify_product)
+    contents = load_result_json()["contents"]
+    for row, status in contents["status"].items():
+        n, m = contents["n"][row], contents["m"][row]
+        assert status == (ResultStatus.AC if n + m == n * m else ResultStatus.WA)
+    # ソルバーの結果がACでないテストケースは検証しない
+    run(error_program, "in", verifier=verify_sum)
+    contents = load_result_json()["contents"]
+    assert list(contents["status"].values()) == [ResultStatus.IE] * 10
+    assert "verify_time" not in contents
+    with pytest.raises(ValueError):
+        run(no_error_program, "in", verifier=verify_sum, verifier_workers=0)